@@ -1,9 +1,23 @@
 from ConstDef import g_ACD
+from Metrics import stage
+from Common import InitLogging
+import IndicatorStore
+from ScanSnapshot import ScanSnapshot
+import numpy as np
 import pandas as pd
 import sqlite3
 import sys
+import time
+import logging
 
-def check_ema_signals_by_database(conn, symbol,indexname: str,limit: int = 300):
+logger = logging.getLogger(__name__)
+
+def check_ema_signals_by_database(conn, symbol,indexname: str,limit: int = 300, use_store: bool = False, snapshot=None):
+    """
+    snapshot: ScanSnapshot / CycleSnapshot，里面有足够K线且已是最新的表直接从快照取，不再读库
+    use_store: 用 kline_indicators 里物化的 EMA。物化的 EMA 从整张表第一根开始累积，
+               和默认的"只取最近 limit+2 根现算"数值不同，交叉信号也可能不同，所以默认关闭
+    """
 
     conn.row_factory = sqlite3.Row
 
@@ -13,62 +27,334 @@ def check_ema_signals_by_database(conn, symbol,indexname: str,limit: int = 300):
     # 找出所有kline表
     cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '{symbol}_%'")
     tables = [row[0] for row in cursor.fetchall()]
+    # 快照最后一根落后于库里的表 (本轮读入后又有新K线) 仍然读库
+    fresh = snapshot.current(conn, tables, indexname) if snapshot is not None else set()
 
+    # 各周期表读出来后堆成一个数组，一次算完所有交叉
+    checked = []
+    closes = []
+    times = []
+    from_store = {}
     for table in tables:
-        print(f"检查{table}的k线数据")
-        
         para = table.split("_")
         period = para[1]
-        print(f"检查{symbol}的{period}线")      
+        logger.debug("检查%s的%s线", symbol, period)
+
+        # 物化指标是最新的就直接用现成的 EMA
+        if use_store:
+            with stage("db_read", interval=period):
+                signals = signals_from_store(conn, table, symbol, period, indexname)
+            if signals is not None:
+                from_store[table] = signals
+                continue
 
-        query = f'SELECT {indexname}, close, high, low FROM "{table}" ORDER BY {indexname} DESC LIMIT {limit+2}'
-        df = pd.read_sql(query, conn).sort_values(indexname)
-        print(df)
+        df = snapshot.frame(table, indexname) if table in fresh else None
+        # 快照里的行数等于快照上限时表里可能还有更早的K线
+        if df is not None and (len(df) >= limit + 2 or len(df) < snapshot.bars):
+            df = df.iloc[-(limit + 2):]
+        else:
+            query = f'SELECT {indexname}, close, high, low FROM "{table}" ORDER BY {indexname} DESC LIMIT {limit+2}'
+            with stage("db_read", interval=period):
+                df = pd.read_sql(query, conn).sort_values(indexname)
+        logger.debug("%s\n%s", table, df)
         if(len(df) > 200):
-            detect_ema_signals(df,indexname)
+            checked.append(table)
+            closes.append(df["close"].to_numpy())
+            # 快照里的时间是 float64，统一成整数时间戳，与 detect_ema_signals 的输出一致
+            times.append(df[indexname].to_numpy(dtype=np.int64))
         else:
-            print(f"{table}不足200根,只有{len(df)}根")
+            logger.debug("%s不足200根,只有%s根", table, len(df))
+
+    if not checked:
+        return from_store
+
+    with stage("signal"):
+        results = detect_ema_signals_batch(stack_closes(closes), times)
+    from_store.update(zip(checked, results))
+    return from_store
+
+
+# EMA 周期与需要检测交叉的组合 (快线, 慢线)，顺序即同一根K线上信号的输出顺序
+EMA_SPANS = (7, 25, 99)
+EMA_PAIRS = ((7, 25), (7, 99), (25, 99))
+GOLDEN_LABELS = [f"金叉: EMA{fast} 上穿 EMA{slow}" for fast, slow in EMA_PAIRS]
+DEAD_LABELS = [f"死叉: EMA{fast} 下穿 EMA{slow}" for fast, slow in EMA_PAIRS]
+PAIR_OF_LABEL = {label: f"EMA{fast}/EMA{slow}"
+                 for labels in (GOLDEN_LABELS, DEAD_LABELS) for label, (fast, slow) in zip(labels, EMA_PAIRS)}
+
+# 只检查最后 200 根
+SIGNAL_WINDOW = 200
+
+
+def ema_2d(close, span):
+    """
+    close: (n_symbols, n_bars) 数组，沿时间轴计算 EMA (adjust=False)
+    与 Series.ewm 结果完全一致；左侧用 NaN 补齐的行从第一个有效值开始计算
+    """
+    close = np.asarray(close, dtype=float)
+    return pd.DataFrame(close.T).ewm(span=span, adjust=False).mean().to_numpy().T
+
+
+def ema_cross_kernel(emas, window=SIGNAL_WINDOW):
+    """
+    一次算出所有组合的交叉
+    emas: {span: (n_symbols, n_bars) 数组}
+    返回 (golden, dead)，形状均为 (n_symbols, n_pairs, w-1) 的布尔数组，
+    第 j 列对应窗口内第 j+1 根K线 (与前一根比较)，w = min(window, n_bars)
+    """
+    n_bars = next(iter(emas.values())).shape[1]
+    w = min(window, n_bars)
+    golden = []
+    dead = []
+    for fast, slow in EMA_PAIRS:
+        f = emas[fast][:, n_bars - w:]
+        sl = emas[slow][:, n_bars - w:]
+        f_prev, f_curr = f[:, :-1], f[:, 1:]
+        s_prev, s_curr = sl[:, :-1], sl[:, 1:]
+        golden.append((f_prev <= s_prev) & (f_curr > s_curr))
+        dead.append((f_prev >= s_prev) & (f_curr < s_curr))
+    return np.stack(golden, axis=1), np.stack(dead, axis=1)
+
+
+def cross_signals(golden, dead, times):
+    """
+    单个交易对的交叉矩阵 (n_pairs, w-1) -> [(time, label)]
+    按时间先后输出，同一根K线上按 EMA_PAIRS 顺序
+    """
+    out = []
+    for col in np.flatnonzero((golden | dead).any(axis=0)):
+        for p in range(len(EMA_PAIRS)):
+            if golden[p, col]:
+                out.append((times[col], GOLDEN_LABELS[p]))
+            elif dead[p, col]:
+                out.append((times[col], DEAD_LABELS[p]))
+    return out
 
 
 def detect_ema_signals(df,indexname):
     """
     输入: df 必须包含 'close' 列 (float)
-    输出: 返回近300根K线中的EMA信号
+    输出: 返回近200根K线中的EMA信号 [(time, label)]
     """
 
     # 计算EMA
-    df["EMA7"] = df["close"].ewm(span=7, adjust=False).mean()
-    df["EMA25"] = df["close"].ewm(span=25, adjust=False).mean()
-    df["EMA99"] = df["close"].ewm(span=99, adjust=False).mean()
+    for span in EMA_SPANS:
+        df[f"EMA{span}"] = df["close"].ewm(span=span, adjust=False).mean()
 
-    signals = []
+    emas = {span: df[f"EMA{span}"].to_numpy()[None, :] for span in EMA_SPANS}
+    golden, dead = ema_cross_kernel(emas)
 
-    # 只检查最后300根    
-    for i in range(1, len(df.tail(200))):
-        row_prev = df.iloc[-200 + i - 1]
-        row_curr = df.iloc[-200 + i]
+    w = golden.shape[2] + 1
+    if indexname in df.columns:
+        times = df[indexname].to_numpy()[len(df) - w + 1:].tolist()
+    else:
+        times = list(range(1, w))
 
-        time = row_curr[indexname] if indexname in df.columns else i
+    return cross_signals(golden[0], dead[0], times)
 
-        # === 短期 vs 中期 (EMA7 vs EMA25)
-        if row_prev["EMA7"] <= row_prev["EMA25"] and row_curr["EMA7"] > row_curr["EMA25"]:
-            signals.append((time, "金叉: EMA7 上穿 EMA25"))
-        elif row_prev["EMA7"] >= row_prev["EMA25"] and row_curr["EMA7"] < row_curr["EMA25"]:
-            signals.append((time, "死叉: EMA7 下穿 EMA25"))
 
-        # === 短期 vs 长期 (EMA7 vs EMA99)
-        if row_prev["EMA7"] <= row_prev["EMA99"] and row_curr["EMA7"] > row_curr["EMA99"]:
-            signals.append((time, "金叉: EMA7 上穿 EMA99"))
-        elif row_prev["EMA7"] >= row_prev["EMA99"] and row_curr["EMA7"] < row_curr["EMA99"]:
-            signals.append((time, "死叉: EMA7 下穿 EMA99"))
+def stack_closes(series_list, n_bars=None):
+    """
+    把多个交易对的收盘价 (长度可以不同) 右对齐堆成 (n_symbols, n_bars) 数组，左侧补 NaN
+    """
+    n_bars = n_bars or max((len(s) for s in series_list), default=0)
+    out = np.full((len(series_list), n_bars), np.nan)
+    for i, s in enumerate(series_list):
+        s = np.asarray(s, dtype=float)[-n_bars:]
+        if len(s):
+            out[i, n_bars - len(s):] = s
+    return out
 
-        # === 中期 vs 长期 (EMA25 vs EMA99)
-        if row_prev["EMA25"] <= row_prev["EMA99"] and row_curr["EMA25"] > row_curr["EMA99"]:
-            signals.append((time, "金叉: EMA25 上穿 EMA99"))
-        elif row_prev["EMA25"] >= row_prev["EMA99"] and row_curr["EMA25"] < row_curr["EMA99"]:
-            signals.append((time, "死叉: EMA25 下穿 EMA99"))
 
-    return signals
+def detect_ema_signals_batch(close, times=None, window=SIGNAL_WINDOW):
+    """
+    多交易对一次检测
+    close: (n_symbols, n_bars) 收盘价，右对齐、左侧补 NaN (见 stack_closes)
+    times: 同形状的时间数组，或每个交易对一个 (右对齐、长度可以不同的) 时间数组，返回的时间保持原来的类型；
+           为空时用窗口内序号，和 detect_ema_signals 一致
+    返回每个交易对的 [(time, label)] 列表
+    """
+    close = np.asarray(close, dtype=float)
+    emas = {span: ema_2d(close, span) for span in EMA_SPANS}
+    golden, dead = ema_cross_kernel(emas, window)
+
+    w = golden.shape[2] + 1
+    results = []
+    for i in range(close.shape[0]):
+        if times is None:
+            t = list(range(1, w))
+        else:
+            # 取最后 w-1 根的时间，不足时左侧补 None (对应补 NaN 的位置，不会有信号)
+            t = np.asarray(times[i])[-(w - 1):].tolist()
+            t = [None] * (w - 1 - len(t)) + t
+        results.append(cross_signals(golden[i], dead[i], t))
+    return results
+
+
+def signals_from_store(conn, table, symbol, period, indexname, window=SIGNAL_WINDOW):
+    """
+    用 kline_indicators 里的 EMA7/25/99 检测交叉；指标不是最新或不足 window 根时返回 None
+    注意物化的 EMA 从整张表第一根开始累积，和只取最近 300 根现算的结果在早期略有差异
+    """
+    if not IndicatorStore.is_current(conn, table, symbol, period, indexname):
+        return None
+    cols = [f"ema{span}" for span in EMA_SPANS]
+    df = IndicatorStore.load_indicators(conn, symbol, period, limit=window, columns=cols)
+    if len(df) < window or df[cols].isna().any().any():
+        return None
+
+    emas = {span: df[f"ema{span}"].to_numpy(dtype=float)[None, :] for span in EMA_SPANS}
+    golden, dead = ema_cross_kernel(emas, window)
+    times = df["ts"].to_numpy()[1:].tolist()
+    return cross_signals(golden[0], dead[0], times)
+
+
+# =========================================================
+# 全市场 EMA 筛选
+# 按块读取每张K线表最后 SCREEN_BARS 根，批量检测交叉，
+# 每个 (交易对, 周期, 组合) 最新的一次交叉写入 ema_signals 表
+# =========================================================
+SCREEN_BARS = 302
+# 每次联合查询的表数 (SQLite 复合查询上限默认 500)
+SCREEN_CHUNK = 64
+EMA_SIGNALS_TABLE = "ema_signals"
+
+
+def init_signals_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {EMA_SIGNALS_TABLE} (
+        symbol TEXT,
+        interval TEXT,
+        pair TEXT,         -- 例如 EMA7/EMA25
+        ts INTEGER,        -- 交叉发生的K线时间 (与K线表索引列一致)
+        label TEXT,
+        updated INTEGER,   -- 写入时间 (秒)
+        PRIMARY KEY (symbol, interval, pair)
+    )
+    """)
+    conn.commit()
+
+
+def list_kline_tables(conn):
+    """所有 {symbol}_{period} 形式的K线表 -> [(table, symbol, period)]"""
+    periods = set(g_ACD.getInterval().keys())
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = []
+    for (name,) in cursor.fetchall():
+        symbol, sep, period = name.rpartition("_")
+        if sep and symbol and period in periods:
+            tables.append((name, symbol, period))
+    return tables
+
+
+def read_tail_chunk(conn, tables, indexname, n_bars=SCREEN_BARS):
+    """
+    一条 UNION ALL 查询读出一组表的最后 n_bars 根
+    返回 (close, times, counts)：close/times 为右对齐、左侧补 NaN 的 (len(tables), n_bars) 数组
+    """
+    sql = " UNION ALL ".join(
+        f'SELECT {i}, * FROM (SELECT {indexname}, close FROM "{t}" ORDER BY {indexname} DESC LIMIT {n_bars})'
+        for i, t in enumerate(tables))
+    rows = np.array(conn.execute(sql).fetchall(), dtype=float).reshape(-1, 3)
+
+    close = np.full((len(tables), n_bars), np.nan)
+    times = np.full((len(tables), n_bars), np.nan)
+    counts = np.zeros(len(tables), dtype=int)
+    if len(rows) == 0:
+        return close, times, counts
+
+    # 按 (表, 时间) 升序，再算每行在所属表里的右对齐列号
+    rows = rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+    k = rows[:, 0].astype(int)
+    counts = np.bincount(k, minlength=len(tables))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    col = n_bars - counts[k] + (np.arange(len(rows)) - starts[k])
+    close[k, col] = rows[:, 2]
+    times[k, col] = rows[:, 1]
+    return close, times, counts
+
+
+def newest_crosses(signals):
+    """[(time, label)] -> {pair: (time, label)}，每个组合只保留最新的一次"""
+    newest = {}
+    for t, label in reversed(signals):
+        pair = PAIR_OF_LABEL[label]
+        if pair not in newest:
+            newest[pair] = (t, label)
+    return newest
+
+
+def read_tail_snapshot(snapshot, tables, n_bars=SCREEN_BARS, conn=None):
+    """
+    从扫描快照取一组表的最后 n_bars 根，格式同 read_tail_chunk
+    快照里没有或K线不足 n_bars 根 (可能是截断的) 的表 counts 记为 -1，由调用方回退到读库
+    给出 conn 时快照落后于库里最新K线的表也记为 -1
+    """
+    close = np.full((len(tables), n_bars), np.nan)
+    times = np.full((len(tables), n_bars), np.nan)
+    counts = np.full(len(tables), -1)
+    fresh = snapshot.current(conn, tables) if conn is not None else None
+    for i, table in enumerate(tables):
+        data = snapshot.get(table)
+        if fresh is not None and table not in fresh:
+            continue
+        if data is None or (len(data) < n_bars and len(data) >= snapshot.bars):
+            continue
+        data = data[-n_bars:]
+        close[i, n_bars - len(data):] = data[:, 4]
+        times[i, n_bars - len(data):] = data[:, 0]
+        counts[i] = len(data)
+    return close, times, counts
+
+
+def screen_universe(conn, chunk=SCREEN_CHUNK, n_bars=SCREEN_BARS, min_bars=SIGNAL_WINDOW, snapshot=None):
+    """
+    扫描库中所有K线表的 EMA7/25/99 交叉，结果写入 ema_signals
+    内存只与 chunk * n_bars 有关，与交易对数量无关
+    snapshot: ScanSnapshot，快照里有的表不再读库
+    返回写入的信号条数
+    """
+    init_signals_table(conn)
+    indexname = g_ACD.getIndexName()
+    tables = list_kline_tables(conn)
+    now = int(time.time())
+    written = 0
+
+    for i in range(0, len(tables), chunk):
+        group = tables[i:i + chunk]
+        names = [t[0] for t in group]
+        if snapshot is not None:
+            close, times, counts = read_tail_snapshot(snapshot, names, n_bars, conn)
+            missing = np.flatnonzero(counts < 0)
+        else:
+            missing = np.arange(len(group))
+        if len(missing):
+            with stage("db_read"):
+                db_close, db_times, db_counts = read_tail_chunk(conn, [names[i] for i in missing], indexname, n_bars)
+            if snapshot is None:
+                close, times, counts = db_close, db_times, db_counts
+            else:
+                close[missing], times[missing], counts[missing] = db_close, db_times, db_counts
+
+        # 与 check_ema_signals_by_database 一致，不足 200 根的表跳过
+        keep = counts > min_bars
+        if not keep.any():
+            continue
+        with stage("signal"):
+            results = detect_ema_signals_batch(close[keep], times[keep])
+
+        records = []
+        for (table, symbol, period), signals in zip((g for g, k in zip(group, keep) if k), results):
+            for pair, (t, label) in newest_crosses(signals).items():
+                records.append((symbol, period, pair, int(t), label, now))
+        if records:
+            with stage("db_write"):
+                conn.executemany(f"INSERT OR REPLACE INTO {EMA_SIGNALS_TABLE} VALUES (?, ?, ?, ?, ?, ?)", records)
+                conn.commit()
+            written += len(records)
+
+    logger.info("EMA 筛选完成: %s 张表, 写入 %s 条信号", len(tables), written)
+    return written
 
 
 # 用法示例:
@@ -90,5 +376,16 @@ if __name__ == "__main__":
 
     conn = sqlite3.connect(g_ACD.getDB())   
 
-    check_ema_signals_by_database(conn,"BTCUSDT",g_ACD.getIndexName())
+    # ScanAllData 在同一台机器上运行时，直接读它本轮发布的快照
+    snapshot = ScanSnapshot.attach()
+
+    if "--screen" in sys.argv:
+        # 全市场筛选: python CheckByEMA.py [HTX] --screen
+        InitLogging()
+        screen_universe(conn, snapshot=snapshot)
+    else:
+        check_ema_signals_by_database(conn,"BTCUSDT",g_ACD.getIndexName(),snapshot=snapshot)
+    if snapshot is not None:
+        snapshot.close()
+    conn.close()
 
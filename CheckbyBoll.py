@@ -1,18 +1,25 @@
 import sqlite3
-import requests
+import logging
 import asyncio
 import time
 from datetime import datetime
 import pandas as pd
 from DatabaseUpdate import update_all_symbol
 from RobotNotifier import send_message_async
+from ConstDef import api_url
+from ExchangeClient import g_client
+from Metrics import stage
+from RollingWindow import rolling_mean_std, bollinger, not_greater, not_less
+import IndicatorStore
+
+logger = logging.getLogger(__name__)
 
 def get_current_price(symbol):
     """
     从HTX获取最新成交价
     """
-    url = f"https://api.huobi.pro/market/trade?symbol={symbol}"
-    resp = requests.get(url).json()
+    url = api_url("HTX", f"/market/trade?symbol={symbol}")
+    resp = g_client.get(url).json()
     return float(resp["tick"]["data"][0]["price"])
 
 
@@ -153,65 +160,104 @@ def check_bollinger_convergence(df: pd.DataFrame, n: int = 10, period: int = 20,
     if len(df) < period + n:
         return False
 
-    df = df.copy()
-    df["ma"] = df["close"].rolling(period).mean()
-    df["std"] = df["close"].rolling(period).std()
-    df["upper"] = df["ma"] + k * df["std"]
-    df["lower"] = df["ma"] - k * df["std"]
-    df["bandwidth"] = df["upper"] - df["lower"]
-
-    # 条件判断
-    cond1 = df["bandwidth"] <= df["bandwidth"].shift(1)   # 带宽缩小或持平
-    cond2 = df["upper"] <= df["upper"].shift(1)           # 上轨下降
-    cond3 = df["lower"] >= df["lower"].shift(1)           # 下轨上升（向内收缩）
+    # 只需要最近 n+1 根的布林带，往前多取 period-1 根即可
+    close = df["close"].to_numpy(dtype=float)[-(period + n):]
+    ma, std = rolling_mean_std(close, period)
+    upper = ma + k * std
+    lower = ma - k * std
+    bandwidth = upper - lower
 
-    df["is_converging"] = cond1 & cond2 & cond3
+    # 条件判断 (带相对容差，低价币不会被舍入误差误判)
+    cond1 = not_greater(bandwidth[1:], bandwidth[:-1])    # 带宽缩小或持平
+    cond2 = not_greater(upper[1:], upper[:-1])            # 上轨下降
+    cond3 = not_less(lower[1:], lower[:-1])               # 下轨上升（向内收缩）
 
     # 取最近 n 根
-    return df["is_converging"].tail(n).all()
+    return bool((cond1 & cond2 & cond3)[-n:].all())
 
 
 # 计算布林带并检测突破
-def check_bollinger_breakout_by_kline(conn, table,indexname: str,limit: int = 20, num_std: float = 2.0):
+def check_bollinger_breakout_by_kline(conn, table,indexname: str,limit: int = 20, num_std: float = 2.0, bars=None):
     """
     从指定K线表取数据，计算布林带，检查最新价格是否触及上/下轨，上轨返回1,下轨返回2
     :param conn: sqlite3.Connection
     :param table: 表名 (例如 'kline_30min')
     :param period: 布林周期 (默认20)
     :param num_std: 标准差倍数 (默认2)
+    :param bars: 已读出的K线 (ScanSnapshot 的 frame)，给出时不再读库
     """
+    symbol, _, period = table.rpartition("_")
+
+    # 物化指标已经算到最新一根时直接读，不用再取数据重算
+    if limit == IndicatorStore.BOLL_WINDOW and num_std == IndicatorStore.BOLL_STD:
+        with stage("db_read", interval=period):
+            cond = breakout_from_store(conn, table, symbol, period, indexname)
+        if cond is not None:
+            return cond
+
     # 取最近 period+2 根数据，保证够算
-    query = f'SELECT {indexname}, close, high, low FROM "{table}" ORDER BY {indexname} DESC LIMIT {limit+2}'
-    df = pd.read_sql(query, conn).sort_values(indexname)
+    if bars is not None and len(bars) >= limit + 2:
+        df = bars[[indexname, "close", "high", "low"]].iloc[-(limit + 2):].copy()
+    else:
+        query = f'SELECT {indexname}, close, high, low FROM "{table}" ORDER BY {indexname} DESC LIMIT {limit+2}'
+        with stage("db_read", interval=period):
+            df = pd.read_sql(query, conn).sort_values(indexname)
 
 
     if len(df) < limit:
-        print(f"⚠️ {table} 数据不足 {limit} 根，无法计算布林带")
+        logger.warning("⚠️ %s 数据不足 %s 根，无法计算布林带", table, limit)
         return
 
-    # 计算布林带
-    df["ma"] = df["close"].rolling(limit).mean()
-    df["std"] = df["close"].rolling(limit).std()
-    df["upper"] = df["ma"] + num_std * df["std"]
-    df["lower"] = df["ma"] - num_std * df["std"]
+    with stage("signal", interval=period):
+        # 计算布林带
+        df["ma"], df["upper"], df["lower"] = bollinger(df["close"], limit, num_std)
 
-    latest = df.iloc[-1]
-    # price = latest["close"]
-    khprice = latest["high"]
-    klprice = latest["low"]
+        latest = df.iloc[-1]
+        # price = latest["close"]
+        khprice = latest["high"]
+        klprice = latest["low"]
 
-    cond = 0
-    
-    # print("当前布林带数据",df)
-    if khprice >= latest["upper"]:
-        print(f"📈 {table} k线最高价 {khprice} 触及布林上轨 {latest['upper']:.2f}")
-        cond = 1
-    elif klprice <= latest["lower"]:
-        print(f"📉 {table} k线最低价 {klprice} 触及布林下轨 {latest['lower']:.2f}")        
-        cond = 2
+        cond = 0
+        
+        # print("当前布林带数据",df)
+        if khprice >= latest["upper"]:
+            logger.debug("📈 %s k线最高价 %s 触及布林上轨 %.2f", table, khprice, latest['upper'])
+            cond = 1
+        elif klprice <= latest["lower"]:
+            logger.debug("📉 %s k线最低价 %s 触及布林下轨 %.2f", table, klprice, latest['lower'])
+            cond = 2
 
     return cond
 
+def breakout_from_store(conn, table, symbol, period, indexname):
+    """
+    用 kline_indicators 里的 BOLL(20,2) 判断最新一根是否触轨
+    指标不是最新 (或还没有物化) 时返回 None，由调用方现算
+    """
+    try:
+        row = conn.execute(f'''
+            SELECT k.{indexname}, k.high, k.low, i.boll_upper, i.boll_lower, s.last_ts
+            FROM "{table}" k
+            JOIN {IndicatorStore.STATE_TABLE} s ON s.symbol = ? AND s.interval = ? AND s.version = ?
+            LEFT JOIN {IndicatorStore.INDICATOR_TABLE} i
+                ON i.symbol = s.symbol AND i.interval = s.interval AND i.version = s.version AND i.ts = k.{indexname}
+            ORDER BY k.{indexname} DESC LIMIT 1
+        ''', (symbol, period, IndicatorStore.INDICATOR_VERSION)).fetchone()
+    except Exception:
+        return None
+    if row is None or row[0] != row[5] or row[3] is None:
+        return None
+
+    _, khprice, klprice, upper, lower, _ = row
+    if khprice >= upper:
+        logger.debug("📈 %s k线最高价 %s 触及布林上轨 %.2f", table, khprice, upper)
+        return 1
+    if klprice <= lower:
+        logger.debug("📉 %s k线最低价 %s 触及布林下轨 %.2f", table, klprice, lower)
+        return 2
+    return 0
+
+
 # 计算布林带并检测突破
 def check_bollinger_breakout(conn, table: str, price,limit: int = 20, num_std: float = 2.0):
     """
@@ -231,10 +277,7 @@ def check_bollinger_breakout(conn, table: str, price,limit: int = 20, num_std: f
         return
 
     # 计算布林带
-    df["ma"] = df["close"].rolling(limit).mean()
-    df["std"] = df["close"].rolling(limit).std()
-    df["upper"] = df["ma"] + num_std * df["std"]
-    df["lower"] = df["ma"] - num_std * df["std"]
+    df["ma"], df["upper"], df["lower"] = bollinger(df["close"], limit, num_std)
 
     latest = df.iloc[-1]
     # price = latest["close"]
@@ -1,4 +1,6 @@
+import os
 import sys
+import logging
 
 from ConstDef import g_ACD
 
@@ -9,6 +11,17 @@ def InitEnvironment():
             strExchange = "HTX"
 
     g_ACD.setExchange(strExchange)    
+    InitLogging()
+
+
+def InitLogging(level=None):
+    """
+    初始化日志，级别取参数或环境变量 LOG_LEVEL (默认 INFO)
+    DEBUG 级别会输出每张表的拉取明细，平时关闭不产生开销
+    """
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.INFO),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 
 def save_simple(number, file='num.txt'):
@@ -1,3 +1,7 @@
+import os
+import contextvars
+from contextlib import contextmanager
+
 DB_FILE = "kline.db"
 SYMBOLS_TALBE = "all_symbol"
 
@@ -33,36 +37,118 @@ BINANCE_INTERVAL = {
     "1w":3600*24*7
 }
 
+HYPERLIQUID_INTERVAL = {
+    "5m":300,
+    "15m":900,
+    "30m":1800,
+    "1h":3600,
+    "4h":14400,
+    "1d":3600*24
+}
+
 ALL_CONST ={
     "HTX":{
         "DB":DB_FILE,
+        "api_base":"https://api.huobi.pro",
         "Table_symbols":SYMBOLS_TALBE,
         "api_kline":API_GET_KLINE_URL,
         "api_symbols":API_GET_SYMBOLS_RUL,
         "interval":HTX_PERIOD_INTERVAL,
-        "indexname":"ts"
+        "indexname":"ts",
+        "rate_limit":{"budget":800, "window":1, "header":None, "default_weight":1, "weights":{}}
     },
 
     "BINANCE":{
         "DB":"dbbinance.db",
+        "api_base":"https://api.binance.com",
         "Table_symbols":"all_symbol",
         "api_kline":"https://api.binance.com/api/v3/klines",
         "api_symbols":"https://api.binance.com/api/v3/exchangeInfo",
         "interval":BINANCE_INTERVAL,
-        "indexname":"open_time"
+        "indexname":"open_time",
+        "rate_limit":{
+            "budget":6000, "window":60, "header":"X-MBX-USED-WEIGHT-1M", "default_weight":2,
+            "weights":{"/api/v3/klines":2, "/api/v3/exchangeInfo":20, "/api/v3/ticker/price":4, "/api/v3/ticker/24hr":80}
+        }
+    },
+
+    "HYPERLIQUID":{
+        "DB":"hyperliquid_data.db",
+        "api_base":"https://api.hyperliquid.xyz",
+        "api_kline":"https://api.hyperliquid.xyz/info",
+        "api_symbols":"https://api.hyperliquid.xyz/info",
+        "interval":HYPERLIQUID_INTERVAL,
+        "indexname":"timestamp",
+        # /info 按请求体的 type 计权重；candleSnapshot 每返回 60 根另加 1
+        "rate_limit":{"budget":1200, "window":60, "header":None, "default_weight":20,
+                      "weights":{"allMids":2, "l2Book":2, "candleSnapshot":20}}
     }
 }
 
+# rate_limit: 每个 window 秒内允许的总权重 budget，header 为服务端返回已用权重的响应头
+# weights 按接口路径 (POST 接口按请求体的 type) 取权重，没有列出的用 default_weight
+# 预算可以用环境变量 <EXCHANGE>_RATE_BUDGET 覆盖，见 RateLimiter.py
+
+# 接口地址可以整体替换到其它主机 (例如本地假交易所 benchmarks/fake_exchange.py)
+# 优先级: setApiBase() > 环境变量 <EXCHANGE>_API_BASE > ALL_CONST 默认值
+_api_base_override = {}
+
+
+def set_api_base(exchange, base):
+    if base:
+        _api_base_override[exchange] = base.rstrip("/")
+    else:
+        _api_base_override.pop(exchange, None)
+
+
+def get_api_base(exchange):
+    base = _api_base_override.get(exchange) or os.environ.get(f"{exchange}_API_BASE", "")
+    return base.rstrip("/") if base else ALL_CONST[exchange]["api_base"]
+
+
+def api_url(exchange, url):
+    """把默认主机的完整地址换成当前配置的主机，url 也可以直接传路径 (以 / 开头)"""
+    default_base = ALL_CONST[exchange]["api_base"]
+    if url.startswith(default_base):
+        url = url[len(default_base):]
+    return get_api_base(exchange) + url
+
+# 当前交易所按上下文 (线程 / asyncio 任务) 区分，一个进程里可以同时跑多个交易所
+# 没有用 use() 指定过的上下文使用 setExchange() 设的进程默认值
+_current_exchange = contextvars.ContextVar("exchange", default=None)
+
+
 class CAllConstDef:
     def __init__(self):
-        self.strExchange = "BINANCE"        
+        self.defaultExchange = "BINANCE"
 
     def setExchange(self,exchange):
-        self.strExchange = exchange
-        self.ContDef = ALL_CONST[self.strExchange]
+        """设置进程默认的交易所 (当前上下文里 use() 指定的也一并改掉)"""
+        ALL_CONST[exchange]
+        self.defaultExchange = exchange
+        if _current_exchange.get() is not None:
+            _current_exchange.set(exchange)
+
+    @contextmanager
+    def use(self, exchange):
+        """在当前线程 / 任务内临时切换交易所，退出后恢复"""
+        ALL_CONST[exchange]
+        token = _current_exchange.set(exchange)
+        try:
+            yield self
+        finally:
+            _current_exchange.reset(token)
 
     def getExchange(self):
-        return self.strExchange        
+        return _current_exchange.get() or self.defaultExchange
+
+    @property
+    def strExchange(self):
+        return self.getExchange()
+
+    @property
+    def ContDef(self):
+        return ALL_CONST[self.getExchange()]
 
     def getDB(self):
         return self.ContDef["DB"]
@@ -70,11 +156,21 @@ class CAllConstDef:
     def getTableSymbols(self):
         return self.ContDef["Table_symbols"]
     
+    def setApiBase(self, base):
+        """把当前交易所的所有接口指向 base (传 None 恢复默认)"""
+        set_api_base(self.strExchange, base)
+
+    def getApiBase(self):
+        return get_api_base(self.strExchange)
+
+    def getApiUrl(self, path):
+        return api_url(self.strExchange, path)
+
     def getApiKline(self):
-        return self.ContDef["api_kline"]
+        return api_url(self.strExchange, self.ContDef["api_kline"])
     
     def getApiSymbols(self):
-        return self.ContDef["api_symbols"]
+        return api_url(self.strExchange, self.ContDef["api_symbols"])
     
     def getInterval(self):
         return self.ContDef["interval"]
@@ -82,6 +178,9 @@ class CAllConstDef:
     def getIndexName(self):
         return self.ContDef["indexname"]
 
+    def getRateLimit(self):
+        return self.ContDef["rate_limit"]
+
 
 
 
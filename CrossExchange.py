@@ -0,0 +1,280 @@
+"""
+跨交易所的合并视图
+
+同一个币在三个库里各存一份 (HTX btcusdt，币安 BTCUSDT，Hyperliquid BTC)，以前各扫各的。
+这里做两件事:
+    1. 交易对映射: 以基础币 (大写，如 BTC) 为准，对应到各交易所的交易对名
+    2. 合并K线: 把各交易所同一周期的K线对齐到统一的时间网格，放进一块 numpy 数组
+       data[字段, 交易所, 时间]，缺失为 NaN
+
+在合并视图上可以:
+    - canonical(): 取一条规范序列 (按交易所优先级补缺，或取中位数)，指标只算一次
+    - spread(): 两个交易所之间的价差 (基点)
+    - lead_lag(): 收益率的互相关，看哪个交易所领先几根K线
+
+注意:
+    - 币安、HTX 是 USDT 计价，Hyperliquid 是 USD 计价的永续合约，价差里包含 USDT 溢价和资金费率的影响
+    - 时间网格按周期向下取整；1 小时及以下各交易所对齐一致，日线等长周期各交易所的切分时区可能不同
+    - 成交量统一用基础币数量 (币安 volume、HTX amount、Hyperliquid volume)
+"""
+import sqlite3
+import logging
+
+import numpy as np
+import pandas as pd
+
+from ConstDef import ALL_CONST
+from KlineArchive import load_history
+from SymbolRegistry import active_symbols
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ["open", "high", "low", "close", "volume"]
+
+# 每个交易所: 时间列、时间列每秒多少个单位、基础币成交量列、交易对后缀
+VENUE_SPEC = {
+    "BINANCE": ("open_time", 1000, "volume", "USDT"),
+    "HTX": ("ts", 1, "amount", "usdt"),
+    "HYPERLIQUID": ("timestamp", 1000, "volume", ""),
+}
+
+# canonical() 按此顺序取第一个有数据的交易所
+VENUE_PRIORITY = ["BINANCE", "HYPERLIQUID", "HTX"]
+
+# Hyperliquid 的K线都在 MarketDataManager 的 klines 表里
+HYPERLIQUID_TABLE = "klines"
+
+
+# ---------------------------------------------------------
+# 交易对映射
+# ---------------------------------------------------------
+def to_asset(exchange, symbol):
+    """交易对 -> 基础币 (大写)；不是该交易所 USDT 交易对时返回 None"""
+    suffix = VENUE_SPEC[exchange][3]
+    if suffix:
+        if not symbol.endswith(suffix) or len(symbol) == len(suffix):
+            return None
+        symbol = symbol[:-len(suffix)]
+    return symbol.upper()
+
+
+def venue_symbol(exchange, asset):
+    """基础币 -> 该交易所的交易对名 (Hyperliquid 的币名有小写前缀，如 kPEPE，优先用 symbol_map 的结果)"""
+    suffix = VENUE_SPEC[exchange][3]
+    if exchange == "HTX":
+        return asset.lower() + suffix
+    if exchange == "BINANCE":
+        return asset.upper() + suffix
+    return asset
+
+
+def venue_symbols(conn, exchange):
+    """库里该交易所的交易对列表"""
+    if exchange == "HYPERLIQUID":
+        try:
+            return [r[0] for r in conn.execute(f"SELECT DISTINCT symbol FROM {HYPERLIQUID_TABLE}")]
+        except sqlite3.OperationalError:
+            return []
+    return [symbol for _, symbol in active_symbols(conn, exchange)]
+
+
+def symbol_map(conns, min_venues=1):
+    """
+    conns: {交易所: 连接}
+    返回 {基础币: {交易所: 交易对}}，只保留至少在 min_venues 个交易所上市的
+    """
+    mapping = {}
+    for exchange, conn in conns.items():
+        for symbol in venue_symbols(conn, exchange):
+            asset = to_asset(exchange, symbol)
+            if asset:
+                mapping.setdefault(asset, {})[exchange] = symbol
+    return {a: v for a, v in mapping.items() if len(v) >= min_venues}
+
+
+def period_for(exchange, interval_sec):
+    """该交易所周期长度为 interval_sec 秒的周期名；没有时返回 None"""
+    for period, sec in ALL_CONST[exchange]["interval"].items():
+        if sec == interval_sec:
+            return period
+    return None
+
+
+# ---------------------------------------------------------
+# 读取
+# ---------------------------------------------------------
+def read_bars(conn, exchange, symbol, interval_sec, start=None, end=None):
+    """
+    一个交易所的K线: (秒级开盘时间 int64 数组, [n, 5] 的 open/high/low/close/volume)
+    start/end 为秒级时间戳 (含两端)
+    """
+    tcol, scale, vol_col, _ = VENUE_SPEC[exchange]
+    period = period_for(exchange, interval_sec)
+    if period is None:
+        raise ValueError(f"{exchange} 没有 {interval_sec} 秒的周期")
+    lo = None if start is None else int(start * scale)
+    hi = None if end is None else int(end * scale)
+
+    if exchange == "HYPERLIQUID":
+        query = f"SELECT {tcol}, open, high, low, close, volume FROM {HYPERLIQUID_TABLE} WHERE symbol=? AND interval=?"
+        params = [symbol, period]
+        if lo is not None:
+            query += f" AND {tcol} >= ?"
+            params.append(lo)
+        if hi is not None:
+            query += f" AND {tcol} <= ?"
+            params.append(hi)
+        rows = conn.execute(query + f" ORDER BY {tcol}", params).fetchall()
+        arr = np.array(rows, dtype=np.float64).reshape(-1, 6)
+        t, values = arr[:, 0].astype(np.int64), arr[:, 1:]
+    else:
+        cols = ["open", "high", "low", "close", vol_col]
+        frame = load_history(conn, symbol, period, exchange, lo, hi, columns=cols)
+        t = np.asarray(frame[tcol], dtype=np.int64)
+        values = np.column_stack([np.asarray(frame[c], dtype=np.float64) for c in cols]) \
+            if len(t) else np.empty((0, 5))
+    return t // scale, values
+
+
+class MergedBars:
+    """
+    多个交易所对齐后的K线
+    ts: 秒级时间网格；data[字段, 交易所, 时间]，字段顺序同 FIELDS
+    """
+
+    def __init__(self, asset, interval_sec, venues, ts, data):
+        self.asset = asset
+        self.interval_sec = interval_sec
+        self.venues = list(venues)
+        self.ts = ts
+        self.data = data
+
+    def __len__(self):
+        return len(self.ts)
+
+    def field(self, name, venue=None):
+        """字段的 [交易所, 时间] 数组，给出 venue 时只返回该交易所的一行"""
+        block = self.data[FIELDS.index(name)]
+        return block if venue is None else block[self.venues.index(venue)]
+
+    def coverage(self):
+        """{交易所: 有数据的K线占比}"""
+        have = ~np.isnan(self.field("close"))
+        return {v: float(have[i].mean()) if len(self.ts) else 0.0 for i, v in enumerate(self.venues)}
+
+    def canonical(self, how="priority"):
+        """
+        规范序列 {字段: 数组}
+        how="priority": 按 VENUE_PRIORITY 取第一个有数据的交易所，整根K线取自同一交易所
+        how="median": 各字段取各交易所的中位数，成交量取总和
+        """
+        if how == "median":
+            out = {}
+            with np.errstate(all="ignore"):
+                for i, name in enumerate(FIELDS):
+                    block = self.data[i]
+                    if name == "volume":
+                        out[name] = np.where(np.isnan(block).all(axis=0), np.nan, np.nansum(block, axis=0))
+                    else:
+                        out[name] = np.nanmedian(block, axis=0) if len(self.venues) > 1 else block[0].copy()
+            return out
+
+        order = [self.venues.index(v) for v in VENUE_PRIORITY if v in self.venues]
+        order += [i for i in range(len(self.venues)) if i not in order]
+        close = self.field("close")
+        source = np.full(len(self.ts), -1)
+        for i in reversed(order):
+            source = np.where(~np.isnan(close[i]), i, source)
+        cols = np.arange(len(self.ts))
+        picked = self.data[:, np.maximum(source, 0), cols]
+        picked[:, source < 0] = np.nan
+        return dict(zip(FIELDS, picked))
+
+    def spread(self, a, b, field="close"):
+        """a 相对 b 的价差 (基点)，任一方缺失为 NaN"""
+        x, y = self.field(field, a), self.field(field, b)
+        with np.errstate(all="ignore"):
+            return (x / y - 1.0) * 1e4
+
+    def lead_lag(self, a, b, max_lag=5):
+        """
+        a、b 对数收益率的互相关
+        返回 (最佳滞后, {滞后: 相关系数})；滞后 k > 0 表示 a 领先 b k 根K线
+        """
+        with np.errstate(all="ignore"):
+            ra = np.diff(np.log(self.field("close", a)))
+            rb = np.diff(np.log(self.field("close", b)))
+        corr = {}
+        for k in range(-max_lag, max_lag + 1):
+            if k >= 0:
+                x, y = ra[:len(ra) - k], rb[k:]
+            else:
+                x, y = ra[-k:], rb[:len(rb) + k]
+            ok = ~(np.isnan(x) | np.isnan(y))
+            if ok.sum() < 3 or x[ok].std() == 0 or y[ok].std() == 0:
+                continue
+            corr[k] = float(np.corrcoef(x[ok], y[ok])[0, 1])
+        if not corr:
+            return None, corr
+        return max(corr, key=corr.get), corr
+
+    def to_frame(self, venue=None):
+        """venue 为空时返回规范序列的 DataFrame，否则返回该交易所的"""
+        values = self.canonical() if venue is None else {f: self.field(f, venue) for f in FIELDS}
+        df = pd.DataFrame(values, columns=FIELDS)
+        df.insert(0, "ts", self.ts)
+        return df
+
+
+def merge_bars(conns, asset, interval_sec, symbols=None, start=None, end=None, how="union"):
+    """
+    把一个币在各交易所的K线对齐到同一时间网格
+    conns: {交易所: 连接}；symbols: {交易所: 交易对}，为空时按 venue_symbol() 推断
+    how="union" 取各交易所时间的并集，"intersect" 只保留所有交易所都有的K线
+    """
+    symbols = symbols or {ex: venue_symbol(ex, asset) for ex in conns}
+    venues, series = [], []
+    for exchange in conns:
+        symbol = symbols.get(exchange)
+        if symbol is None or period_for(exchange, interval_sec) is None:
+            continue
+        try:
+            t, values = read_bars(conns[exchange], exchange, symbol, interval_sec, start, end)
+        except (sqlite3.Error, pd.errors.DatabaseError) as e:
+            logger.debug("%s %s 读取失败: %s", exchange, symbol, e)
+            continue
+        if len(t) == 0:
+            continue
+        # 对齐到周期网格，同一格多根时保留最后一根
+        t = t - t % interval_sec
+        last = np.r_[t[1:] != t[:-1], True]
+        venues.append(exchange)
+        series.append((t[last], values[last]))
+
+    if not series:
+        return MergedBars(asset, interval_sec, [], np.empty(0, dtype=np.int64), np.empty((len(FIELDS), 0, 0)))
+
+    if how == "intersect":
+        grid = series[0][0]
+        for t, _ in series[1:]:
+            grid = np.intersect1d(grid, t, assume_unique=True)
+    else:
+        grid = np.unique(np.concatenate([t for t, _ in series]))
+
+    data = np.full((len(FIELDS), len(venues), len(grid)), np.nan)
+    for i, (t, values) in enumerate(series):
+        pos = np.searchsorted(grid, t)
+        ok = (pos < len(grid)) & (grid[np.minimum(pos, len(grid) - 1)] == t)
+        data[:, i, pos[ok]] = values[ok].T
+    return MergedBars(asset, interval_sec, venues, grid, data)
+
+
+def open_venues(exchanges=None):
+    """{交易所: 只读连接}，库文件不存在的跳过"""
+    conns = {}
+    for exchange in exchanges or list(VENUE_SPEC):
+        try:
+            conns[exchange] = sqlite3.connect(f"file:{ALL_CONST[exchange]['DB']}?mode=ro", uri=True)
+        except sqlite3.OperationalError:
+            logger.debug("%s 的数据库不存在，跳过", exchange)
+    return conns
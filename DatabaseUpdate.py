@@ -1,8 +1,17 @@
 import sqlite3
-import requests
+import logging
 import pandas as pd
 from datetime import datetime, timezone, timedelta
 from ConstDef import g_ACD
+from ExchangeClient import g_client
+from Metrics import stage
+from Profiler import profile_target
+from IndicatorStore import update_indicators
+from SymbolRegistry import refresh_symbols, active_symbols
+from SymbolRank import hot_symbols
+from KlineParser import response_json, parse_binance_klines, parse_htx_klines, validate_klines
+
+logger = logging.getLogger(__name__)
 
 
 def ts_to_str(ts: int, tz_offset: int = 8) -> str:
@@ -11,13 +20,12 @@ def ts_to_str(ts: int, tz_offset: int = 8) -> str:
     默认转换为北京时间 (UTC+8)
     """
 
-    print("ts",ts,"tz_offset",tz_offset)
     tz = timezone(timedelta(hours=tz_offset))
     dt = datetime.fromtimestamp(ts, tz)
     return dt.strftime("%Y-%m-%d %H:%M:%S")
 
 
-def init_table(conn,table):
+def init_table(conn,table,commit=True):
     # conn = sqlite3.connect(DB_FILE)
     # print("尝试建表",table)
     cursor = conn.cursor()
@@ -50,56 +58,43 @@ def init_table(conn,table):
             taker_quote_vol REAL
         )
         """)        
-    conn.commit()       
+    if commit:
+        conn.commit()       
 
 
 def fetch_kline_by_HTX(symbol, period, size):
     url = g_ACD.getApiKline()
     params = {"symbol": symbol, "period": period, "size": size}
 
-    resp = requests.get(url, params=params).json()    
-    print("拉取结果",resp)
+    resp = response_json(g_client.get(url, params=params))
+    logger.debug("拉取结果 %s", resp)
     data = resp.get("data", [])
-    
-
-    df = pd.DataFrame(data)
-    if df.empty:
-        return df      
-
 
-    df = df.sort_values("id")  # id 是时间戳（秒）
-    df = df.rename(columns={"id": "ts"})
-    df = df.drop_duplicates(subset=["ts"])
-    return df[["ts", "open", "high", "low", "close", "amount", "vol", "count"]]
+    df = parse_htx_klines(data)
+    return validate_klines(df, "ts", g_ACD.getInterval().get(period), 1, f"{symbol}_{period}")
 
 def fetch_kline_by_binance(symbol, period, size):
     url = g_ACD.getApiKline()
     params = {"symbol": symbol, "interval": period, "limit": size}
     # print("拉取",url)
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = g_client.get(url, params=params, timeout=10)
         resp.raise_for_status()
-        data = resp.json()
+        data = response_json(resp)
     except Exception as e:
-        print(f"{symbol} 请求失败: {e}")
+        logger.warning("%s 请求失败: %s", symbol, e)
         return pd.DataFrame()
-    
-    df = pd.DataFrame(data, columns=[
-        "open_time","open","high","low","close","volume",
-        "close_time","quote_asset_volume","num_trades",
-        "taker_base_vol","taker_quote_vol","ignore"
-    ])  
-    df = df.drop(columns=["ignore"])
-    df = df.drop_duplicates(subset=["open_time"])  
-    return df
 
-def fetch_kline(symbol, period, size):
-    
+    # 价格/成交量是字符串，直接解析成 float64，入库为 REAL
+    df = parse_binance_klines(data)
+    return validate_klines(df, "open_time", g_ACD.getInterval().get(period), 1000, f"{symbol}_{period}")
 
-    if g_ACD.getExchange() == "HTX":
-        return fetch_kline_by_HTX(symbol, period, size)
-    else:
-        return fetch_kline_by_binance(symbol, period, size)
+def fetch_kline(symbol, period, size):
+    with stage("fetch", interval=period):
+        if g_ACD.getExchange() == "HTX":
+            return fetch_kline_by_HTX(symbol, period, size)
+        else:
+            return fetch_kline_by_binance(symbol, period, size)
 
 
 def get_latest_ts(conn,table):
@@ -111,34 +106,56 @@ def get_latest_ts(conn,table):
     if result and result[0]:
         if g_ACD.getExchange() == "BINANCE":        
             lastts = result[0]/1000
-            print("看一下返回的lastts",lastts)
+            logger.debug("看一下返回的lastts %s", lastts)
         else:
             lastts = result[0]
 
     return lastts
 
 
-def update_kline(conn,symbol,period):
-    table = symbol + "_" + period
+class KlineTask:
+    """一张K线表的拉取任务: plan_kline 读库生成，fetch_kline_task 只走网络，write_kline 写库"""
+    __slots__ = ("symbol", "period", "table", "last_ts")
 
-    print("处理表:",table)
+    def __init__(self, symbol, period, last_ts):
+        self.symbol = symbol
+        self.period = period
+        self.table = f"{symbol}_{period}"
+        self.last_ts = last_ts  # 库里最后一根的时间 (秒)，空表为 None
 
-    dictInterval = g_ACD.getInterval()
 
-    interval = dictInterval[period]
-    
-    last_ts = get_latest_ts(conn,table)
+def plan_kline(conn,symbol,period):
+    """读库里最后一根K线的时间；只读，表还不存在时按空表处理"""
+    table = symbol + "_" + period
+    logger.debug("处理表: %s", table)
+
+    with stage("db_read", interval=period):
+        try:
+            last_ts = get_latest_ts(conn,table)
+        except sqlite3.OperationalError:
+            last_ts = None
 
     if last_ts is not None:
-        print("本地表最后一条时间:" + ts_to_str(last_ts))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("本地表最后一条时间: %s", ts_to_str(last_ts))
     else:
-        print("本地尚无数据")
+        logger.debug("%s 本地尚无数据", table)
+    return KlineTask(symbol, period, last_ts)
+
+
+def fetch_kline_task(task):
+    """
+    拉取任务需要的新K线，不访问数据库
+    返回要写入的 DataFrame；已是最新或拉取失败时返回 None
+    """
+    table, period, last_ts = task.table, task.period, task.last_ts
+    interval = g_ACD.getInterval()[period]
 
     # 获取最新一根K线，确认当前市场时间
-    latest_df = fetch_kline(symbol, period, 1)
+    latest_df = fetch_kline(task.symbol, period, 1)
     if latest_df.empty:
-        print("❌ API返回空数据")
-        return
+        logger.warning("❌ %s API返回空数据", table)
+        return None
     
     indexname = g_ACD.getIndexName()
     latest_ts = int(latest_df.iloc[-1][indexname])
@@ -146,32 +163,64 @@ def update_kline(conn,symbol,period):
         latest_ts /= 1000        
 
 
-    print("云端数据最后一条时间:" + ts_to_str(latest_ts))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("云端数据最后一条时间: %s", ts_to_str(latest_ts))
 
     if last_ts is None:
         # 数据库为空，拉100根
-        print(f"📥{table} 表为空，拉取300根")
-        df = fetch_kline(symbol, period, 300)
-        if not df.empty:             
-            df.to_sql(table, conn, if_exists="append", index=False)
-    else:
-        # 计算缺多少根
-        missing = (latest_ts - last_ts) // interval
-        if missing <= 0:
-            print(f"{table}✅ 已是最新，无需更新")
-        else:
-            need = int(min(missing, 300))
-            print(f"{table}📥 缺少 {missing} 根，拉取 {need} 根")
-            df = fetch_kline(symbol, period, need)
-            # 过滤掉数据库里已有的数据
-            print("当前df",df)
-            if df is None or len(df) == 0:
-                print(f"未能取得{table}数据,跳过~!")
-                return
-            
-            df = df[df[indexname] > last_ts]
-            if not df.empty:
-                df.to_sql(table, conn, if_exists="append", index=False)
+        logger.info("📥%s 表为空，拉取300根", table)
+        df = fetch_kline(task.symbol, period, 300)
+        return df if not df.empty else None
+
+    # 计算缺多少根
+    missing = (latest_ts - last_ts) // interval
+    if missing <= 0:
+        logger.debug("%s✅ 已是最新，无需更新", table)
+        return None
+
+    need = int(min(missing, 300))
+    logger.debug("%s📥 缺少 %s 根，拉取 %s 根", table, missing, need)
+    df = fetch_kline(task.symbol, period, need)
+    # 过滤掉数据库里已有的数据
+    logger.debug("当前df\n%s", df)
+    if df is None or len(df) == 0:
+        logger.warning("未能取得%s数据,跳过~!", table)
+        return None
+    
+    # last_ts 是秒，币安的索引列是毫秒
+    scale = 1000 if g_ACD.getExchange() == "BINANCE" else 1
+    df = df[df[indexname] > round(last_ts * scale)]
+    return df if not df.empty else None
+
+
+def write_kline(conn, task, df, commit=True):
+    """新K线写入K线表并更新物化指标；commit=False 时由调用方批量提交。返回写入根数"""
+    if df is None or df.empty:
+        return 0
+    columns = ", ".join(f'"{c}"' for c in df.columns)
+    placeholders = ", ".join("?" * len(df.columns))
+    with stage("db_write", interval=task.period):
+        conn.executemany(f'INSERT OR REPLACE INTO "{task.table}" ({columns}) VALUES ({placeholders})',
+                         df.itertuples(index=False, name=None))
+        if commit:
+            conn.commit()
+    update_table_indicators(conn, task.table, task.symbol, task.period, commit)
+    return len(df)
+
+
+def update_kline(conn,symbol,period):
+    task = plan_kline(conn, symbol, period)
+    write_kline(conn, task, fetch_kline_task(task))
+
+
+def update_table_indicators(conn, table, symbol, period, commit=True):
+    """新K线入库后顺带更新物化指标，只计算新增的K线"""
+    try:
+        with stage("indicator", interval=period):
+            update_indicators(conn, table, symbol, period, g_ACD.getIndexName(), commit=commit)
+    except Exception as e:
+        # 指标只是加速用的缓存，失败不影响K线入库，读取方会回退到现算
+        logger.warning("%s 指标更新失败: %s", table, e)
     
 
 PERIOD_INTERVAL = {
@@ -195,7 +244,8 @@ def update_all_kline(symbol,conn):
     for period in dictInterval.keys():
         tabel = f"{symbol}_{period}"
         init_table(conn,tabel)
-        update_kline(conn,symbol,period)
+        with profile_target(symbol, period):
+            update_kline(conn,symbol,period)
     
 
 HOT_SYMBOLS = [
@@ -208,31 +258,16 @@ HOT_SYMBOLS = [
 
 def update_all_symbol():
     conn = sqlite3.connect(g_ACD.getDB()) 
-    for symbol in HOT_SYMBOLS:
+    # 优先用流动性排名 (SymbolRank)，还没有排名时用上面的固定列表
+    for symbol in hot_symbols(conn, n=len(HOT_SYMBOLS), fallback=HOT_SYMBOLS):
         update_all_kline(symbol,conn)
 
     conn.close()
 
 def get_all_symbols_from_net(conn):
-    url = "https://api.huobi.pro/v1/common/symbols"
-    resp = requests.get(url)
-    data = resp.json()
-    if data["status"] == "ok":
-        symbols = [item["symbol"] for item in data["data"]]
-        symbolsdata = data["data"]
-        # print("拉取结果",symbolsdata)
-
-        df = pd.DataFrame(symbolsdata) 
-        df = df[["symbol", "symbol-partition", "state", "api-trading"]]
-        print("所有数据",df)
-        
-        if not df.empty:                        
-            df.to_sql(SYMBOLS_TALBE, conn, if_exists="replace", index=True)    
-            print(f"已向数据库写入{len(df)}条数据")
-
-        return symbols
-    else:
-        raise Exception(f"API error: {data}")
+    """刷新 HTX 交易对注册表，返回可交易的交易对"""
+    refresh_symbols(conn, "HTX")
+    return [symbol for _, symbol in active_symbols(conn, "HTX")]
     
 def get_all_symbols_from_database(conn):
     query = f"SELECT symbol, state {SYMBOLS_TALBE} ORDER BY ts DESC LIMIT {limit+2}"
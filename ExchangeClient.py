@@ -0,0 +1,255 @@
+"""
+所有交易所 REST 请求共用的客户端
+
+1. 连接池 + keep-alive：同一个 host 的请求复用 TCP/TLS 连接，不再每次重新握手
+2. 可选 HTTP/2：装了 httpx[http2] 且设置 EXCHANGE_HTTP2=1 时启用
+3. gzip：显式声明 Accept-Encoding，K线 JSON 压缩后传输量大约少一个数量级
+4. 统一重试：连接错误 / 超时 / 429 / 5xx 指数退避重试，优先使用服务端的 Retry-After
+5. 按交易所权重预算限流 (RateLimiter)，多个进程共享预算，调用方不需要自己 sleep
+6. 按 host 统计请求数、错误数、重试数、耗时和限流等待时间
+7. 每个交易所各用一个客户端 (各自的连接池和统计)，g_client 按当前交易所 (g_ACD) 分发
+
+用法:
+    from ExchangeClient import g_client
+    resp = g_client.get(url, params=params)
+    resp = g_client.post(url, json=payload)
+"""
+import os
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from RateLimiter import limiter_for_url
+from ConstDef import g_ACD
+
+try:
+    import httpx
+    import h2  # noqa: F401  httpx 的 HTTP/2 依赖
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger("exchange_client")
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+POOL_SIZE = 16
+
+# 需要重试的状态码；418 是币安的封禁，重试只会延长封禁时间，不重试
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HostStats:
+    __slots__ = ("count", "errors", "retries", "total", "max", "last", "throttled")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.throttled = 0.0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 2),
+            "last_ms": round(self.last * 1000, 2),
+            "throttled_s": round(self.throttled, 3),
+        }
+
+
+class ExchangeClient:
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=BACKOFF_BASE,
+                 max_backoff=BACKOFF_MAX, pool_size=POOL_SIZE, http2=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        if http2 is None:
+            http2 = os.environ.get("EXCHANGE_HTTP2") == "1"
+        self.http2 = bool(http2 and httpx is not None)
+
+        if self.http2:
+            self.session = httpx.Client(
+                http2=True, timeout=timeout,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+        else:
+            self.session = requests.Session()
+            # 重试由下面统一处理，adapter 不再重试
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    # ---------------------------------------------------------
+    # 请求
+    # ---------------------------------------------------------
+    def request(self, method, url, params=None, json=None, headers=None, timeout=None, retries=None):
+        """
+        发送请求，失败按策略重试。
+        返回最后一次的响应 (状态码由调用方判断)；重试用尽仍是连接错误时抛出最后一个异常
+        """
+        parts = urlsplit(url)
+        host = parts.netloc
+        retries = self.retries if retries is None else retries
+        timeout = timeout or self.timeout
+        limiter = limiter_for_url(url)
+        weight = limiter.weight(parts.path, params, json) if limiter else 0
+
+        for attempt in range(retries + 1):
+            if limiter:
+                waited = limiter.acquire(weight)
+                if waited:
+                    self._record_wait(host, waited)
+            sent_at = time.time()
+            t0 = time.perf_counter()
+            try:
+                resp = self.session.request(method, url, params=params, json=json, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) + _httpx_errors() as e:
+                self._record(host, time.perf_counter() - t0, error=True)
+                if attempt >= retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.debug("%s %s 失败 (%s)，%.2fs 后重试", method, url, e, delay)
+            else:
+                self._record(host, time.perf_counter() - t0, error=resp.status_code >= 400)
+                if limiter:
+                    limiter.observe(resp.status_code, resp.headers, sent_at)
+                if resp.status_code not in RETRY_STATUS or attempt >= retries:
+                    return resp
+                delay = self._retry_after(resp) or self._backoff(attempt)
+                logger.info("%s %s 返回 %s，%.2fs 后重试", method, url, resp.status_code, delay)
+
+            with self._lock:
+                self._stats[host].retries += 1
+            time.sleep(delay)
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, json=None, **kwargs):
+        return self.request("POST", url, json=json, **kwargs)
+
+    def _backoff(self, attempt):
+        # 指数退避 + 抖动，避免多个进程同时重试
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def _retry_after(self, resp):
+        value = resp.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return min(self.max_backoff, max(0.0, float(value)))
+        except ValueError:
+            return None
+
+    # ---------------------------------------------------------
+    # 统计
+    # ---------------------------------------------------------
+    def _record(self, host, elapsed, error=False):
+        with self._lock:
+            s = self._stats.get(host)
+            if s is None:
+                s = self._stats[host] = HostStats()
+            s.count += 1
+            s.total += elapsed
+            s.last = elapsed
+            if elapsed > s.max:
+                s.max = elapsed
+            if error:
+                s.errors += 1
+
+    def _record_wait(self, host, waited):
+        with self._lock:
+            s = self._stats.get(host)
+            if s is None:
+                s = self._stats[host] = HostStats()
+            s.throttled += waited
+
+    def stats(self):
+        """{host: {count, errors, retries, avg_ms, max_ms, last_ms, throttled_s}}"""
+        with self._lock:
+            return {host: s.as_dict() for host, s in self._stats.items()}
+
+    def log_stats(self):
+        for host, s in sorted(self.stats().items()):
+            logger.info("%s 请求=%s 错误=%s 重试=%s 平均=%.2fms 最大=%.2fms 限流等待=%.1fs",
+                        host, s["count"], s["errors"], s["retries"], s["avg_ms"], s["max_ms"], s["throttled_s"])
+
+    def close(self):
+        self.session.close()
+
+
+def _httpx_errors():
+    if httpx is None:
+        return ()
+    return (httpx.TransportError,)
+
+
+class ClientRouter:
+    """
+    按当前交易所分发到各自的 ExchangeClient
+    g_ACD 的交易所按线程 / 任务区分，所以同一进程里多个交易所的请求不共用连接池
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def client(self, exchange=None):
+        exchange = exchange or g_ACD.getExchange()
+        with self._lock:
+            c = self._clients.get(exchange)
+            if c is None:
+                c = self._clients[exchange] = ExchangeClient(**self._kwargs)
+            return c
+
+    def request(self, method, url, **kwargs):
+        return self.client().request(method, url, **kwargs)
+
+    def get(self, url, params=None, **kwargs):
+        return self.client().get(url, params=params, **kwargs)
+
+    def post(self, url, json=None, **kwargs):
+        return self.client().post(url, json=json, **kwargs)
+
+    def stats(self):
+        """所有交易所客户端合并后的 {host: {...}}"""
+        with self._lock:
+            clients = list(self._clients.values())
+        out = {}
+        for c in clients:
+            out.update(c.stats())
+        return out
+
+    def log_stats(self):
+        with self._lock:
+            clients = list(self._clients.values())
+        for c in clients:
+            c.log_stats()
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for c in clients:
+            c.close()
+
+
+g_client = ClientRouter()
@@ -0,0 +1,141 @@
+"""
+交易所适配器注册表: 一个进程同时驱动多个交易所
+
+以前每个交易所单独起一个进程 (g_ACD 由 sys.argv 设一次)，现在每个交易所一个 ExchangeAdapter，
+各自持有:
+    - 客户端 (独立连接池和请求统计，见 ExchangeClient.ClientRouter)
+    - 限流器 (RateLimiter，多进程共享同一份预算)
+    - 周期表、索引列、接口地址 (ConstDef.ALL_CONST)
+    - 存储命名空间: 数据库文件，以及断点续扫等状态文件加交易所后缀
+
+adapter.activate() 把当前线程 / 任务的 g_ACD 切到该交易所，里面调用的 DatabaseUpdate、
+SymbolRegistry、SymbolRank 等模块不用改，扫描流水线 (指标计算、信号检查) 在进程内共用。
+
+用法:
+    from ExchangeRegistry import g_exchanges
+    threads = g_exchanges.run_concurrently(["BINANCE", "HTX"], scan_loop)
+"""
+import os
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from ConstDef import ALL_CONST, g_ACD, api_url
+from ExchangeClient import g_client
+from RateLimiter import get_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def scannable(name):
+    """有交易对注册表 (Table_symbols) 的交易所才能跑扫描；Hyperliquid 的数据由 MarketDataManager 单独管理"""
+    return "Table_symbols" in ALL_CONST.get(name, {})
+
+
+class ExchangeAdapter:
+    def __init__(self, name):
+        if name not in ALL_CONST:
+            raise KeyError(f"未知交易所: {name}")
+        self.name = name
+        self.conf = ALL_CONST[name]
+        self.client = g_client.client(name)
+        self._limiter = None
+
+    @property
+    def db_path(self):
+        return self.conf["DB"]
+
+    @property
+    def intervals(self):
+        return self.conf["interval"]
+
+    @property
+    def indexname(self):
+        return self.conf["indexname"]
+
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            self._limiter = get_limiter(self.name)
+        return self._limiter
+
+    def api_url(self, path):
+        return api_url(self.name, path)
+
+    @contextmanager
+    def activate(self):
+        """当前线程 / 任务内 g_ACD 指向本交易所"""
+        with g_ACD.use(self.name):
+            yield self
+
+    def connect(self):
+        """本交易所数据库的新连接 (sqlite 连接不跨线程，每个线程各开一个)"""
+        return sqlite3.connect(self.db_path)
+
+    def state_file(self, filename):
+        """状态文件按交易所区分: lastIndex.txt -> lastIndex.binance.txt"""
+        stem, ext = os.path.splitext(filename)
+        return f"{stem}.{self.name.lower()}{ext}"
+
+    def __repr__(self):
+        return f"ExchangeAdapter({self.name!r})"
+
+
+class ExchangeRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._adapters = {}
+
+    def get(self, name):
+        with self._lock:
+            adapter = self._adapters.get(name)
+            if adapter is None:
+                adapter = self._adapters[name] = ExchangeAdapter(name)
+            return adapter
+
+    def current(self):
+        """当前上下文 (g_ACD) 的交易所"""
+        return self.get(g_ACD.getExchange())
+
+    def names(self):
+        """可以扫描的交易所"""
+        return [name for name in ALL_CONST if scannable(name)]
+
+    def run_concurrently(self, names, target, daemon=True):
+        """
+        每个交易所起一个线程，在 adapter.activate() 里执行 target(adapter)
+        返回已启动的线程列表
+        """
+        threads = []
+        for name in names:
+            adapter = self.get(name)
+            t = threading.Thread(target=self._run, args=(adapter, target),
+                                 name=f"scan-{name}", daemon=daemon)
+            t.start()
+            threads.append(t)
+        return threads
+
+    @staticmethod
+    def _run(adapter, target):
+        with adapter.activate():
+            try:
+                target(adapter)
+            except Exception:
+                logger.exception("%s 扫描线程异常退出", adapter.name)
+
+
+def parse_exchanges(arg, default="BINANCE"):
+    """
+    命令行参数 "BINANCE,HTX" -> ["BINANCE", "HTX"]；无法识别的忽略
+    已知但没有交易对注册表的交易所 (如 HYPERLIQUID) 抛 ValueError，不然扫描线程一启动就会 KeyError 退出
+    """
+    names = [s.strip().upper() for s in (arg or "").split(",") if s.strip()]
+    unsupported = [n for n in names if n in ALL_CONST and not scannable(n)]
+    if unsupported:
+        raise ValueError(f"{', '.join(unsupported)} 没有交易对注册表，不支持扫描 (可选: {', '.join(g_exchanges.names())})")
+    names = [n for n in names if n in ALL_CONST]
+    return list(dict.fromkeys(names)) or [default]
+
+
+g_exchanges = ExchangeRegistry()
@@ -0,0 +1,267 @@
+"""
+K线指标物化层
+
+K线入库时顺带算好常用指标，按 (symbol, interval, version, ts) 存到 kline_indicators 表，
+扫描程序直接读现成的列，不再各自从收盘价重算。
+
+指标集 (INDICATOR_VERSION = 1):
+    ema7 / ema12 / ema25 / ema26 / ema99 / ema255   EMA(adjust=False)
+    macd_dif / macd_dea / macd_hist                  MACD(12,26,9)，hist = dif - dea
+    rsi14                                            Wilder RSI(14)
+    boll_mid / boll_upper / boll_lower               BOLL(20, 2)，与 RollingWindow.bollinger 一致
+
+每张表在 indicator_state 里保存上一根的状态 (各 EMA、DEA、RSI 平均涨跌、布林带窗口内的收盘价)，
+新K线只从状态接着算，不回头重算历史；布林带的增量部分用 RollingWindow.RollingStats。
+修改指标集时把 INDICATOR_VERSION 加一，旧版本数据自动失效。
+
+注意: EMA 从表里第一根K线开始一直累积，和"只取最近 300 根重新算"的结果在前几十根会略有差异，
+越往后越一致 (与交易所图表的算法相同)。
+"""
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from KlineArchive import load_history
+from RollingWindow import rolling_mean_std, RollingStats
+
+logger = logging.getLogger(__name__)
+
+INDICATOR_VERSION = 1
+INDICATOR_TABLE = "kline_indicators"
+STATE_TABLE = "indicator_state"
+
+EMA_SPANS = (7, 12, 25, 26, 99, 255)
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+RSI_LENGTH = 14
+BOLL_WINDOW, BOLL_STD = 20, 2.0
+
+INDICATOR_COLUMNS = ([f"ema{s}" for s in EMA_SPANS]
+                     + ["macd_dif", "macd_dea", "macd_hist", "rsi14", "boll_mid", "boll_upper", "boll_lower"])
+
+
+def init_indicator_tables(conn, commit=True):
+    cols = ",\n".join(f"        {c} REAL" for c in INDICATOR_COLUMNS)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {INDICATOR_TABLE} (
+        symbol TEXT,
+        interval TEXT,
+        version INTEGER,
+        ts INTEGER,           -- 与K线表索引列相同 (Binance 毫秒 / HTX 秒)
+{cols},
+        PRIMARY KEY (symbol, interval, version, ts)
+    )
+    """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+        symbol TEXT,
+        interval TEXT,
+        version INTEGER,
+        last_ts INTEGER,
+        state TEXT,           -- JSON
+        PRIMARY KEY (symbol, interval, version)
+    )
+    """)
+    if commit:
+        conn.commit()
+
+
+# ---------------------------------------------------------
+# 计算
+# ---------------------------------------------------------
+def _ewm_continue(values, alpha, seed=None):
+    """adjust=False 的 EMA；seed 为上一根的 EMA 值时从它接着算"""
+    s = pd.Series(values, dtype=float)
+    if seed is None:
+        return s.ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    s = pd.concat([pd.Series([seed], dtype=float), s], ignore_index=True)
+    return s.ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+def _wilder_rsi(close, state):
+    """
+    Wilder RSI。首个值用前 RSI_LENGTH 根涨跌的简单平均，之后 avg = (prev * (n-1) + x) / n
+    state: {'prev_close', 'avg_gain', 'avg_loss', 'n_delta', 'gains', 'losses'}，会被原地更新
+    """
+    n = len(close)
+    rsi = np.full(n, np.nan)
+    prev_close = state.get("prev_close")
+    full = np.concatenate(([prev_close], close)) if prev_close is not None else close
+    delta = np.diff(full)
+    offset = n - len(delta)  # 没有上一根时第一根K线没有涨跌
+    gain = np.clip(delta, 0, None)
+    loss = np.clip(-delta, 0, None)
+    alpha = 1.0 / RSI_LENGTH
+
+    i = 0
+    # 预热阶段: 攒够 RSI_LENGTH 个涨跌再取平均
+    if state.get("avg_gain") is None:
+        gains = state.get("gains", []) + gain.tolist()
+        losses = state.get("losses", []) + loss.tolist()
+        need = RSI_LENGTH - len(state.get("gains", []))
+        if len(gains) < RSI_LENGTH:
+            state.update(gains=gains, losses=losses)
+            state["prev_close"] = float(close[-1]) if n else prev_close
+            return rsi
+        state["avg_gain"] = float(np.mean(gains[:RSI_LENGTH]))
+        state["avg_loss"] = float(np.mean(losses[:RSI_LENGTH]))
+        state.pop("gains", None)
+        state.pop("losses", None)
+        i = need
+        rsi[offset + i - 1] = _rsi_value(state["avg_gain"], state["avg_loss"])
+
+    if i < len(delta):
+        ag = _ewm_continue(gain[i:], alpha, state["avg_gain"])
+        al = _ewm_continue(loss[i:], alpha, state["avg_loss"])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi[offset + i:] = np.where(al == 0, np.where(ag == 0, 50.0, 100.0), 100 - 100 / (1 + ag / al))
+        state["avg_gain"], state["avg_loss"] = float(ag[-1]), float(al[-1])
+
+    state["prev_close"] = float(close[-1]) if n else prev_close
+    return rsi
+
+
+def _rsi_value(avg_gain, avg_loss):
+    if avg_loss == 0:
+        return 50.0 if avg_gain == 0 else 100.0
+    return 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+def compute_indicators(close, state=None):
+    """
+    从上一根的状态接着计算一批新K线的指标
+    close: 新K线的收盘价 (按时间升序)
+    返回 (DataFrame[INDICATOR_COLUMNS], new_state)
+    """
+    close = np.asarray(close, dtype=float)
+    state = json.loads(json.dumps(state)) if state else {}
+    ema_state = state.get("ema", {})
+    out = {}
+
+    for span in EMA_SPANS:
+        out[f"ema{span}"] = _ewm_continue(close, 2.0 / (span + 1), ema_state.get(str(span)))
+        if len(close):
+            ema_state[str(span)] = float(out[f"ema{span}"][-1])
+    state["ema"] = ema_state
+
+    dif = out[f"ema{MACD_FAST}"] - out[f"ema{MACD_SLOW}"]
+    dea = _ewm_continue(dif, 2.0 / (MACD_SIGNAL + 1), state.get("dea"))
+    out["macd_dif"], out["macd_dea"], out["macd_hist"] = dif, dea, dif - dea
+    if len(close):
+        state["dea"] = float(dea[-1])
+
+    rsi_state = state.get("rsi", {})
+    out["rsi14"] = _wilder_rsi(close, rsi_state)
+    state["rsi"] = rsi_state
+
+    # 布林带: 没有状态时整段用两遍法批量算；之后从状态里的窗口接着用 RollingStats 逐根推进，每根 O(1)
+    tail = state.pop("boll_tail", None)  # 旧格式的状态只存了最近 19 根收盘价
+    if "boll" in state or tail is not None:
+        stats = RollingStats.from_state(state.get("boll") or {"window": BOLL_WINDOW, "buf": tail})
+        mid = np.full(len(close), np.nan)
+        std = np.full(len(close), np.nan)
+        for i, x in enumerate(close):
+            stats.push(x)
+            if stats.ready:
+                mid[i], std[i] = stats.mean, stats.std
+    else:
+        mid, std = rolling_mean_std(close, BOLL_WINDOW)
+        stats = RollingStats.from_state({"window": BOLL_WINDOW, "buf": close[-BOLL_WINDOW:].tolist()})
+    out["boll_mid"] = mid
+    out["boll_upper"] = mid + BOLL_STD * std
+    out["boll_lower"] = mid - BOLL_STD * std
+    state["boll"] = stats.state()
+
+    return pd.DataFrame(out, columns=INDICATOR_COLUMNS), state
+
+
+# ---------------------------------------------------------
+# 入库
+# ---------------------------------------------------------
+def load_state(conn, symbol, interval):
+    row = conn.execute(
+        f"SELECT last_ts, state FROM {STATE_TABLE} WHERE symbol=? AND interval=? AND version=?",
+        (symbol, interval, INDICATOR_VERSION)).fetchone()
+    if row is None:
+        return None, None
+    return row[0], json.loads(row[1])
+
+
+def update_indicators(conn, table, symbol, interval, indexname, commit=True):
+    """
+    K线表写入新数据后调用: 只计算 last_ts 之后的新K线，写入指标表并保存状态
+    commit=False 时不提交，由调用方和K线一起批量提交
+    返回新计算的K线数
+    """
+    init_indicator_tables(conn, commit)
+    last_ts, state = load_state(conn, symbol, interval)
+
+    if last_ts is None:
+        # 从头算: 较早的K线可能已移入归档，经 load_history 读归档 + 原表的完整历史
+        history = load_history(conn, symbol, interval, columns=["close"])
+        ts, close = history[indexname].tolist(), history["close"]
+    else:
+        rows = conn.execute(f'SELECT {indexname}, close FROM "{table}" WHERE {indexname} > ? ORDER BY {indexname}',
+                            (last_ts,)).fetchall()
+        ts, close = [r[0] for r in rows], [r[1] for r in rows]
+    if not ts:
+        return 0
+
+    ts = [int(t) for t in ts]
+    df, state = compute_indicators(close, state)
+    df = df.astype(object).where(df.notna(), None)
+    records = [(symbol, interval, INDICATOR_VERSION, t, *vals) for t, vals in zip(ts, df.itertuples(index=False, name=None))]
+
+    placeholders = ", ".join("?" * (4 + len(INDICATOR_COLUMNS)))
+    conn.executemany(f"INSERT OR REPLACE INTO {INDICATOR_TABLE} VALUES ({placeholders})", records)
+    conn.execute(f"INSERT OR REPLACE INTO {STATE_TABLE} VALUES (?, ?, ?, ?, ?)",
+                 (symbol, interval, INDICATOR_VERSION, ts[-1], json.dumps(state)))
+    if commit:
+        conn.commit()
+    logger.debug("%s 指标新增 %s 根", table, len(ts))
+    return len(ts)
+
+
+def rebuild_indicators(conn, table, symbol, interval, indexname):
+    """丢弃当前版本的指标和状态，从头重算 (K线表被修复/回补历史后使用)，已归档的K线也包含在内"""
+    init_indicator_tables(conn)
+    for t in (INDICATOR_TABLE, STATE_TABLE):
+        conn.execute(f"DELETE FROM {t} WHERE symbol=? AND interval=? AND version=?",
+                     (symbol, interval, INDICATOR_VERSION))
+    conn.commit()
+    return update_indicators(conn, table, symbol, interval, indexname)
+
+
+# ---------------------------------------------------------
+# 读取
+# ---------------------------------------------------------
+def load_indicators(conn, symbol, interval, limit=300, columns=None):
+    """
+    读取最近 limit 根的指标，按时间升序；没有物化数据时返回空 DataFrame
+    """
+    cols = columns or INDICATOR_COLUMNS
+    query = f"""
+        SELECT * FROM (
+            SELECT ts, {", ".join(cols)} FROM {INDICATOR_TABLE}
+            WHERE symbol=? AND interval=? AND version=?
+            ORDER BY ts DESC LIMIT {int(limit)}
+        ) ORDER BY ts
+    """
+    try:
+        return pd.read_sql(query, conn, params=(symbol, interval, INDICATOR_VERSION))
+    except Exception:
+        # 还没有建表
+        return pd.DataFrame(columns=["ts", *cols])
+
+
+def is_current(conn, table, symbol, interval, indexname):
+    """指标是否已经算到K线表的最后一根"""
+    try:
+        last_ts, _ = load_state(conn, symbol, interval)
+    except Exception:
+        return False
+    if last_ts is None:
+        return False
+    row = conn.execute(f'SELECT MAX({indexname}) FROM "{table}"').fetchone()
+    return row is not None and row[0] == last_ts
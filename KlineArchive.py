@@ -0,0 +1,406 @@
+"""
+K线冷数据归档
+
+K线表每根一行、11 个 REAL/INTEGER 列，多年的 5 分钟线占用大、回测时整表读出也慢。
+这里把较早的K线按 BLOCK_BARS 根一块压缩存进 kline_archive 表，最近 HOT_BARS 根仍留在原表，
+扫描和增量更新的逻辑都不受影响。
+
+哪些读取方会看到归档:
+    - 需要完整历史的 (IndicatorStore 从头计算 / rebuild_indicators、CrossExchange) 经 load_history 读归档 + 原表
+    - 只读最近几百根的扫描程序直接读原表；archive_table 保证原表至少留 MIN_HOT_BARS 根，
+      新增这类读取方时根数不能超过 MIN_HOT_BARS，否则改用 load_history
+
+块内编码 (每列独立编码、按字节重排后单独 zlib，读取时可以只解需要的列):
+    时间       首值 + 差分 (间隔固定时差分全相同，压缩后几乎不占空间)
+    价格       按精度放大成整数 (精度由数据本身推出，相当于交易对的 tickSize)，
+               close 存差分，open/high/low 存相对 close 的差值
+    成交量类   能无损放大成整数的存整数，否则原样存 float64
+    整数列     原样存整数
+    整数一律选能放下的最小类型 (int8/16/32/64)
+    close_time 总是 open_time + 周期 - 1，不单独存 (不满足时才存)
+
+编码无损: 解码出来的浮点数与原表逐位相同。
+
+用法:
+    load_history(conn, symbol, interval)         # 归档 + 原表，返回 {列名: numpy 数组}
+    load_history(conn, symbol, interval, columns=["close"])   # 只解需要的列
+    archive_table(conn, symbol, interval)         # 把较早的K线移入归档
+    python KlineArchive.py [BINANCE|HTX] [--keep N] [--vacuum]
+"""
+import sys
+import json
+import zlib
+import logging
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from ConstDef import ALL_CONST, g_ACD
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_TABLE = "kline_archive"
+BLOCK_BARS = 4096
+HOT_BARS = 2000
+# 原表至少保留的根数。扫描程序只从原表读最后几百根，不经过归档:
+#   ScanSnapshot.load_symbol (SNAPSHOT_BARS=302)、CheckByEMA (limit+2=302, SCREEN_BARS=302)、
+#   CheckbyBoll.check_bollinger_breakout_by_kline (limit+2)、ScanAllData.check_data4OneTable (收敛只看最近几十根)
+MIN_HOT_BARS = 302
+ZLIB_LEVEL = 6
+# 价格/成交量最多放大到 10^MAX_EXP；放大后的整数不超过 2^53，保证能和 float64 互相精确转换
+MAX_EXP = 16
+INT_LIMIT = 2 ** 53
+
+# 各交易所K线表的列: 时间列、价格列、成交量类列、整数列、可推导的列、时间单位 (每秒多少)
+ARCHIVE_SPEC = {
+    "BINANCE": {
+        "time": "open_time",
+        "prices": ["open", "high", "low", "close"],
+        "scaled": ["volume", "quote_asset_volume", "taker_base_vol", "taker_quote_vol"],
+        "ints": ["num_trades"],
+        "derived": ["close_time"],
+        "scale": 1000,
+    },
+    "HTX": {
+        "time": "ts",
+        "prices": ["open", "high", "low", "close"],
+        "scaled": ["amount", "vol"],
+        "ints": ["count"],
+        "derived": [],
+        "scale": 1,
+    },
+}
+
+
+def init_archive_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+        symbol TEXT,
+        interval TEXT,
+        start_ts INTEGER,     -- 块内第一根 / 最后一根的时间 (与K线表索引列单位相同)
+        end_ts INTEGER,
+        n INTEGER,
+        meta TEXT,            -- JSON: 每列的编码方式、类型、放大倍数
+        data BLOB,
+        PRIMARY KEY (symbol, interval, start_ts)
+    )
+    """)
+    conn.commit()
+
+
+def spec_columns(exchange):
+    spec = ARCHIVE_SPEC[exchange]
+    return [spec["time"], *spec["prices"], *spec["scaled"], *spec["ints"], *spec["derived"]]
+
+
+# ---------------------------------------------------------
+# 编码
+# ---------------------------------------------------------
+def _pack_int(values):
+    """整数数组 -> (dtype 名, bytes)，选能放下的最小类型"""
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) == 0:
+        return "int8", b""
+    lo, hi = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype).name, values.astype(dtype).tobytes()
+    return "int64", values.tobytes()
+
+
+def scale_exp(values, max_exp=MAX_EXP):
+    """能把 values 无损放大成整数的最小 10 的幂次；做不到 (含 NaN、太大) 时返回 None"""
+    x = np.asarray(values, dtype=float)
+    if len(x) == 0:
+        return 0
+    if not np.isfinite(x).all():
+        return None
+    for e in range(max_exp + 1):
+        factor = 10.0 ** e
+        scaled = np.round(x * factor)
+        if np.abs(scaled).max() >= INT_LIMIT:
+            return None
+        if np.array_equal(scaled / factor, x):
+            return e
+    return None
+
+
+def encode_block(frame, exchange, interval_sec):
+    """
+    frame: {列名: numpy 数组}，按时间升序
+    返回 (meta dict, 压缩后的 bytes)
+    """
+    spec = ARCHIVE_SPEC[exchange]
+    cols = []
+    chunks = []
+
+    def add(name, enc, payload, **extra):
+        dtype, raw = payload if isinstance(payload, tuple) else ("float64", payload)
+        packed = zlib.compress(_shuffle(raw, np.dtype(dtype).itemsize), ZLIB_LEVEL)
+        cols.append({"name": name, "enc": enc, "dtype": dtype, "size": len(packed), **extra})
+        chunks.append(packed)
+
+    t = np.asarray(frame[spec["time"]], dtype=np.int64)
+    add(spec["time"], "delta", _pack_int(np.diff(t)), base=int(t[0]))
+
+    prices = [np.asarray(frame[c], dtype=float) for c in spec["prices"]]
+    exps = [scale_exp(p) for p in prices]
+    if all(e is not None for e in exps):
+        e = max(exps)
+        factor = 10.0 ** e
+        close_i = np.round(prices[-1] * factor).astype(np.int64)
+        for name, p in zip(spec["prices"][:-1], prices[:-1]):
+            add(name, "rel_close", _pack_int(np.round(p * factor).astype(np.int64) - close_i), exp=e)
+        add(spec["prices"][-1], "delta_scaled", _pack_int(np.diff(close_i)), exp=e, base=int(close_i[0]))
+    else:
+        for name, p in zip(spec["prices"], prices):
+            add(name, "float", p.astype(np.float64).tobytes())
+
+    for name in spec["scaled"]:
+        x = np.asarray(frame[name], dtype=float)
+        e = scale_exp(x)
+        if e is None:
+            add(name, "float", x.astype(np.float64).tobytes())
+        else:
+            add(name, "scaled", _pack_int(np.round(x * 10.0 ** e).astype(np.int64)), exp=e)
+
+    for name in spec["ints"]:
+        x = np.asarray(frame[name], dtype=float)
+        if np.isfinite(x).all():
+            add(name, "int", _pack_int(x.astype(np.int64)))
+        else:
+            # 有缺失值 (NULL) 时按浮点存，保留 NaN
+            add(name, "float", x.tobytes())
+
+    # close_time 与推导值不一致时才存
+    for name in spec["derived"]:
+        expected = t + interval_sec * spec["scale"] - 1
+        actual = np.asarray(frame[name], dtype=float)
+        if not np.array_equal(actual, expected):
+            add(name, "float", actual.tobytes())
+
+    meta = {"n": int(len(t)), "interval_sec": interval_sec, "cols": cols}
+    return meta, b"".join(chunks)
+
+
+def _shuffle(raw, itemsize):
+    """按字节重排: 所有值的第 1 个字节放在一起、第 2 个字节放在一起...，高位字节大多相同，压缩率更高"""
+    if itemsize == 1 or not raw:
+        return raw
+    return np.frombuffer(raw, dtype=np.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def _unshuffle(raw, itemsize):
+    if itemsize == 1 or not raw:
+        return raw
+    return np.frombuffer(raw, dtype=np.uint8).reshape(itemsize, -1).T.tobytes()
+
+
+def decode_block(meta, blob, exchange, columns=None):
+    """encode_block 的逆过程，返回 {列名: numpy 数组}；columns 指定时只解这些列"""
+    spec = ARCHIVE_SPEC[exchange]
+    n = meta["n"]
+    wanted = None
+    if columns is not None:
+        wanted = set(columns)
+        # open/high/low 依赖 close，close_time 依赖时间列
+        if wanted & set(spec["prices"]):
+            wanted.add(spec["prices"][-1])
+        if wanted & set(spec["derived"]):
+            wanted.add(spec["time"])
+    out = {}
+    pos = 0
+    rel = {}
+    for col in meta["cols"]:
+        start, pos = pos, pos + col["size"]
+        if wanted is not None and col["name"] not in wanted:
+            continue
+        dtype = np.dtype(col["dtype"])
+        raw = _unshuffle(zlib.decompress(blob[start:pos]), dtype.itemsize)
+        arr = np.frombuffer(raw, dtype=dtype)
+        enc = col["enc"]
+        if enc in ("delta", "delta_scaled"):
+            values = np.empty(n, dtype=np.int64)
+            values[0] = col["base"]
+            np.cumsum(arr, dtype=np.int64, out=values[1:])
+            values[1:] += col["base"]
+            if enc == "delta":
+                out[col["name"]] = values
+            else:
+                close_i = values
+                out[col["name"]] = close_i / 10.0 ** col["exp"]
+                for name, (r, e) in rel.items():
+                    out[name] = (r.astype(np.int64) + close_i) / 10.0 ** e
+        elif enc == "rel_close":
+            rel[col["name"]] = (arr, col["exp"])
+        elif enc == "scaled":
+            out[col["name"]] = arr.astype(np.int64) / 10.0 ** col["exp"]
+        elif enc == "int":
+            out[col["name"]] = arr.astype(np.int64)
+        else:
+            out[col["name"]] = arr.astype(np.float64)
+
+    for name in spec["derived"]:
+        if name not in out and spec["time"] in out:
+            out[name] = out[spec["time"]] + meta["interval_sec"] * spec["scale"] - 1
+    if wanted is not None:
+        out = {c: v for c, v in out.items() if c in columns}
+    return out
+
+
+# ---------------------------------------------------------
+# 归档
+# ---------------------------------------------------------
+def archive_table(conn, symbol, interval, exchange=None, keep=HOT_BARS, block=BLOCK_BARS):
+    """
+    把 symbol_interval 表里除最近 keep 根以外的K线按整块移入归档，返回归档的根数
+    keep 小于 MIN_HOT_BARS 时抛 ValueError，扫描程序只读原表的最后几百根
+    """
+    if keep < MIN_HOT_BARS:
+        raise ValueError(f"keep={keep} 小于 MIN_HOT_BARS={MIN_HOT_BARS}，扫描程序会读不到足够的K线")
+    exchange = exchange or g_ACD.getExchange()
+    spec = ARCHIVE_SPEC[exchange]
+    table = f"{symbol}_{interval}"
+    interval_sec = ALL_CONST[exchange]["interval"][interval]
+    tcol = spec["time"]
+    init_archive_table(conn)
+
+    total = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    n_blocks = max(0, total - keep) // block
+    if n_blocks == 0:
+        return 0
+
+    # 旧表里可能有 to_sql 写入的 TEXT，读出时统一转成数值
+    int_cols = {tcol, *spec["ints"], *spec["derived"]}
+    select = ", ".join(f"CAST({c} AS {'INTEGER' if c in int_cols else 'REAL'}) AS {c}" for c in spec_columns(exchange))
+    data = pd.read_sql(f'SELECT {select} FROM "{table}" ORDER BY {tcol} LIMIT {n_blocks * block}', conn)
+
+    records = []
+    for b in range(n_blocks):
+        part = data.iloc[b * block:(b + 1) * block]
+        frame = {c: part[c].to_numpy() for c in part.columns}
+        meta, blob = encode_block(frame, exchange, interval_sec)
+        ts = frame[tcol]
+        records.append((symbol, interval, int(ts[0]), int(ts[-1]), len(ts), json.dumps(meta), blob))
+
+    last_ts = records[-1][3]
+    conn.executemany(f"INSERT OR REPLACE INTO {ARCHIVE_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+    conn.execute(f'DELETE FROM "{table}" WHERE {tcol} <= ?', (last_ts,))
+    conn.commit()
+    logger.info("%s 归档 %s 根 (%s 块)", table, n_blocks * block, n_blocks)
+    return n_blocks * block
+
+
+def archive_all(conn, exchange=None, keep=HOT_BARS):
+    exchange = exchange or g_ACD.getExchange()
+    periods = ALL_CONST[exchange]["interval"]
+    total = 0
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+        symbol, _, period = name.rpartition("_")
+        if symbol and period in periods:
+            total += archive_table(conn, symbol, period, exchange, keep)
+    return total
+
+
+# ---------------------------------------------------------
+# 读取
+# ---------------------------------------------------------
+def _wanted_columns(exchange, columns):
+    """要读的列，时间列总是包含在内"""
+    tcol = ARCHIVE_SPEC[exchange]["time"]
+    if columns is None:
+        return spec_columns(exchange)
+    return [tcol] + [c for c in columns if c != tcol]
+
+
+def read_archive(conn, symbol, interval, exchange=None, start=None, end=None, columns=None):
+    """
+    只读归档部分，返回 {列名: numpy 数组}
+    start/end 与K线表索引列单位相同 (含两端)；columns 为空时读全部列
+    """
+    exchange = exchange or g_ACD.getExchange()
+    cols = _wanted_columns(exchange, columns)
+    query = f"SELECT meta, data FROM {ARCHIVE_TABLE} WHERE symbol=? AND interval=?"
+    params = [symbol, interval]
+    if start is not None:
+        query += " AND end_ts >= ?"
+        params.append(int(start))
+    if end is not None:
+        query += " AND start_ts <= ?"
+        params.append(int(end))
+    try:
+        rows = conn.execute(query + " ORDER BY start_ts", params).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+
+    blocks = [decode_block(json.loads(meta), blob, exchange, cols) for meta, blob in rows]
+    if not blocks:
+        return {c: np.empty(0, dtype=np.int64 if c == ARCHIVE_SPEC[exchange]["time"] else float) for c in cols}
+    out = {c: np.concatenate([b[c] for b in blocks]) for c in cols}
+    return _slice(out, ARCHIVE_SPEC[exchange]["time"], start, end)
+
+
+def _slice(frame, tcol, start, end):
+    t = frame[tcol]
+    lo = 0 if start is None else np.searchsorted(t, start, side="left")
+    hi = len(t) if end is None else np.searchsorted(t, end, side="right")
+    if lo == 0 and hi == len(t):
+        return frame
+    return {c: v[lo:hi] for c, v in frame.items()}
+
+
+def load_history(conn, symbol, interval, exchange=None, start=None, end=None, columns=None, as_frame=False):
+    """
+    归档 + 原表合并后的完整历史，按时间升序；两边重复的K线以原表为准
+    返回 {列名: numpy 数组}，as_frame=True 时返回 DataFrame
+    """
+    exchange = exchange or g_ACD.getExchange()
+    spec = ARCHIVE_SPEC[exchange]
+    tcol = spec["time"]
+    cols = _wanted_columns(exchange, columns)
+    cold = read_archive(conn, symbol, interval, exchange, start, end, cols)
+
+    query = f'SELECT {", ".join(cols)} FROM "{symbol}_{interval}"'
+    conds, params = [], []
+    if start is not None:
+        conds.append(f"{tcol} >= ?")
+        params.append(int(start))
+    if end is not None:
+        conds.append(f"{tcol} <= ?")
+        params.append(int(end))
+    if conds:
+        query += " WHERE " + " AND ".join(conds)
+    try:
+        hot = pd.read_sql(query + f" ORDER BY {tcol}", conn, params=params)
+    except Exception:
+        hot = pd.DataFrame(columns=cols)
+
+    if len(hot):
+        keep = ~np.isin(cold[tcol], hot[tcol].to_numpy(dtype=np.int64))
+        out = {c: np.concatenate([cold[c][keep], hot[c].to_numpy()]) for c in cols}
+        order = np.argsort(out[tcol], kind="stable")
+        out = {c: v[order] for c, v in out.items()}
+    else:
+        out = cold
+    return pd.DataFrame(out, columns=cols) if as_frame else out
+
+
+if __name__ == "__main__":
+    from Common import InitLogging
+    InitLogging()
+
+    strExchange = "BINANCE"
+    if len(sys.argv) > 1 and sys.argv[1] == "HTX":
+        strExchange = "HTX"
+    keep = int(sys.argv[sys.argv.index("--keep") + 1]) if "--keep" in sys.argv else HOT_BARS
+
+    g_ACD.setExchange(strExchange)
+    conn = sqlite3.connect(g_ACD.getDB())
+    total = archive_all(conn, keep=keep)
+    logger.info("共归档 %s 根K线", total)
+    if "--vacuum" in sys.argv:
+        # 删除的行要 VACUUM 之后文件才会变小
+        conn.execute("VACUUM")
+    conn.close()
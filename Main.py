@@ -6,6 +6,8 @@ from datetime import datetime
 # import binance_scaner
 # import RobotCtrl
 from RobotNotifier import send_message_async
+from Profiler import CycleProfiler
+from SymbolRank import hot_symbols as ranked_symbols
 
 BASE = 60
 
@@ -27,12 +29,17 @@ hot_symbols = [
 
 TIME = f"{BASE}min"
 
+
+def scan_symbols():
+    """HTX 库里成交额排名靠前的交易对，还没有排名时用 hot_symbols"""
+    return ranked_symbols(n=len(hot_symbols), exchange="HTX", fallback=hot_symbols)
+
 # TIME = "1day"
 
 
 async def main():
     while True:      
-        signalist = scanlist(hot_symbols,TIME)
+        signalist = scanlist(scan_symbols(),TIME)
         message = ""
 
         for symbol in signalist:
@@ -52,6 +59,9 @@ async def main1():
     last_run_hour = -1
     last_run_half = -1  # 0 表示整点，1 表示半点
 
+    # kill -USR1 <pid> 或写 profiles/Main.ctl 开启剖析
+    profiler = CycleProfiler("Main").install()
+
 
     while True:
         now = datetime.now()
@@ -63,7 +73,8 @@ async def main1():
         if last_run_hour != now.hour or last_run_half != current_half:       
             
             # 执行任务
-            signalist = scanlist(hot_symbols, TIME)
+            with profiler.cycle():
+                signalist = scanlist(scan_symbols(), TIME)
             message = "\n".join(signalist)
             if message:
                 await send_message_async(message)
@@ -0,0 +1,170 @@
+"""
+扫描循环的轻量埋点
+
+用法:
+    from Metrics import stage, g_metrics
+
+    with stage("fetch", interval=period):
+        df = fetch_kline(symbol, period, need)
+
+阶段: fetch / db_write / db_read / indicator / signal / notify
+每个 (阶段, 交易所, 周期) 一个耗时直方图，另外支持自定义计数器。
+g_metrics.log_summary() 输出周期性汇总；render_prometheus() 输出 Prometheus 文本格式。
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger("metrics")
+
+STAGES = ("fetch", "db_write", "db_read", "indicator", "signal", "notify")
+
+# 直方图桶上界 (秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个是 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}  # (stage, exchange, interval) -> Histogram
+        self.counters = {}    # (name, exchange, interval) -> float
+        self._last_summary = time.time()
+        self._server = None
+
+    @staticmethod
+    def _default_exchange():
+        from ConstDef import g_ACD
+        return g_ACD.getExchange()
+
+    def observe(self, stage_name, seconds, exchange=None, interval=None):
+        key = (stage_name, exchange or self._default_exchange(), interval or "")
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, value=1, exchange=None, interval=None):
+        key = (name, exchange or self._default_exchange(), interval or "")
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def stage(self, stage_name, exchange=None, interval=None):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage_name, time.perf_counter() - t0, exchange, interval)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    # ---------------------------------------------------------
+    # 输出
+    # ---------------------------------------------------------
+    def summary_lines(self):
+        """按 (阶段, 交易所) 汇总，周期合并展示"""
+        merged = {}
+        with self._lock:
+            for (stage_name, exchange, _), hist in self.histograms.items():
+                m = merged.setdefault((stage_name, exchange), [0, 0.0, 0.0])
+                m[0] += hist.count
+                m[1] += hist.sum
+                m[2] = max(m[2], hist.max)
+            counters = dict(self.counters)
+
+        order = {name: i for i, name in enumerate(STAGES)}
+        lines = []
+        for (stage_name, exchange), (count, total, max_v) in sorted(merged.items(), key=lambda kv: (kv[0][1], order.get(kv[0][0], 99))):
+            avg = total / count if count else 0.0
+            lines.append(f"{exchange:<12}{stage_name:<10} 次数={count:<7} 总耗时={total:8.2f}s 平均={avg * 1000:8.2f}ms 最大={max_v * 1000:8.2f}ms")
+        for (name, exchange, interval), value in sorted(counters.items()):
+            lines.append(f"{exchange:<12}{name:<10} {interval} = {value:g}")
+        return lines
+
+    def log_summary(self, title="阶段耗时汇总"):
+        lines = self.summary_lines()
+        if lines:
+            logger.info("%s\n%s", title, "\n".join(lines))
+        self._last_summary = time.time()
+
+    def maybe_log_summary(self, period=300):
+        """距上次汇总超过 period 秒才输出"""
+        if time.time() - self._last_summary >= period:
+            self.log_summary()
+
+    def render_prometheus(self):
+        out = ["# HELP cryptosignal_stage_seconds 扫描各阶段耗时", "# TYPE cryptosignal_stage_seconds histogram"]
+        with self._lock:
+            for (stage_name, exchange, interval), hist in sorted(self.histograms.items()):
+                labels = f'stage="{stage_name}",exchange="{exchange}",interval="{interval}"'
+                acc = 0
+                for bound, c in zip(hist.buckets, hist.counts):
+                    acc += c
+                    out.append(f'cryptosignal_stage_seconds_bucket{{{labels},le="{bound}"}} {acc}')
+                out.append(f'cryptosignal_stage_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+                out.append(f'cryptosignal_stage_seconds_sum{{{labels}}} {hist.sum:.6f}')
+                out.append(f'cryptosignal_stage_seconds_count{{{labels}}} {hist.count}')
+            if self.counters:
+                out.append("# TYPE cryptosignal_events_total counter")
+            for (name, exchange, interval), value in sorted(self.counters.items()):
+                out.append(f'cryptosignal_events_total{{name="{name}",exchange="{exchange}",interval="{interval}"}} {value:g}')
+        return "\n".join(out) + "\n"
+
+    def start_http_server(self, port=None, host="0.0.0.0"):
+        """
+        在后台线程提供 /metrics (Prometheus 文本格式)。
+        port 为空时读取环境变量 METRICS_PORT，都没有则不启动
+        """
+        port = port or int(os.environ.get("METRICS_PORT", 0))
+        if not port or self._server is not None:
+            return None
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info("Prometheus 指标已在 %s:%s/metrics 提供", host, port)
+        return self._server
+
+
+g_metrics = MetricsRegistry()
+stage = g_metrics.stage
@@ -0,0 +1,251 @@
+"""
+常驻扫描进程的按需性能剖析
+
+扫描程序 (ScanAllData / Main / chantheorymain) 都是 while True 常驻运行，
+某一轮变慢时不用重启，可以在运行中打开剖析:
+
+    kill -USR1 <pid>                         # 默认模式剖析接下来 PROFILE_CYCLES 轮
+    echo "cprofile 2" > profiles/ScanAllData.ctl   # 或写控制文件，指定模式和轮数
+
+模式:
+    sample   : 后台线程定时采样主线程调用栈，输出 collapsed stacks，
+               可直接给 flamegraph.pl / speedscope 画火焰图
+    cprofile : cProfile 确定性剖析，输出 .prof (pstats) 和文本摘要
+
+同时按 (symbol, 周期) 统计耗时，输出 .targets.txt，慢表一眼可见。
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+import cProfile
+import pstats
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger("profiler")
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_CYCLES = int(os.environ.get("PROFILE_CYCLES", 3))
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "sample")
+# 采样间隔 (秒)
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))
+
+MODES = ("sample", "cprofile")
+
+_NULL = nullcontext()
+_active = None  # 当前进程安装的 CycleProfiler
+_local = threading.local()  # 线程内安装的 CycleProfiler (一个进程扫多个交易所时每个线程一个)
+
+
+class _StackSampler(threading.Thread):
+    """定时抓取指定线程的调用栈，按 collapsed 格式计数"""
+
+    def __init__(self, profiler, thread_id, interval):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.profiler = profiler
+        self.thread_id = thread_id
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.reverse()
+            target = self.profiler._target
+            if target is not None:
+                # 把 symbol/周期 作为根节点，火焰图上按表分组
+                stack.insert(0, f"{target[0]}/{target[1]}")
+            self.profiler._record_sample(";".join(stack), target)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class CycleProfiler:
+    """按扫描轮次开关的剖析器，name 用于输出文件名和控制文件名"""
+
+    def __init__(self, name, out_dir=PROFILE_DIR, mode=PROFILE_MODE, cycles=PROFILE_CYCLES):
+        self.name = name
+        self.out_dir = out_dir
+        self.default_mode = mode if mode in MODES else "sample"
+        self.default_cycles = cycles
+        self.control_file = os.path.join(out_dir, f"{name}.ctl")
+
+        self._lock = threading.Lock()
+        self._request = None        # 待生效的 (mode, cycles)
+        self._mode = None
+        self._remaining = 0
+        self.running = False        # 当前轮是否在剖析
+
+        self._profile = None
+        self._sampler = None
+        self._target = None
+        self._stacks = Counter()
+        self._target_time = defaultdict(float)
+        self._target_calls = Counter()
+        self._target_samples = Counter()
+        self._started = None
+
+    # ---------------------------------------------------------
+    # 开关
+    # ---------------------------------------------------------
+    def install(self, thread_only=False):
+        """
+        注册 SIGUSR1 (Windows 没有则只支持控制文件)，并设为进程内的当前剖析器
+        thread_only: 只作为当前线程的剖析器，不注册信号 (信号只能在主线程注册)，只能用控制文件开启
+        """
+        global _active
+        os.makedirs(self.out_dir, exist_ok=True)
+        if thread_only:
+            _local.profiler = self
+            return self
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self._on_signal)
+        _active = self
+        return self
+
+    def _on_signal(self, signum, frame):
+        # 信号处理里只记录请求，真正开始在下一轮 cycle()
+        self.request()
+
+    def request(self, mode=None, cycles=None):
+        mode = mode if mode in MODES else self.default_mode
+        self._request = (mode, int(cycles or self.default_cycles))
+
+    def _poll_control_file(self):
+        """控制文件内容: "[mode] [cycles]"，均可省略；读取后删除"""
+        if not os.path.exists(self.control_file):
+            return
+        try:
+            with open(self.control_file) as f:
+                parts = f.read().split()
+            os.remove(self.control_file)
+        except OSError:
+            return
+        mode = next((p for p in parts if p in MODES), None)
+        cycles = next((int(p) for p in parts if p.isdigit()), None)
+        self.request(mode, cycles)
+
+    # ---------------------------------------------------------
+    # 每轮
+    # ---------------------------------------------------------
+    @contextmanager
+    def cycle(self):
+        """包住一轮扫描；未开启剖析时只多一次文件存在检查"""
+        self._poll_control_file()
+        if self._remaining == 0 and self._request is not None:
+            self._mode, self._remaining = self._request
+            self._request = None
+            self._reset()
+            logger.info("开始剖析 %s: 模式=%s 轮数=%s", self.name, self._mode, self._remaining)
+
+        if self._remaining == 0:
+            yield
+            return
+
+        self._start()
+        try:
+            yield
+        finally:
+            self._stop()
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._dump()
+
+    def _reset(self):
+        self._profile = cProfile.Profile() if self._mode == "cprofile" else None
+        self._stacks.clear()
+        self._target_time.clear()
+        self._target_calls.clear()
+        self._target_samples.clear()
+        self._started = time.time()
+
+    def _start(self):
+        self.running = True
+        if self._mode == "cprofile":
+            self._profile.enable()
+        else:
+            self._sampler = _StackSampler(self, threading.get_ident(), SAMPLE_INTERVAL)
+            self._sampler.start()
+
+    def _stop(self):
+        if self._mode == "cprofile":
+            self._profile.disable()
+        elif self._sampler is not None:
+            self._sampler.stop()
+            self._sampler = None
+        self.running = False
+
+    def _record_sample(self, stack, target):
+        with self._lock:
+            self._stacks[stack] += 1
+            if target is not None:
+                self._target_samples[target] += 1
+
+    # ---------------------------------------------------------
+    # (symbol, 周期) 归因
+    # ---------------------------------------------------------
+    @contextmanager
+    def _track(self, symbol, interval):
+        key = (symbol, interval)
+        prev = self._target
+        self._target = key
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._target_time[key] += time.perf_counter() - t0
+                self._target_calls[key] += 1
+            self._target = prev
+
+    # ---------------------------------------------------------
+    # 输出
+    # ---------------------------------------------------------
+    def _dump(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        prefix = os.path.join(self.out_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self._started))}-{self._mode}")
+        files = []
+
+        if self._mode == "cprofile":
+            self._profile.dump_stats(prefix + ".prof")
+            with open(prefix + ".txt", "w") as f:
+                stats = pstats.Stats(self._profile, stream=f)
+                stats.sort_stats("cumulative").print_stats(60)
+            files += [prefix + ".prof", prefix + ".txt"]
+            self._profile = None
+        else:
+            with self._lock, open(prefix + ".collapsed", "w") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            files.append(prefix + ".collapsed")
+
+        with self._lock, open(prefix + ".targets.txt", "w") as f:
+            f.write(f"{'symbol':<20}{'interval':<10}{'seconds':>10}{'calls':>8}{'samples':>9}\n")
+            for key, seconds in sorted(self._target_time.items(), key=lambda kv: -kv[1]):
+                f.write(f"{key[0]:<20}{key[1]:<10}{seconds:>10.3f}{self._target_calls[key]:>8}{self._target_samples[key]:>9}\n")
+        files.append(prefix + ".targets.txt")
+
+        logger.info("剖析结束 %s，输出: %s", self.name, ", ".join(files))
+
+
+def profile_target(symbol, interval):
+    """
+    把一段代码的耗时归到 (symbol, 周期) 上。
+    没有安装剖析器或当前轮未开启时返回空上下文，几乎没有开销
+    """
+    profiler = getattr(_local, "profiler", None) or _active
+    if profiler is None or not profiler.running:
+        return _NULL
+    return profiler._track(symbol, interval)
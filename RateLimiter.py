@@ -0,0 +1,265 @@
+"""
+按交易所权重预算限流，同一台机器上的多个进程共享一份预算
+
+预算配置在 ConstDef.ALL_CONST[交易所]["rate_limit"]:
+    budget / window   每 window 秒允许的总权重，窗口按整点对齐 (与交易所的计数方式一致)
+    header            服务端返回的已用权重头，例如币安的 X-MBX-USED-WEIGHT-1M
+    weights           各接口的权重
+
+每个 (交易所, 主机) 在 RATE_LIMIT_DIR 下有一个状态文件，读写时加 fcntl.flock，
+updateAllKLine / ScanAllData / chantheorymain 等进程同时运行时共同扣减同一份预算:
+  1. 请求前 acquire(weight) 预扣权重，额度用完时睡到下一个窗口开始，额度够就立即放行
+  2. 响应后 observe() 用服务端的已用权重校正本地计数 (同一 IP 还有别的程序在请求时)，
+     遇到 429 / 418 按 Retry-After 暂停该交易所的所有请求
+
+ExchangeClient 每次请求都会自动经过这里，调用方不需要再自己 sleep。
+
+环境变量:
+    RATE_LIMIT=0                 关闭限流
+    RATE_LIMIT_DIR               状态文件目录，默认 <tmp>/cryptosignal-ratelimit
+    RATE_LIMIT_SAFETY            只使用预算的这个比例，给同一 IP 的其它客户端留余量，默认 0.8
+    <EXCHANGE>_RATE_BUDGET       覆盖某个交易所的 budget
+"""
+import os
+import json
+import time
+import random
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 flock，只在进程内限流
+    fcntl = None
+
+from ConstDef import ALL_CONST, get_api_base
+
+logger = logging.getLogger("rate_limiter")
+
+RATE_LIMIT_DIR = os.environ.get("RATE_LIMIT_DIR") or os.path.join(tempfile.gettempdir(), "cryptosignal-ratelimit")
+SAFETY = float(os.environ.get("RATE_LIMIT_SAFETY", "0.8"))
+
+# 被封禁时服务端没给 Retry-After 的默认暂停时间 (秒)
+DEFAULT_BAN = 60
+
+# Hyperliquid 周期 -> 毫秒，用来估算 candleSnapshot 返回的根数
+_HL_INTERVAL_MS = {"1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+                   "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "8h": 28_800_000,
+                   "12h": 43_200_000, "1d": 86_400_000, "3d": 259_200_000, "1w": 604_800_000}
+
+
+class RateLimiter:
+    def __init__(self, exchange, host=None, budget=None, window=None, safety=SAFETY, state_dir=RATE_LIMIT_DIR):
+        conf = ALL_CONST[exchange]["rate_limit"]
+        self.exchange = exchange
+        self.host = host or urlsplit(get_api_base(exchange)).netloc
+        self.window = float(window or conf["window"])
+        budget = budget or int(os.environ.get(f"{exchange}_RATE_BUDGET", 0)) or conf["budget"]
+        self.capacity = max(1, int(budget * safety))
+        self.header = conf.get("header")
+        self.weights = conf.get("weights", {})
+        self.default_weight = conf.get("default_weight", 1)
+
+        self._lock = threading.Lock()
+        self._fh = None
+        self._state = {"window_start": 0.0, "used": 0, "blocked_until": 0.0}
+        if fcntl is not None:
+            os.makedirs(state_dir, exist_ok=True)
+            name = f"{exchange}-{self.host.replace(':', '_')}.json"
+            self.path = os.path.join(state_dir, name)
+            self._fh = open(self.path, "a+")
+        else:
+            self.path = None
+
+        # 统计 (仅本进程)
+        self.acquired = 0
+        self.waited = 0.0
+
+    # ---------------------------------------------------------
+    # 共享状态
+    # ---------------------------------------------------------
+    @contextmanager
+    def _locked(self):
+        """加锁读出状态，退出时写回；进程内用线程锁，进程间用 flock"""
+        with self._lock:
+            if self._fh is None:
+                yield self._state
+                return
+            fcntl.flock(self._fh, fcntl.LOCK_EX)
+            try:
+                self._fh.seek(0)
+                raw = self._fh.read()
+                try:
+                    state = json.loads(raw) if raw else dict(self._state)
+                except ValueError:
+                    # 文件被截断或写坏时从空窗口开始
+                    state = dict(self._state)
+                before = dict(state)
+                yield state
+                if state != before:
+                    self._fh.seek(0)
+                    self._fh.truncate()
+                    self._fh.write(json.dumps(state))
+                    self._fh.flush()
+            finally:
+                fcntl.flock(self._fh, fcntl.LOCK_UN)
+
+    def _roll(self, state, now):
+        start = now - now % self.window
+        if state["window_start"] != start:
+            state["window_start"] = start
+            state["used"] = 0
+
+    # ---------------------------------------------------------
+    # 限流
+    # ---------------------------------------------------------
+    def weight(self, path, params=None, json_body=None):
+        """估算一次请求的权重"""
+        if isinstance(json_body, dict) and "type" in json_body:
+            kind = json_body["type"]
+            weight = self.weights.get(kind, self.default_weight)
+            if kind == "candleSnapshot":
+                weight += _candle_items(json_body.get("req", {})) // 60
+            return weight
+        weight = self.weights.get(path, self.default_weight)
+        # 行情类接口不带 symbol 时返回全市场，币安按更高权重计
+        if path.startswith("/api/v3/ticker") and params and "symbol" in params:
+            weight = 2
+        return weight
+
+    def acquire(self, weight=1):
+        """
+        预扣 weight，额度不够时阻塞到下一个窗口 / 封禁结束
+        返回等待的秒数
+        """
+        waited = 0.0
+        while True:
+            with self._locked() as state:
+                now = time.time()
+                self._roll(state, now)
+                if now >= state["blocked_until"]:
+                    # 单次权重超过整个预算时，窗口为空就放行，避免永远等待
+                    if state["used"] + weight <= self.capacity or state["used"] == 0:
+                        state["used"] += weight
+                        self.acquired += weight
+                        self.waited += waited
+                        return waited
+                    wait = state["window_start"] + self.window - now
+                else:
+                    wait = state["blocked_until"] - now
+            # 抖动让同时醒来的进程错开
+            wait += random.random() * min(0.05, self.window / 20)
+            if waited == 0.0:
+                logger.debug("%s 权重用完，等待 %.2fs", self.exchange, wait)
+            time.sleep(wait)
+            waited += wait
+
+    def observe(self, status, headers, sent_at=None):
+        """
+        根据响应头校正计数；429 / 418 时暂停整个交易所
+        sent_at: 请求发出的时间 (time.time())，上一个窗口发出的请求不拿来校正本窗口
+        """
+        used = None
+        if self.header:
+            value = headers.get(self.header)
+            if value is not None:
+                try:
+                    used = int(value)
+                except ValueError:
+                    used = None
+
+        blocked = None
+        if status in (418, 429):
+            try:
+                blocked = float(headers.get("Retry-After") or DEFAULT_BAN)
+            except ValueError:
+                blocked = DEFAULT_BAN
+
+        if used is None and blocked is None:
+            return
+
+        with self._locked() as state:
+            now = time.time()
+            self._roll(state, now)
+            if sent_at is not None and sent_at < state["window_start"]:
+                used = None
+            if used is not None and used > state["used"]:
+                state["used"] = used
+            if blocked is not None:
+                # 服务端已经拒绝，本窗口剩余额度作废
+                state["used"] = max(state["used"], self.capacity)
+                state["blocked_until"] = max(state["blocked_until"], now + blocked)
+        if blocked is not None:
+            logger.warning("%s 返回 %s，暂停请求 %.0fs", self.exchange, status, blocked)
+
+    def snapshot(self):
+        """当前窗口的 {used, capacity, window, blocked_for}"""
+        with self._locked() as state:
+            now = time.time()
+            self._roll(state, now)
+            return {"used": state["used"], "capacity": self.capacity, "window": self.window,
+                    "blocked_for": max(0.0, state["blocked_until"] - now)}
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+def _candle_items(req):
+    step = _HL_INTERVAL_MS.get(req.get("interval"))
+    start = req.get("startTime")
+    if not step or start is None:
+        return 0
+    end = req.get("endTime") or int(time.time() * 1000)
+    return max(0, int(end - start) // step)
+
+
+# ---------------------------------------------------------
+# 按地址找限流器
+# ---------------------------------------------------------
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def enabled():
+    return os.environ.get("RATE_LIMIT", "1") != "0"
+
+
+def get_limiter(exchange, host=None):
+    host = host or urlsplit(get_api_base(exchange)).netloc
+    key = (exchange, host)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                limiter = _limiters[key] = RateLimiter(exchange, host)
+    return limiter
+
+
+def limiter_for_url(url):
+    """url 属于哪个交易所 (按当前配置的接口主机匹配)，不是交易所接口时返回 None"""
+    if not enabled():
+        return None
+    parts = urlsplit(url)
+    candidates = [ex for ex in ALL_CONST if urlsplit(get_api_base(ex)).netloc == parts.netloc]
+    if not candidates:
+        return None
+    # 几个交易所指向同一台主机时 (本地假交易所) 再按接口路径区分
+    if len(candidates) > 1:
+        for exchange in candidates:
+            if parts.path in _known_paths(exchange):
+                return get_limiter(exchange, parts.netloc)
+    return get_limiter(candidates[0], parts.netloc)
+
+
+def _known_paths(exchange):
+    conf = ALL_CONST[exchange]
+    paths = {urlsplit(conf[k]).path for k in ("api_kline", "api_symbols") if k in conf}
+    paths.update(p for p in conf["rate_limit"]["weights"] if p.startswith("/"))
+    return paths
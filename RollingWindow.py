@@ -0,0 +1,136 @@
+"""
+滚动均值 / 标准差 (布林带用)
+
+pandas 的 rolling().std() 用累加和做在线更新，像 pepeusdt、shibusdt 这种价格在 1e-5 量级的币，
+带宽前后比较 (bandwidth <= bandwidth.shift(1)) 会被舍入误差左右。这里提供两种模式:
+
+1. 批量: rolling_mean_std()，对每个窗口先求均值再求离差平方和 (两遍法)，不依赖累加和
+2. 增量: RollingStats，滑动窗口版 Welford，每根K线 O(1)，定期用两遍法重算消除累积误差
+
+两者结果一致，前 window-1 根为 NaN (与 pandas min_periods=window 相同)。
+"""
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 比较带宽/轨道时的相对容差，小于这个量级的差异视为舍入误差
+REL_TOL = 1e-9
+
+
+def rolling_mean_std(values, window, ddof=1):
+    """批量计算滚动均值和标准差，返回两个与 values 等长的 float 数组"""
+    x = np.asarray(values, dtype=float)
+    n = len(x)
+    mean = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    if window <= ddof or n < window:
+        return mean, std
+
+    windows = sliding_window_view(x, window)
+    m = windows.mean(axis=1)
+    dev = windows - m[:, None]
+    var = np.einsum('ij,ij->i', dev, dev) / (window - ddof)
+    mean[window - 1:] = m
+    std[window - 1:] = np.sqrt(var)
+    return mean, std
+
+
+def bollinger(values, window=20, num_std=2.0, ddof=1):
+    """返回 (mid, upper, lower)"""
+    mid, std = rolling_mean_std(values, window, ddof)
+    return mid, mid + num_std * std, mid - num_std * std
+
+
+def not_greater(a, b, rtol=REL_TOL):
+    """a <= b，允许 rtol 量级的相对误差；任一为 NaN 时为 False"""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return a <= b + rtol * np.maximum(np.abs(a), np.abs(b))
+
+
+def not_less(a, b, rtol=REL_TOL):
+    """a >= b，允许 rtol 量级的相对误差；任一为 NaN 时为 False"""
+    return not_greater(b, a, rtol)
+
+
+class RollingStats:
+    """
+    增量滚动均值 / 方差 (滑动窗口 Welford)
+    push() 每根K线 O(1)；每 resync 次更新用两遍法从窗口重算一次，误差不会随运行时间累积
+    """
+
+    def __init__(self, window, ddof=1, resync=None):
+        self.window = window
+        self.ddof = ddof
+        self.resync = resync or window * 50
+        self.buf = deque(maxlen=window)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self._updates = 0
+
+    def push(self, x):
+        x = float(x)
+        if len(self.buf) < self.window:
+            # 窗口未满: 标准 Welford
+            self.buf.append(x)
+            delta = x - self.mean
+            self.mean += delta / len(self.buf)
+            self.m2 += delta * (x - self.mean)
+        else:
+            # 窗口已满: 用新值替换最旧的值
+            old = self.buf[0]
+            self.buf.append(x)
+            new_mean = self.mean + (x - old) / self.window
+            self.m2 += (x - old) * (x - new_mean + old - self.mean)
+            self.mean = new_mean
+
+        self._updates += 1
+        if self._updates >= self.resync:
+            self._recompute()
+        return self
+
+    def extend(self, values):
+        for x in values:
+            self.push(x)
+        return self
+
+    def _recompute(self):
+        arr = np.fromiter(self.buf, dtype=float, count=len(self.buf))
+        self.mean = float(arr.mean()) if len(arr) else 0.0
+        dev = arr - self.mean
+        self.m2 = float(dev @ dev)
+        self._updates = 0
+
+    @property
+    def ready(self):
+        return len(self.buf) == self.window
+
+    @property
+    def var(self):
+        if not self.ready:
+            return float('nan')
+        # 舍入可能让 m2 略小于 0
+        return max(self.m2, 0.0) / (self.window - self.ddof)
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.var))
+
+    def bollinger(self, num_std=2.0):
+        """当前窗口的 (mid, upper, lower)，窗口未满时为 NaN"""
+        if not self.ready:
+            return float('nan'), float('nan'), float('nan')
+        std = self.std
+        return self.mean, self.mean + num_std * std, self.mean - num_std * std
+
+    def state(self):
+        """可序列化的状态，用于跨进程/重启后继续增量计算"""
+        return {'window': self.window, 'ddof': self.ddof, 'buf': list(self.buf)}
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls(state['window'], state.get('ddof', 1))
+        stats.buf.extend(float(v) for v in state['buf'])
+        stats._recompute()
+        return stats
@@ -1,4 +1,5 @@
 import sqlite3
+import logging
 import requests
 import asyncio
 import time
@@ -9,22 +10,42 @@ from Common import InitEnvironment,save_simple,load_number_default
 from ConstDef import g_ACD
 from CheckbyBoll import check_bollinger_convergence,check_bollinger_breakout_by_kline
 from updateAllKLine import update_all_kline
+from Metrics import g_metrics, stage
+from ExchangeClient import g_client
+from Profiler import CycleProfiler, profile_target
+from SymbolRegistry import refresh_symbols, active_symbols
+from SymbolRank import refresh_rank, load_rank, scan_plan
+from ExchangeRegistry import g_exchanges, parse_exchanges
+from ScanSnapshot import CycleSnapshot, publish
 
 import sys
 import signal
 
+logger = logging.getLogger(__name__)
 
+# 阶段耗时汇总的输出间隔 (秒)
+SUMMARY_PERIOD = 300
+# 交易对注册表的刷新间隔 (秒)
+SYMBOL_REFRESH = 3600
 
-def check_data4OneTable(conn, table: str):
-    df = pd.read_sql(f'SELECT * FROM "{table}" ORDER BY open_time', conn)
+
+
+def check_data4OneTable(conn, table: str, period=None, bars=None):
+    # 本轮快照里有这张表就不再读库
+    df = bars
+    if df is None:
+        with stage("db_read", interval=period):
+            df = pd.read_sql(f'SELECT * FROM "{table}" ORDER BY {g_ACD.getIndexName()}', conn)
     # 检查是否收敛
     # check_bollinger_convergence_debug(df)
-    return check_bollinger_convergence(df)      
+    with stage("indicator", interval=period):
+        return check_bollinger_convergence(df)      
 
 
-async def check_all_tables(conn,symbol):
+async def check_all_tables(conn,symbol,snapshot=None):
     """
     遍历数据库里所有kline表，检查布林突破
+    snapshot: 本轮的 CycleSnapshot，给出时每张表只读一次，各项检查共用
     """
     cursor = conn.cursor()
 
@@ -47,62 +68,90 @@ async def check_all_tables(conn,symbol):
 
     indexname = g_ACD.getIndexName()
 
+    if snapshot is not None:
+        with stage("db_read"):
+            snapshot.load_symbol(conn, symbol, tables)
+
     for table in tables:
-        print(f"检查{table}的k线数据")
-        
         para = table.split("_")
         period = para[1]
-        print(f"检查{symbol}的{period}线")      
-        if check_data4OneTable(conn,table):
+        logger.debug("检查%s的%s线", symbol, period)
+        bars = snapshot.frame(table, indexname) if snapshot is not None else None
+        with profile_target(symbol, period):
+            converging = check_data4OneTable(conn,table,period,bars)
+            bbr = check_bollinger_breakout_by_kline(conn,table,indexname,bars=bars)
+
+        if converging:
             count += 1
-            print(f"{symbol}在{period}线级别收敛")
+            g_metrics.inc("converge", interval=period)
+            logger.info("%s在%s线级别收敛", symbol, period)
             mess += period
             mess += " "
 
-        bbr = check_bollinger_breakout_by_kline(conn,table,indexname)
         if bbr == 1:
             count_break_up += 1
-            print(f"{symbol}在{period}线级别布林带触顶📈")
+            g_metrics.inc("break_up", interval=period)
+            logger.info("%s在%s线级别布林带触顶📈", symbol, period)
             mess_break_up += period
             mess_break_up += " "
         elif bbr == 2:
             count_break_down += 1
-            print(f"{symbol}在{period}线级别布林带触底📉")
+            g_metrics.inc("break_down", interval=period)
+            logger.info("%s在%s线级别布林带触底📉", symbol, period)
             mess_break_down += period
             mess_break_down += " "            
 
 
     if count > 0:
         strMess = f"{symbol} 在以下时间线上收敛:[{mess}]"
-        await send_message_async(strMess)
+        with stage("notify"):
+            await send_message_async(strMess)
 
     if count_break_up > 0:
         strMess = f"{symbol} 在以下时间线上触顶📈:[{mess_break_up}]"
-        await send_message_async(strMess)
+        with stage("notify"):
+            await send_message_async(strMess)
 
     if count_break_down > 0:
         strMess = f"{symbol} 在以下时间线上触底📉:[{mess_break_down}]"
-        await send_message_async(strMess)        
+        with stage("notify"):
+            await send_message_async(strMess)        
                 
     return count,mess
 
                                   
 
 
-async def TimerTask(conn):
-
- 
+async def TimerTask(conn, adapter=None):
+    """
+    扫描一轮；adapter 不为空时 (一个进程扫多个交易所) 断点续扫的状态文件按交易所区分
+    """
 
     conn.row_factory = sqlite3.Row
-    cursorSymbols = conn.cursor()
 
-    lastindex = load_number_default("lastIndex.txt",0)
+    index_file = adapter.state_file("lastIndex.txt") if adapter else "lastIndex.txt"
+    cycle_file = adapter.state_file("scanCycle.txt") if adapter else "scanCycle.txt"
+    lastindex = load_number_default(index_file,-1)
+    cycle = load_number_default(cycle_file,0)
 
 
     onlineNum = 0
 
-    cursorSymbols.execute(f'SELECT "index",symbol FROM {g_ACD.getTableSymbols()} WHERE "index">= {lastindex}')
-    symbols = [row[:2] for row in cursorSymbols.fetchall()]         
+    try:
+        refresh_symbols(conn, min_interval=SYMBOL_REFRESH)
+    except Exception as e:
+        logger.warning("刷新交易对失败，使用已有列表: %s", e)
+    universe = active_symbols(conn)
+
+    # 按流动性分档: 高流动性的排在前面且每轮都扫，低流动性的隔几轮扫一次
+    refresh_rank(conn, [symbol for _, symbol in universe])
+    symbols = scan_plan(universe, load_rank(conn), cycle)
+    logger.info("第%s轮: 计划扫描 %s/%s 个交易对", cycle, len(symbols), len(universe))
+
+    # 断点续扫: 同一轮的计划是确定的，从上次中断的交易对继续
+    resume = [i for i, row in enumerate(symbols) if row[0] == lastindex]
+    if resume:
+        symbols = symbols[resume[0]:]
     # for symbol in symbols:                           
     #     print(f"准备检查交易对{symbol}")        
     #     onlineNum += 1  
@@ -110,12 +159,14 @@ async def TimerTask(conn):
     #     time.sleep(0.1)
 
 
+    # 本轮各交易对的K线尾部，检查共用，轮末发布到共享内存给同机的其它进程
+    snapshot = CycleSnapshot()
+
     sMess = ""    
     for row in symbols:   
         lastindex = row[0]
         symbol = row[1]
-        print(symbol)
-        time.sleep(0.1) 
+        logger.debug("检查交易对 %s", symbol)
 
 
         if symbol == "USDCUSDT" or symbol == "USD1USDT":
@@ -123,47 +174,88 @@ async def TimerTask(conn):
             continue 
 
         update_all_kline(symbol,conn)
-        count,submess = await check_all_tables(conn,symbol)
-        save_simple(lastindex,"lastIndex.txt")
+        onlineNum += 1
+        count,submess = await check_all_tables(conn,symbol,snapshot)
+        save_simple(lastindex,index_file)
         if count > 0:           
             sMess += " "
             sMess += f"{symbol}:{count}:[{submess}]"
             sMess += "\r\n"
 
     if sMess != "":
-        print("===========================================")  
         message = "📉本轮共检测出以下币种触发量化信号，请关注：\n" + sMess    
-        # print(message)
-        await send_message_async(message)   
+        logger.info(message)
+        with stage("notify"):
+            await send_message_async(message)   
+
+    try:
+        publish(snapshot, cycle)
+    except Exception as e:
+        logger.warning("发布扫描快照失败: %s", e)
 
     # 全部执行完了要从新开始
-    save_simple(0,"lastIndex.txt")
+    save_simple(-1,index_file)
+    save_simple(cycle + 1,cycle_file)
 
-    print(f"共检查{onlineNum}对交易对")   
+    logger.info("共检查%s对交易对", onlineNum)
+    g_metrics.maybe_log_summary(SUMMARY_PERIOD)
 
 
-g_conn = None
+g_conns = []
 
 def handler(sig, frame):
-    print("\n检测到 Ctrl+C，程序已安全退出。")        
-    g_conn.close()
+    logger.info("检测到 Ctrl+C，程序已安全退出。")
+    g_metrics.log_summary()
+    g_client.log_stats()
+    for conn in g_conns:
+        try:
+            conn.close()
+        except Exception:
+            pass
     sys.exit(0)
 
 
+def scan_loop(adapter=None):
+    """
+    循环扫描当前交易所；adapter 不为空时在该交易所自己的线程里运行
+    (kill -USR1 只对单交易所有效，多交易所时写 profiles/ScanAllData-<交易所>.ctl 开启剖析)
+    """
+    if adapter is None:
+        conn = sqlite3.connect(g_ACD.getDB())
+        profiler = CycleProfiler("ScanAllData").install()
+    else:
+        conn = adapter.connect()
+        profiler = CycleProfiler(f"ScanAllData-{adapter.name}").install(thread_only=True)
+    g_conns.append(conn)
 
+    while True:
+        with profiler.cycle():
+            asyncio.run(TimerTask(conn, adapter))
+        time.sleep(1)
 
-def main():
-    print("开始进入定时任务，执行完后休息一秒执行下一次")
-    # 绑定 SIGINT 信号（Ctrl+C）
-    signal.signal(signal.SIGINT, handler)  
-
-
-    g_conn = sqlite3.connect(g_ACD.getDB())   
-    # asyncio.run(TimerTask(conn))
 
-    while True:
-        asyncio.run(TimerTask(g_conn))            
-        time.sleep(1) 
+def main(exchanges=None):
+    """
+    exchanges: 要扫描的交易所列表；多于一个时每个交易所一个线程，
+    各自的客户端、限流器、数据库和状态文件，信号检查流水线共用
+    """
+    logger.info("开始进入定时任务，执行完后休息一秒执行下一次")
+    # 设置了 METRICS_PORT 时提供 Prometheus /metrics
+    g_metrics.start_http_server()
+    # 绑定 SIGINT 信号（Ctrl+C）
+    signal.signal(signal.SIGINT, handler)
+
+    if not exchanges or len(exchanges) == 1:
+        # kill -USR1 <pid> 或写 profiles/ScanAllData.ctl 开启剖析
+        scan_loop()
+        return
+
+    logger.info("同时扫描: %s", ", ".join(exchanges))
+    threads = g_exchanges.run_concurrently(exchanges, scan_loop)
+    # 主线程只等信号；join 带超时，Ctrl+C 才能及时响应
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(1)
     
  
 def Test():
@@ -174,8 +266,13 @@ def Test():
 
 if __name__ == "__main__":
     # asyncio.run(main())
+    # python ScanAllData.py BINANCE,HTX  一个进程同时扫多个交易所
     InitEnvironment()
-    main()
+    try:
+        exchanges = parse_exchanges(sys.argv[1] if len(sys.argv) > 1 else None)
+    except ValueError as e:
+        sys.exit(str(e))
+    main(exchanges)
         
 
 
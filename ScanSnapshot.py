@@ -0,0 +1,327 @@
+"""
+每轮扫描的K线快照，放在共享内存里给同机的其它进程读
+
+以前 check_all_tables 对每张表读两次 (check_data4OneTable 的 SELECT * 和
+check_bollinger_breakout_by_kline)，CheckByEMA 在别的进程里又读一遍同样的数据。
+
+扫描进程 (ScanAllData):
+    snapshot = CycleSnapshot()
+    snapshot.load_symbol(conn, symbol, tables)   # 交易对更新完后，一条查询读出各周期最后 SNAPSHOT_BARS 根
+    snapshot.frame(table, indexname)            # 本轮的各项检查都从这里取
+    publish(snapshot, cycle)                    # 轮末写进一块 multiprocessing.shared_memory
+
+其它进程 (CheckByEMA 等):
+    snap = ScanSnapshot.attach()                # 没有快照或已过期时返回 None，调用方回退到读库
+    snap.get(table)                             # 共享内存上的 numpy 视图，不拷贝；该表读入已超过 max_age 时为 None
+    snap.current(conn, tables)                  # 快照最后一根与库里最后一根相同的表，其余的回退到读库
+
+快照在轮末才发布，而各表在该交易对轮到时读入，最早的表可能比发布时间早一整轮，
+所以过期按每张表的读入时间算；读取方在用之前再用 current() 比对库里最新的时间，不会漏掉刚收盘的K线。
+
+共享内存布局: 8 字节标识 + 8 字节索引长度 + 索引 JSON (补齐到 8 字节) + float64 数据 [总行数, 6]
+索引里记录每张表的 (起始行, 行数, 读入时间)，列为 COLUMNS (时间为索引列原值，毫秒在 2^53 以内 float64 无损)。
+当前快照的共享内存名写在 SNAPSHOT_DIR/<交易所>.json，发布新快照后旧的一块随即 unlink
+(已经 attach 的进程仍可读到关闭为止)。
+"""
+import os
+import json
+import time
+import atexit
+import struct
+import sqlite3
+import logging
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+
+from ConstDef import g_ACD
+
+logger = logging.getLogger(__name__)
+
+# 每张表保留最后多少根 (EMA 检查需要 300+2 根)
+SNAPSHOT_BARS = int(os.environ.get("SNAPSHOT_BARS", "302"))
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR") or os.path.join(tempfile.gettempdir(), "cryptosignal-snapshot")
+# 超过这个时间 (秒) 的快照视为过期
+SNAPSHOT_MAX_AGE = float(os.environ.get("SNAPSHOT_MAX_AGE", "900"))
+
+COLUMNS = ["time", "open", "high", "low", "close", "volume"]
+# 各交易所K线表里的成交量列 (基础币数量)
+VOLUME_COLUMN = {"BINANCE": "volume", "HTX": "amount"}
+
+MAGIC = b"CSSNAP01"
+_HEADER = struct.Struct("<8sQ")
+
+
+class _SnapshotView:
+    """CycleSnapshot 和 ScanSnapshot 共用的读取接口"""
+
+    bars = SNAPSHOT_BARS  # 每张表最多保存的根数；行数等于它时表里可能还有更早的K线
+
+    def _lookup(self, table):
+        raise NotImplementedError
+
+    def tables(self):
+        raise NotImplementedError
+
+    def loaded_at(self, table):
+        raise NotImplementedError
+
+    def get(self, table):
+        """[n, 6] 数组 (按时间升序)，没有该表时返回 None"""
+        return self._lookup(table)
+
+    def current(self, conn, tables, indexname=None):
+        """tables 里快照最后一根与库里最后一根时间相同的表 (集合)；库里有更新的K线时快照已过时"""
+        last = {}
+        for table in tables:
+            data = self._lookup(table)
+            if data is not None and len(data):
+                last[table] = data[-1, 0]
+        if not last:
+            return set()
+        latest = latest_times(conn, list(last), indexname or g_ACD.getIndexName())
+        return {t for t, ts in last.items() if latest.get(t) == ts}
+
+    def __contains__(self, table):
+        return self._lookup(table) is not None
+
+    def frame(self, table, indexname=None):
+        """DataFrame 视图，时间列名为 indexname (默认当前交易所的索引列)；没有该表时返回 None"""
+        data = self._lookup(table)
+        if data is None:
+            return None
+        names = [indexname or g_ACD.getIndexName()] + COLUMNS[1:]
+        return pd.DataFrame(data, columns=names, copy=False)
+
+
+class CycleSnapshot(_SnapshotView):
+    """扫描进程内本轮的快照，逐个交易对读入"""
+
+    def __init__(self, exchange=None, bars=SNAPSHOT_BARS):
+        self.exchange = exchange or g_ACD.getExchange()
+        self.bars = bars
+        self._tables = {}
+        self._loaded = {}  # {表: 读入时间}
+
+    def load_symbol(self, conn, symbol, tables):
+        """一条 UNION ALL 查询读出一个交易对各周期表的最后 bars 根；读不出来的表不放入 (检查时回退到读库)"""
+        if not tables:
+            return
+        tcol = g_ACD.getIndexName()
+        vol = VOLUME_COLUMN.get(self.exchange, "volume")
+        sql = " UNION ALL ".join(
+            f'SELECT {i}, * FROM (SELECT {tcol}, open, high, low, close, {vol} FROM "{t}" '
+            f'ORDER BY {tcol} DESC LIMIT {self.bars})'
+            for i, t in enumerate(tables))
+        try:
+            rows = np.array(conn.execute(sql).fetchall(), dtype=np.float64).reshape(-1, len(COLUMNS) + 1)
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            logger.debug("%s 快照读取失败，检查时直接读库: %s", symbol, e)
+            return
+        loaded = time.time()
+        rows = rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+        k = rows[:, 0].astype(int)
+        counts = np.bincount(k, minlength=len(tables))
+        start = 0
+        for i, table in enumerate(tables):
+            self._tables[table] = rows[start:start + counts[i], 1:]
+            self._loaded[table] = loaded
+            start += counts[i]
+
+    def discard(self, table):
+        self._tables.pop(table, None)
+        self._loaded.pop(table, None)
+
+    def loaded_at(self, table):
+        """该表读入的时间 (秒)，没有该表时返回 None"""
+        return self._loaded.get(table)
+
+    def _lookup(self, table):
+        return self._tables.get(table)
+
+    def tables(self):
+        return list(self._tables)
+
+    def __len__(self):
+        return len(self._tables)
+
+
+class ScanSnapshot(_SnapshotView):
+    """attach 到扫描进程发布的共享内存快照，只读"""
+
+    def __init__(self, shm, index, max_age=SNAPSHOT_MAX_AGE):
+        self._shm = shm
+        self.index = index
+        self.max_age = max_age
+        self.exchange = index["exchange"]
+        self.cycle = index.get("cycle")
+        self.bars = index["bars"]
+        self.created = index["created"]
+        offset = index["data_offset"]
+        total = sum(entry[1] for entry in index["tables"].values())
+        self._data = np.ndarray((total, len(COLUMNS)), dtype=np.float64, buffer=shm.buf, offset=offset)
+        self._data.flags.writeable = False
+
+    @classmethod
+    def attach(cls, exchange=None, max_age=SNAPSHOT_MAX_AGE):
+        """
+        当前交易所最新的快照；没有、已过期或已被回收时返回 None
+        max_age 按每张表的读入时间算，超过的表 get() 返回 None
+        """
+        exchange = exchange or g_ACD.getExchange()
+        try:
+            with open(_pointer_file(exchange)) as f:
+                pointer = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # 发布时间都已过期，里面的表只会更早
+        if max_age is not None and time.time() - pointer.get("created", 0) > max_age:
+            return None
+        try:
+            shm = _attach(pointer["name"])
+        except (FileNotFoundError, KeyError):
+            return None
+
+        magic, length = _HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            shm.close()
+            return None
+        index = json.loads(bytes(shm.buf[_HEADER.size:_HEADER.size + length]))
+        return cls(shm, index, max_age)
+
+    def loaded_at(self, table):
+        entry = self.index["tables"].get(table)
+        if entry is None:
+            return None
+        return entry[2] if len(entry) > 2 else self.created
+
+    def _lookup(self, table):
+        entry = self.index["tables"].get(table)
+        if entry is None:
+            return None
+        if self.max_age is not None and time.time() - self.loaded_at(table) > self.max_age:
+            return None
+        start, n = entry[:2]
+        return self._data[start:start + n]
+
+    def tables(self):
+        return list(self.index["tables"])
+
+    def close(self):
+        # 视图释放后才能关闭
+        self._data = None
+        self._shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def latest_times(conn, tables, indexname):
+    """一条 UNION ALL 查询读出各表最后一根的时间 {表: float}，读不出来的表不放入"""
+    sql = " UNION ALL ".join(f'SELECT {i}, MAX({indexname}) FROM "{t}"' for i, t in enumerate(tables))
+    try:
+        rows = conn.execute(sql).fetchall()
+    except sqlite3.Error as e:
+        logger.debug("读取最新时间失败: %s", e)
+        return {}
+    return {tables[int(i)]: float(t) for i, t in rows if t is not None}
+
+
+# ---------------------------------------------------------
+# 发布
+# ---------------------------------------------------------
+_published = {}  # {交易所: SharedMemory}
+_publish_lock = threading.Lock()
+
+
+def _pointer_file(exchange):
+    return os.path.join(SNAPSHOT_DIR, f"{exchange.lower()}.json")
+
+
+def _attach(name):
+    """attach 已有的共享内存；不让 resource_tracker 在本进程退出时把它 unlink 掉"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python 3.13 之前没有 track 参数
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+def publish(snapshot, cycle=None):
+    """把本轮快照写进新的共享内存块，更新指针文件并回收上一块；返回共享内存名"""
+    tables = snapshot.tables()
+    index = {"exchange": snapshot.exchange, "cycle": cycle, "created": time.time(),
+             "bars": snapshot.bars, "columns": COLUMNS, "tables": {}}
+    row = 0
+    for table in tables:
+        n = len(snapshot.get(table))
+        index["tables"][table] = [row, n, snapshot.loaded_at(table) or index["created"]]
+        row += n
+
+    # data_offset 本身也写在索引里，按放大后的长度预留，保证 8 字节对齐
+    index["data_offset"] = 0
+    length = len(json.dumps(index).encode()) + 32
+    data_offset = (_HEADER.size + length + 7) // 8 * 8
+    index["data_offset"] = data_offset
+    raw = json.dumps(index).encode()
+
+    name = f"cssnap_{snapshot.exchange.lower()}_{os.getpid()}_{int(time.time() * 1000)}"
+    size = data_offset + row * len(COLUMNS) * 8
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+    _HEADER.pack_into(shm.buf, 0, MAGIC, len(raw))
+    shm.buf[_HEADER.size:_HEADER.size + len(raw)] = raw
+    data = np.ndarray((row, len(COLUMNS)), dtype=np.float64, buffer=shm.buf, offset=data_offset)
+    for table in tables:
+        start, n, _ = index["tables"][table]
+        data[start:start + n] = snapshot.get(table)
+    del data
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    pointer = _pointer_file(snapshot.exchange)
+    tmp = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"name": name, "created": index["created"], "cycle": cycle, "tables": len(tables)}, f)
+    os.replace(tmp, pointer)
+
+    with _publish_lock:
+        old = _published.pop(snapshot.exchange, None)
+        _published[snapshot.exchange] = shm
+    if old is not None:
+        _release(old)
+    logger.info("已发布扫描快照 %s: %s 张表, %.1fMB", name, len(tables), size / 1e6)
+    return name
+
+
+def _release(shm):
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+@atexit.register
+def unpublish_all():
+    """回收本进程发布的所有快照 (退出时自动调用)"""
+    with _publish_lock:
+        items = list(_published.items())
+        _published.clear()
+    for exchange, shm in items:
+        pointer = _pointer_file(exchange)
+        try:
+            with open(pointer) as f:
+                if json.load(f).get("name") == shm.name:
+                    os.remove(pointer)
+        except (OSError, ValueError):
+            pass
+        _release(shm)
@@ -1,6 +1,7 @@
 
 
 from htx_get import fetch_signals
+from Profiler import profile_target
 
 def scanlist(list_hot,timedesc):
     signals_list = []
@@ -11,7 +12,8 @@ def scanlist(list_hot,timedesc):
         bHavesign = False
 
         # 调用已有函数获取 DataFrame
-        df = fetch_signals(symbol=symbol, period=timedesc, size=288, return_df=True)
+        with profile_target(symbol, timedesc):
+            df = fetch_signals(symbol=symbol, period=timedesc, size=288, return_df=True)
 
         for i in range(1, len(df)):
             prev, curr = df.iloc[i - 1], df.iloc[i]
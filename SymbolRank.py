@@ -0,0 +1,175 @@
+"""
+按流动性给交易对排序，并决定每个交易对的扫描频率
+
+排名完全来自库里已有的K线 (不额外请求接口): 取 1 小时K线最近 24 小时的成交额和成交笔数，
+结果存在 symbol_rank 表，RANK_REFRESH 秒重算一次。
+
+分档 (TIERS):
+    第 0 档  成交额前 50 + PINNED_SYMBOLS      每轮都扫
+    第 1 档  接下来的 150 个 (以及还没有排名的)  每 3 轮扫一次
+    第 2 档  其余交易对，或 24 小时成交笔数不足 MIN_TRADES 的  每 10 轮扫一次
+
+低档交易对按 "index" 错开，每轮只扫该档的 1/every，所以每轮的请求量是平稳的，
+总请求量比每轮全扫少，流动性好的交易对信号延迟更低。
+
+PINNED_SYMBOLS 环境变量 (逗号分隔) 里的交易对总在第 0 档，用来放实际在交易的币。
+"""
+import os
+import time
+import sqlite3
+import logging
+
+from ConstDef import ALL_CONST, g_ACD
+
+logger = logging.getLogger(__name__)
+
+RANK_TABLE = "symbol_rank"
+RANK_REFRESH = 3600
+RANK_CHUNK = 200
+
+# 每个交易所: 用哪个周期的K线、成交额列、成交笔数列、时间戳单位 (每秒多少)
+RANK_SOURCE = {
+    "BINANCE": ("1h", "quote_asset_volume", "num_trades", 1000),
+    "HTX": ("60min", "vol", "count", 1),
+}
+
+# (本档最多多少个, 每几轮扫一次)；最后一档不限个数
+TIERS = [(50, 1), (150, 3), (None, 10)]
+UNRANKED_TIER = 1
+# 24 小时成交笔数低于此值直接归入最后一档
+MIN_TRADES = 1000
+
+PINNED_SYMBOLS = [s.strip() for s in os.environ.get("PINNED_SYMBOLS", "").split(",") if s.strip()]
+
+
+def init_rank_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {RANK_TABLE} (
+        exchange TEXT,
+        symbol TEXT,
+        quote_volume REAL,      -- 24 小时成交额 (计价币)
+        trades INTEGER,         -- 24 小时成交笔数
+        rank INTEGER,           -- 按成交额从 1 开始
+        tier INTEGER,
+        updated_at REAL,
+        PRIMARY KEY (exchange, symbol)
+    )
+    """)
+    conn.commit()
+
+
+# ---------------------------------------------------------
+# 计算排名
+# ---------------------------------------------------------
+def read_liquidity(conn, symbols, exchange, now=None):
+    """一组交易对最近 24 小时的 {symbol: (成交额, 成交笔数)}，没有K线表的不返回"""
+    period, vol_col, trades_col, scale = RANK_SOURCE[exchange]
+    indexname = ALL_CONST[exchange]["indexname"]
+    cutoff = int(((now or time.time()) - 24 * 3600) * scale)
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+    tables = [(s, f"{s}_{period}") for s in symbols if f"{s}_{period}" in existing]
+    result = {}
+    for start in range(0, len(tables), RANK_CHUNK):
+        chunk = tables[start:start + RANK_CHUNK]
+        sql = " UNION ALL ".join(
+            f'SELECT {i}, SUM({vol_col}), SUM({trades_col}) FROM "{t}" WHERE {indexname} >= {cutoff}'
+            for i, (_, t) in enumerate(chunk))
+        for i, vol, trades in conn.execute(sql):
+            result[chunk[i][0]] = (float(vol or 0.0), int(trades or 0))
+    return result
+
+
+def assign_tiers(liquidity, pinned=()):
+    """{symbol: (成交额, 笔数)} -> {symbol: (rank, tier)}"""
+    ordered = sorted(liquidity, key=lambda s: (-liquidity[s][0], s))
+    ranks = {}
+    tier, filled = 0, 0
+    for rank, symbol in enumerate(ordered, start=1):
+        limit = TIERS[tier][0]
+        while limit is not None and filled >= limit:
+            tier, filled = tier + 1, 0
+            limit = TIERS[tier][0]
+        filled += 1
+        t = tier
+        if liquidity[symbol][1] < MIN_TRADES:
+            t = len(TIERS) - 1
+        if symbol in pinned:
+            t = 0
+        ranks[symbol] = (rank, t)
+    return ranks
+
+
+def refresh_rank(conn, symbols, exchange=None, pinned=None, max_age=RANK_REFRESH, force=False):
+    """
+    重新计算排名并写入 symbol_rank；距上次计算不到 max_age 秒时跳过
+    返回是否重新计算
+    """
+    exchange = exchange or g_ACD.getExchange()
+    if exchange not in RANK_SOURCE:
+        return False
+    init_rank_table(conn)
+    if not force:
+        row = conn.execute(f"SELECT MAX(updated_at) FROM {RANK_TABLE} WHERE exchange=?", (exchange,)).fetchone()
+        if row and row[0] and time.time() - row[0] < max_age:
+            return False
+
+    liquidity = read_liquidity(conn, symbols, exchange)
+    ranks = assign_tiers(liquidity, set(PINNED_SYMBOLS if pinned is None else pinned))
+    now = time.time()
+    conn.execute(f"DELETE FROM {RANK_TABLE} WHERE exchange=?", (exchange,))
+    conn.executemany(f"INSERT INTO {RANK_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [(exchange, s, liquidity[s][0], liquidity[s][1], r, t, now) for s, (r, t) in ranks.items()])
+    conn.commit()
+    logger.info("%s 流动性排名已更新: %s 个交易对", exchange, len(ranks))
+    return True
+
+
+def load_rank(conn, exchange=None):
+    """{symbol: (rank, tier)}；没有排名时返回空字典"""
+    exchange = exchange or g_ACD.getExchange()
+    try:
+        rows = conn.execute(f"SELECT symbol, rank, tier FROM {RANK_TABLE} WHERE exchange=?", (exchange,)).fetchall()
+    except Exception:
+        return {}
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+# ---------------------------------------------------------
+# 调度
+# ---------------------------------------------------------
+def scan_plan(symbols, ranks, cycle, pinned=None):
+    """
+    本轮要扫描的交易对，按 (档位, 排名) 排序
+    symbols: [(index, symbol)]；ranks: load_rank() 的结果
+    """
+    pinned = set(PINNED_SYMBOLS if pinned is None else pinned)
+    plan = []
+    for index, symbol in symbols:
+        rank, tier = ranks.get(symbol, (None, UNRANKED_TIER))
+        if symbol in pinned:
+            tier = 0
+        every = TIERS[tier][1]
+        # 按 index 错开，同一档每轮只扫 1/every
+        if (cycle + index) % every == 0:
+            plan.append((tier, rank if rank is not None else float("inf"), index, symbol))
+    plan.sort()
+    return [(index, symbol) for _, _, index, symbol in plan]
+
+
+def hot_symbols(conn=None, n=24, exchange=None, fallback=()):
+    """成交额排名前 n 的交易对；还没有排名 (或读不到库) 时返回 fallback"""
+    exchange = exchange or g_ACD.getExchange()
+    try:
+        close = conn is None
+        if close:
+            conn = sqlite3.connect(ALL_CONST[exchange]["DB"])
+        try:
+            rows = conn.execute(f"SELECT symbol FROM {RANK_TABLE} WHERE exchange=? ORDER BY rank LIMIT ?",
+                                (exchange, n)).fetchall()
+        finally:
+            if close:
+                conn.close()
+    except Exception:
+        rows = []
+    return [r[0] for r in rows] or list(fallback)
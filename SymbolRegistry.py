@@ -0,0 +1,317 @@
+"""
+交易对注册表
+
+以前 updateSymbols 每次都把 exchangeInfo 整个下载下来，to_sql(if_exists="replace") 重写 all_symbol，
+"index" 会被重新编号，ScanAllData 用 lastIndex.txt 断点续扫时就会跳过或重复交易对。
+
+现在的做法:
+  1. 带 If-None-Match / If-Modified-Since 请求，服务端返回 304 时什么都不做；
+     币安的 exchangeInfo 里有 serverTime，每次内容都不同，所以再对解析后的记录算一次哈希，
+     与上次相同也直接返回
+  2. 有变化时和表里的记录逐条比较，只做新增、状态变化和下架
+  3. "index" 是 AUTOINCREMENT 主键，新交易对追加在末尾，旧编号永不改变、永不复用
+  4. 从接口里消失或状态变为不可交易的交易对先标记 active=0，
+     超过 DELIST_GRACE 秒仍未恢复再清理K线表和派生数据
+  5. 返回内容不符合预期 (缺少交易对列表或一个交易对都没有) 时报错，不做任何修改，
+     避免一次异常的响应把整个库清空
+
+用法:
+    from SymbolRegistry import refresh_symbols
+    result = refresh_symbols(conn)            # 使用 g_ACD 当前交易所
+    result = refresh_symbols(conn, "HTX")
+"""
+import json
+import time
+import hashlib
+import logging
+
+from ConstDef import ALL_CONST, g_ACD, api_url
+from ExchangeClient import g_client
+from IndicatorStore import INDICATOR_TABLE, STATE_TABLE
+from KlineArchive import ARCHIVE_TABLE
+
+logger = logging.getLogger(__name__)
+
+META_TABLE = "symbol_registry_meta"
+
+# 不可交易状态持续多久后清理K线数据 (秒)，期间恢复交易则保留
+DELIST_GRACE = 3 * 24 * 3600
+
+# 按 symbol 存放的派生数据表 (IndicatorStore / CheckByEMA.EMA_SIGNALS_TABLE / KlineArchive)
+# 归档块也要删，否则重新上市后 load_history 会把旧的历史接到新序列前面
+DERIVED_TABLES = (INDICATOR_TABLE, STATE_TABLE, "ema_signals", ARCHIVE_TABLE)
+
+# 各交易所: 保存的字段、表示状态的字段、可交易的状态值
+REGISTRY_SPEC = {
+    "HTX": {
+        "columns": ["symbol", "symbol-partition", "state", "api-trading"],
+        "status": "state",
+        "tradable": {"online"},
+    },
+    "BINANCE": {
+        "columns": ["symbol", "status", "baseAsset", "quoteAsset"],
+        "status": "status",
+        "tradable": {"TRADING"},
+    },
+}
+
+
+class RefreshResult:
+    def __init__(self):
+        self.not_modified = False
+        self.unchanged = False
+        self.added = []
+        self.changed = []
+        self.deactivated = []
+        self.reactivated = []
+        self.purged = []
+
+    @property
+    def changes(self):
+        return len(self.added) + len(self.changed) + len(self.deactivated) + len(self.purged)
+
+    def __repr__(self):
+        if not self.changes:
+            return "RefreshResult(无变化)"
+        return (f"RefreshResult(新增={len(self.added)} 状态变化={len(self.changed)} "
+                f"停止交易={len(self.deactivated)} 恢复交易={len(self.reactivated)} 清理={len(self.purged)})")
+
+
+# ---------------------------------------------------------
+# 表结构
+# ---------------------------------------------------------
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def init_registry(conn, exchange):
+    """建表；旧的 to_sql 表原样迁移，保留原来的 "index" """
+    table = ALL_CONST[exchange]["Table_symbols"]
+    columns = REGISTRY_SPEC[exchange]["columns"]
+
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {META_TABLE} (
+        exchange TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        payload_hash TEXT,
+        fetched_at REAL
+    )
+    """)
+
+    existing = [r[1] for r in conn.execute(f"PRAGMA table_info({_q(table)})")]
+    if existing and "active" in existing:
+        conn.commit()
+        return
+
+    if existing:
+        conn.execute(f"ALTER TABLE {_q(table)} RENAME TO {_q(table + '_old')}")
+
+    cols = ",\n".join(f"        {_q(c)} TEXT" for c in columns if c != "symbol")
+    conn.execute(f"""
+    CREATE TABLE {_q(table)} (
+        "index" INTEGER PRIMARY KEY AUTOINCREMENT,
+        symbol TEXT NOT NULL UNIQUE,
+{cols},
+        active INTEGER NOT NULL DEFAULT 1,
+        first_seen REAL,
+        updated_at REAL,
+        inactive_since REAL
+    )
+    """)
+
+    if existing:
+        now = time.time()
+        keep = [c for c in columns if c in existing]
+        names = ", ".join(_q(c) for c in keep)
+        index_col = '"index", ' if "index" in existing else ""
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {_q(table)} ({index_col}{names}, active, first_seen, updated_at)
+            SELECT {index_col}{names}, 1, {now}, {now} FROM {_q(table + '_old')}
+        """)
+        conn.execute(f"DROP TABLE {_q(table + '_old')}")
+        logger.info("%s 已迁移为注册表结构，保留原有编号", table)
+    conn.commit()
+
+
+# ---------------------------------------------------------
+# 拉取和解析
+# ---------------------------------------------------------
+def parse_symbols(exchange, data):
+    """接口返回 -> {symbol: {字段: 值}}"""
+    columns = REGISTRY_SPEC[exchange]["columns"]
+    if exchange == "HTX":
+        if data.get("status") != "ok":
+            raise Exception(f"API error: {data}")
+        items = data.get("data")
+    else:
+        items = data.get("symbols")
+    if not isinstance(items, list):
+        raise Exception(f"{exchange} 交易对接口返回内容异常: {str(data)[:200]}")
+    if exchange != "HTX":
+        # 币安只关心 USDT 计价的交易对
+        items = [s for s in items if s.get("quoteAsset") == "USDT"]
+
+    records = {}
+    for item in items:
+        records[item["symbol"]] = {c: (None if item.get(c) is None else str(item.get(c))) for c in columns}
+    return records
+
+
+def records_hash(records):
+    payload = json.dumps(records, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _load_meta(conn, exchange):
+    row = conn.execute(f"SELECT etag, last_modified, payload_hash, fetched_at FROM {META_TABLE} WHERE exchange=?",
+                       (exchange,)).fetchone()
+    return row or (None, None, None, None)
+
+
+def _save_meta(conn, exchange, etag, last_modified, payload_hash):
+    conn.execute(f"INSERT OR REPLACE INTO {META_TABLE} VALUES (?, ?, ?, ?, ?)",
+                 (exchange, etag, last_modified, payload_hash, time.time()))
+
+
+# ---------------------------------------------------------
+# 刷新
+# ---------------------------------------------------------
+def refresh_symbols(conn, exchange=None, min_interval=0, purge=True):
+    """
+    刷新交易对注册表，返回 RefreshResult
+    min_interval: 距上次拉取不到这么多秒时不发请求
+    purge: 是否清理已下架交易对的K线数据
+    """
+    exchange = exchange or g_ACD.getExchange()
+    if exchange not in REGISTRY_SPEC:
+        raise ValueError(f"{exchange} 没有交易对注册表")
+    init_registry(conn, exchange)
+    result = RefreshResult()
+
+    etag, last_modified, old_hash, fetched_at = _load_meta(conn, exchange)
+    if min_interval and fetched_at and time.time() - fetched_at < min_interval:
+        result.not_modified = True
+        return result
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    resp = g_client.get(api_url(exchange, ALL_CONST[exchange]["api_symbols"]), headers=headers or None)
+
+    if resp.status_code == 304:
+        new_hash = old_hash
+        result.not_modified = True
+        logger.debug("%s 交易对未变化 (304)", exchange)
+    elif resp.status_code != 200:
+        raise Exception(f"{exchange} 交易对接口返回 {resp.status_code}: {resp.text[:200]}")
+    else:
+        records = parse_symbols(exchange, resp.json())
+        if not records:
+            raise Exception(f"{exchange} 交易对接口没有返回任何交易对，不更新注册表")
+        new_hash = records_hash(records)
+        etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        if new_hash == old_hash:
+            result.unchanged = True
+        else:
+            apply_diff(conn, exchange, records, result)
+
+    if purge:
+        purge_delisted(conn, exchange, result)
+    _save_meta(conn, exchange, etag, last_modified, new_hash)
+    conn.commit()
+    if result.changes:
+        logger.info("%s 交易对 %s", exchange, result)
+    return result
+
+
+def apply_diff(conn, exchange, records, result):
+    """把 records 和表里的记录比较，只写有变化的行"""
+    spec = REGISTRY_SPEC[exchange]
+    table = ALL_CONST[exchange]["Table_symbols"]
+    columns = spec["columns"]
+    status_col = spec["status"]
+    tradable = spec["tradable"]
+    now = time.time()
+
+    names = ", ".join(_q(c) for c in columns)
+    stored = {}
+    cur = conn.cursor()
+    cur.row_factory = None
+    for row in cur.execute(f"SELECT {names}, active FROM {_q(table)}"):
+        stored[row[0]] = (dict(zip(columns, row[:-1])), row[-1])
+
+    inserts, updates = [], []
+    for symbol, rec in records.items():
+        active = 1 if rec.get(status_col) in tradable else 0
+        if symbol not in stored:
+            inserts.append((*[rec[c] for c in columns], active, now, now, None if active else now))
+            result.added.append(symbol)
+            continue
+        old, old_active = stored[symbol]
+        if old == rec and old_active == active:
+            continue
+        updates.append((*[rec[c] for c in columns[1:]], active, now, active, old_active, now, symbol))
+        result.changed.append(symbol)
+        if old_active and not active:
+            result.deactivated.append(symbol)
+        elif active and not old_active:
+            result.reactivated.append(symbol)
+
+    # 接口里已经没有的交易对视为不可交易，超过 DELIST_GRACE 后由 purge_delisted 清理
+    gone = [s for s in stored if s not in records and stored[s][1]]
+
+    placeholders = ", ".join("?" * (len(columns) + 4))
+    conn.executemany(f"""INSERT INTO {_q(table)} ({names}, active, first_seen, updated_at, inactive_since)
+                         VALUES ({placeholders})""", inserts)
+    sets = ", ".join(f"{_q(c)}=?" for c in columns[1:])
+    # inactive_since: 变为不可交易时记下时间，恢复交易时清空，其它情况保持不变
+    conn.executemany(f"""UPDATE {_q(table)} SET {sets}, active=?, updated_at=?,
+                         inactive_since = CASE WHEN ?=1 THEN NULL
+                                               WHEN ?=1 THEN ?
+                                               ELSE inactive_since END
+                         WHERE symbol=?""", updates)
+    if gone:
+        conn.executemany(f"UPDATE {_q(table)} SET active=0, updated_at=?, inactive_since=? WHERE symbol=?",
+                         [(now, now, s) for s in gone])
+        result.deactivated.extend(gone)
+
+
+def purge_delisted(conn, exchange, result, grace=DELIST_GRACE):
+    """清理不可交易超过 grace 秒的交易对"""
+    table = ALL_CONST[exchange]["Table_symbols"]
+    rows = conn.execute(f"SELECT symbol FROM {_q(table)} WHERE active=0 AND inactive_since < ?",
+                        (time.time() - grace,)).fetchall()
+    symbols = [r[0] for r in rows]
+    if symbols:
+        drop_symbols(conn, exchange, symbols)
+        result.purged.extend(symbols)
+
+
+def drop_symbols(conn, exchange, symbols):
+    """删除交易对的注册表记录、各周期K线表和派生数据"""
+    table = ALL_CONST[exchange]["Table_symbols"]
+    periods = list(ALL_CONST[exchange]["interval"].keys())
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+    for symbol in symbols:
+        for period in periods:
+            kline_table = f"{symbol}_{period}"
+            if kline_table in existing:
+                conn.execute(f"DROP TABLE {_q(kline_table)}")
+        for derived in DERIVED_TABLES:
+            if derived in existing:
+                conn.execute(f"DELETE FROM {derived} WHERE symbol=?", (symbol,))
+        conn.execute(f"DELETE FROM {_q(table)} WHERE symbol=?", (symbol,))
+        logger.info("%s 已下架，清理K线数据", symbol)
+
+
+def active_symbols(conn, exchange=None):
+    """按编号顺序返回可交易的 [(index, symbol)]"""
+    exchange = exchange or g_ACD.getExchange()
+    table = ALL_CONST[exchange]["Table_symbols"]
+    cur = conn.cursor()
+    cur.row_factory = None
+    return cur.execute(f'SELECT "index", symbol FROM {_q(table)} WHERE active=1 ORDER BY "index"').fetchall()
@@ -435,7 +435,8 @@ hot_symbols = [
     "bchusdt", "vetusdt", "xlmusdt", "algousdt", "nearusdt"
 ]
 
-for symbol in hot_symbols:
-    BackTestOne(symbol,TIME,500)
+if __name__ == "__main__":
+    for symbol in hot_symbols:
+        BackTestOne(symbol,TIME,500)
 
 
@@ -0,0 +1,487 @@
+"""
+热点路径基准测试
+
+用法:
+    python benchmarks/bench_hotpaths.py --save-baseline     # 第一步: 在本机跑一遍，保存为基线
+    python benchmarks/bench_hotpaths.py                    # 跑全部用例，并与 baseline.json 对比
+    python benchmarks/bench_hotpaths.py --only chan         # 只跑名字包含 chan 的用例
+    python benchmarks/bench_hotpaths.py --save-baseline     # 把本次结果保存为新的基线
+    python benchmarks/bench_hotpaths.py --quick             # 缩小数据规模，快速冒烟
+
+每个用例输出: 中位耗时、吞吐 (条/秒)、峰值内存 (tracemalloc)、相对基线的倍数。
+所有网络请求都被替换为本地假数据，结果只取决于代码本身。
+
+耗时和机器有关，baseline.json 不入库 (见 .gitignore)；换机器或全新 checkout 后先在改动前的代码上
+跑一次 --save-baseline。没有基线时只输出本次结果，--fail-on-regression 会直接报错退出。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+import contextlib
+
+# --- [路径修正] 确保能引用到主目录和 chantheory/core ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+core_dir = os.path.join(parent_dir, 'chantheory', 'core')
+for path in (parent_dir, core_dir, current_dir):
+    if path not in sys.path:
+        sys.path.append(path)
+
+import fixtures
+
+BASELINE_FILE = os.path.join(current_dir, 'baseline.json')
+
+# 慢于基线多少倍算退化
+REGRESSION_RATIO = 1.25
+
+
+class Case:
+    """
+    一个基准用例
+    fn    : 被计时的函数 (无参数)
+    items : 每次调用处理的条数，用于计算吞吐
+    setup : 每次计时前调用 (不计入耗时)，例如重建数据库
+    """
+
+    def __init__(self, fn, items, unit='bars', setup=None, teardown=None):
+        self.fn = fn
+        self.items = items
+        self.unit = unit
+        self.setup = setup
+        self.teardown = teardown
+
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    def wrap(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return wrap
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被测代码里的 print (格式化开销仍计入耗时)"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+# =========================================================
+# 假交易所 (进程内替换 g_client.get)
+# =========================================================
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        return self._payload
+
+    @property
+    def content(self):
+        # 装了 orjson 时 KlineParser.response_json 读原始字节
+        return json.dumps(self._payload).encode()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeBinanceKlines:
+    """按 (symbol, interval) 生成确定的K线序列，按 limit 返回最新的若干根"""
+
+    def __init__(self, symbols, periods, n):
+        from ConstDef import BINANCE_INTERVAL
+        self.seeds = {}
+        for s_idx, symbol in enumerate(symbols):
+            for p_idx, period in enumerate(periods):
+                self.seeds[(symbol, period)] = (s_idx * 100 + p_idx, BINANCE_INTERVAL[period])
+        self.n = n
+        self._rows = {}
+        self.calls = 0
+
+    def rows(self, symbol, period):
+        key = (symbol, period)
+        if key not in self._rows:
+            seed, interval_sec = self.seeds[key]
+            self._rows[key] = fixtures.binance_rows(fixtures.make_ohlcv(self.n, interval_sec, seed=seed), interval_sec)
+        return self._rows[key]
+
+    def get(self, url, params=None, **kwargs):
+        self.calls += 1
+        rows = self.rows(params['symbol'], params['interval'])
+        return FakeResponse(rows[-int(params['limit']):])
+
+
+@contextlib.contextmanager
+def patched(module, attr, value):
+    old = getattr(module, attr)
+    setattr(module, attr, value)
+    try:
+        yield
+    finally:
+        setattr(module, attr, old)
+
+
+# =========================================================
+# 用例
+# =========================================================
+
+@benchmark('boll_convergence_table')
+def bench_boll_convergence_table(scale):
+    from CheckbyBoll import check_bollinger_convergence
+    df = fixtures.load_recorded('binance_table')
+    if df is None:
+        df = fixtures.binance_frame(1000)
+    return Case(lambda: check_bollinger_convergence(df), len(df))
+
+
+@benchmark('boll_breakout_table')
+def bench_boll_breakout_table(scale):
+    from ConstDef import g_ACD
+    from CheckbyBoll import check_bollinger_breakout_by_kline
+    g_ACD.setExchange("BINANCE")
+    tmp = tempfile.mkdtemp()
+    db = os.path.join(tmp, 'bench.db')
+    fixtures.build_binance_db(db, ['BENCHUSDT'], ['5m'], 1000)
+    import sqlite3
+    conn = sqlite3.connect(db)
+
+    def run():
+        with quiet():
+            check_bollinger_breakout_by_kline(conn, 'BENCHUSDT_5m', g_ACD.getIndexName())
+
+    def teardown():
+        conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return Case(run, 1, unit='tables', teardown=teardown)
+
+
+@benchmark('boll_scan_universe')
+def bench_boll_scan_universe(scale):
+    """ScanAllData 一轮的读库 + 收敛 + 触轨检查 (不含网络和通知)"""
+    import sqlite3
+    import pandas as pd
+    from ConstDef import g_ACD, BINANCE_INTERVAL
+    from CheckbyBoll import check_bollinger_convergence, check_bollinger_breakout_by_kline
+    g_ACD.setExchange("BINANCE")
+
+    symbols = [f"SYM{i:03d}USDT" for i in range(max(2, int(40 * scale)))]
+    periods = list(BINANCE_INTERVAL.keys())
+    tmp = tempfile.mkdtemp()
+    db = os.path.join(tmp, 'bench.db')
+    with quiet():
+        fixtures.build_binance_db(db, symbols, periods, 300)
+    conn = sqlite3.connect(db)
+    indexname = g_ACD.getIndexName()
+
+    def run():
+        with quiet():
+            for symbol in symbols:
+                for period in periods:
+                    table = f"{symbol}_{period}"
+                    df = pd.read_sql(f'SELECT * FROM "{table}" ORDER BY open_time', conn)
+                    check_bollinger_convergence(df)
+                    check_bollinger_breakout_by_kline(conn, table, indexname)
+
+    def teardown():
+        conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return Case(run, len(symbols) * len(periods), unit='tables', teardown=teardown)
+
+
+@benchmark('ema_cross_universe')
+def bench_ema_cross_universe(scale):
+    """400 个交易对的 EMA7/25/99 交叉，一次批量检测"""
+    from CheckByEMA import detect_ema_signals_batch, stack_closes
+    n_symbols = max(2, int(400 * scale))
+    closes = stack_closes([fixtures.make_ohlcv(302, seed=i)['close'] for i in range(n_symbols)])
+    return Case(lambda: detect_ema_signals_batch(closes), n_symbols, unit='symbols')
+
+
+@benchmark('archive_cold_read')
+def bench_archive_cold_read(scale):
+    """一年的 5 分钟线从压缩归档读出，与 table_cold_read (整表 read_sql) 对比"""
+    import sqlite3
+    import KlineArchive
+    from ConstDef import g_ACD
+    g_ACD.setExchange("BINANCE")
+    n = max(8192, int(105120 * scale))
+    tmp = tempfile.mkdtemp()
+    db = os.path.join(tmp, 'archive.db')
+    fixtures.build_binance_db(db, ["ARCHUSDT"], ["5m"], n)
+    conn = sqlite3.connect(db)
+    KlineArchive.archive_table(conn, "ARCHUSDT", "5m", keep=KlineArchive.MIN_HOT_BARS)
+
+    def teardown():
+        conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return Case(lambda: KlineArchive.load_history(conn, "ARCHUSDT", "5m"), n, teardown=teardown)
+
+
+@benchmark('table_cold_read')
+def bench_table_cold_read(scale):
+    import sqlite3
+    import pandas as pd
+    n = max(8192, int(105120 * scale))
+    tmp = tempfile.mkdtemp()
+    db = os.path.join(tmp, 'table.db')
+    fixtures.build_binance_db(db, ["ARCHUSDT"], ["5m"], n)
+    conn = sqlite3.connect(db)
+
+    def teardown():
+        conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return Case(lambda: pd.read_sql('SELECT * FROM "ARCHUSDT_5m" ORDER BY open_time', conn), n, teardown=teardown)
+
+
+@benchmark('htx_fetch_signals')
+def bench_htx_fetch_signals(scale):
+    import htx_get
+    payload = fixtures.htx_payload(fixtures.make_ohlcv(288, 1800))
+    fake_get = lambda url, params=None, **kwargs: FakeResponse(payload)
+
+    def run():
+        with patched(htx_get.g_client, 'get', fake_get), quiet():
+            htx_get.fetch_signals("benchusdt", "30min", 288)
+    return Case(run, 288)
+
+
+def chan_cases(n):
+    from chantheoryScan import ChanLunStrategy
+    # data_manager 传占位对象，避免在当前目录创建数据库
+    strategy = ChanLunStrategy(data_manager=object())
+    df = strategy.calculate_indicators(fixtures.chan_frame(n))
+    return strategy, df
+
+
+for _n in (1000, 10000, 100000):
+    @benchmark(f'chan_preprocess_{_n // 1000}k')
+    def bench_chan_preprocess(scale, n=_n):
+        n = max(200, int(n * scale))
+        strategy, df = chan_cases(n)
+        return Case(lambda: strategy.preprocess_klines(df), n)
+
+    @benchmark(f'chan_find_bi_{_n // 1000}k')
+    def bench_chan_find_bi(scale, n=_n):
+        n = max(200, int(n * scale))
+        strategy, df = chan_cases(n)
+        merged = strategy.preprocess_klines(df)
+        # find_bi 不修改输入，可以重复使用
+        return Case(lambda: strategy.find_bi(merged), n)
+
+    @benchmark(f'chan_analyze_snapshot_{_n // 1000}k')
+    def bench_chan_analyze_snapshot(scale, n=_n):
+        n = max(200, int(n * scale))
+        strategy, df = chan_cases(n)
+        return Case(lambda: strategy.analyze_snapshot('BENCH', '1h', df, None), n)
+
+
+@benchmark('backtest_strategy_dual')
+def bench_backtest_strategy_dual(scale):
+    import pandas as pd
+    import back_stratege
+    n = max(300, int(2000 * scale))
+    bars = fixtures.make_ohlcv(n, 1800)
+    df = pd.DataFrame({k: bars[k] for k in ['open', 'high', 'low', 'close', 'volume']})
+    df['time'] = pd.to_datetime(bars['ts'], unit='s')
+    df = back_stratege.compute_macd(back_stratege.compute_boll(df))
+    return Case(lambda: back_stratege.backtest_strategy_dual(df, back_stratege.entry_boll_rebound_dual), n)
+
+
+@benchmark('update_kline_universe')
+def bench_update_kline_universe(scale):
+    """DatabaseUpdate.update_all_kline 对假交易所做增量更新 (每张表落后 lag 根)"""
+    import sqlite3
+    import DatabaseUpdate
+    from ConstDef import g_ACD, BINANCE_INTERVAL
+    g_ACD.setExchange("BINANCE")
+
+    symbols = [f"SYM{i:03d}USDT" for i in range(max(2, int(20 * scale)))]
+    periods = list(BINANCE_INTERVAL.keys())
+    n, lag = 300, 5
+    exchange = FakeBinanceKlines(symbols, periods, n)
+
+    tmp = tempfile.mkdtemp()
+    template = os.path.join(tmp, 'template.db')
+    db = os.path.join(tmp, 'bench.db')
+    with quiet():
+        fixtures.build_binance_db(template, symbols, periods, n, lag=lag)
+    state = {}
+
+    def setup():
+        shutil.copyfile(template, db)
+        state['conn'] = sqlite3.connect(db)
+
+    def run():
+        with patched(DatabaseUpdate.g_client, 'get', exchange.get), quiet():
+            for symbol in symbols:
+                DatabaseUpdate.update_all_kline(symbol, state['conn'])
+
+    def teardown():
+        if 'conn' in state:
+            state['conn'].close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def run_and_close():
+        run()
+        state['conn'].close()
+        state.pop('conn')
+    return Case(run_and_close, len(symbols) * len(periods), unit='tables', setup=setup, teardown=teardown)
+
+
+@benchmark('update_kline_http')
+def bench_update_kline_http(scale):
+    """同上，但走真实 HTTP 到本地假交易所 (benchmarks/fake_exchange.py)，包含连接和解析开销"""
+    import sqlite3
+    import DatabaseUpdate
+    import fake_exchange
+    from ConstDef import g_ACD, BINANCE_INTERVAL
+    g_ACD.setExchange("BINANCE")
+
+    server, exchange, base = fake_exchange.start_in_thread(latency_ms=0)
+    g_ACD.setApiBase(base)
+    symbols = [f"SYM{i:03d}USDT" for i in range(max(2, int(10 * scale)))]
+    periods = list(BINANCE_INTERVAL.keys())
+    lag = 5
+
+    tmp = tempfile.mkdtemp()
+    template = os.path.join(tmp, 'template.db')
+    db = os.path.join(tmp, 'bench.db')
+
+    # 先从假交易所全量拉一遍，再删掉每张表最新的 lag 根，制造增量
+    conn = sqlite3.connect(template)
+    with quiet():
+        for symbol in symbols:
+            DatabaseUpdate.update_all_kline(symbol, conn)
+    for symbol in symbols:
+        for period in periods:
+            conn.execute(f'DELETE FROM "{symbol}_{period}" WHERE open_time IN '
+                         f'(SELECT open_time FROM "{symbol}_{period}" ORDER BY open_time DESC LIMIT {lag})')
+    conn.commit()
+    conn.close()
+    state = {}
+
+    def setup():
+        shutil.copyfile(template, db)
+        state['conn'] = sqlite3.connect(db)
+
+    def run():
+        with quiet():
+            for symbol in symbols:
+                DatabaseUpdate.update_all_kline(symbol, state['conn'])
+        state.pop('conn').close()
+
+    def teardown():
+        if 'conn' in state:
+            state.pop('conn').close()
+        g_ACD.setApiBase(None)
+        server.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return Case(run, len(symbols) * len(periods), unit='tables', setup=setup, teardown=teardown)
+
+
+# =========================================================
+# 计时 & 报告
+# =========================================================
+
+def measure(case, repeat):
+    """返回 (中位耗时秒, 峰值内存MB)"""
+    # 预热一次
+    if case.setup:
+        case.setup()
+    case.fn()
+
+    timings = []
+    for _ in range(repeat):
+        if case.setup:
+            case.setup()
+        t0 = time.perf_counter()
+        case.fn()
+        timings.append(time.perf_counter() - t0)
+
+    # 单独跑一次测峰值内存 (tracemalloc 会拖慢执行，不与计时混在一起)
+    if case.setup:
+        case.setup()
+    tracemalloc.start()
+    case.fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak / 1024 / 1024
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CryptoSignal 热点路径基准测试')
+    parser.add_argument('--only', default='', help='只运行名字包含该字符串的用例')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help='数据规模缩小到 1/10')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    scale = 0.1 if args.quick else 1.0
+    baseline = load_baseline(args.baseline)
+    if not baseline and not args.save_baseline:
+        print(f"没有找到基线 {args.baseline}，本次只输出结果；先在改动前的代码上运行 --save-baseline 生成基线")
+        if args.fail_on_regression:
+            sys.exit(2)
+    results = {}
+    regressions = []
+
+    print(f"{'用例':<28}{'中位耗时':>12}{'吞吐':>22}{'峰值内存':>12}{'对比基线':>12}")
+    for name, factory in BENCHMARKS:
+        if args.only and args.only not in name:
+            continue
+        case = factory(scale)
+        try:
+            seconds, peak_mb = measure(case, args.repeat)
+        finally:
+            if case.teardown:
+                case.teardown()
+
+        throughput = case.items / seconds if seconds > 0 else float('inf')
+        results[name] = {'seconds': seconds, 'throughput': throughput, 'unit': case.unit,
+                         'items': case.items, 'peak_mb': peak_mb, 'scale': scale}
+
+        compare = '-'
+        base = baseline.get(name)
+        if base and base.get('scale') == scale:
+            ratio = seconds / base['seconds']
+            compare = f"x{ratio:.2f}"
+            if ratio > REGRESSION_RATIO:
+                compare += ' ⚠️'
+                regressions.append(name)
+        print(f"{name:<28}{seconds * 1000:>10.2f}ms{throughput:>15.0f} {case.unit}/s{peak_mb:>10.2f}MB{compare:>12}")
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"基线已保存到 {args.baseline}")
+
+    if regressions:
+        print(f"\n以下用例慢于基线 {REGRESSION_RATIO} 倍以上: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+本地假交易所：同一个端口同时模拟 HTX / Binance / Hyperliquid 的K线和交易对接口，
+用于离线压测拉取链路的吞吐和重试行为。
+
+    python benchmarks/fake_exchange.py --port 8800 --latency-ms 30 --jitter-ms 20 --error-rate 0.01
+
+然后把各交易所的接口指向它 (ConstDef 会读取这些环境变量):
+    export HTX_API_BASE=http://127.0.0.1:8800
+    export BINANCE_API_BASE=http://127.0.0.1:8800
+    export HYPERLIQUID_API_BASE=http://127.0.0.1:8800
+
+特性:
+  - K线由 (交易所, 交易对, 周期, 开盘时间) 确定性生成，任意时间区间结果都一样
+  - 与真实接口一致的单次返回上限 (HTX 2000 / Binance 1000 / Hyperliquid 5000)
+  - 按权重计数的限频，返回 X-MBX-USED-WEIGHT-1M 等头；超限返回 429 + Retry-After
+  - 可注入固定延迟、随机抖动和随机 429
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 各交易所周期 (秒)
+HTX_PERIODS = {
+    "1min": 60, "5min": 300, "15min": 900, "30min": 1800, "60min": 3600,
+    "2hour": 7200, "4hour": 14400, "6hour": 21600, "12hour": 43200,
+    "1day": 86400, "3day": 259200, "1week": 604800, "1mon": 2592000
+}
+BINANCE_PERIODS = {
+    "1m": 60, "3m": 180, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "2h": 7200,
+    "4h": 14400, "6h": 21600, "8h": 28800, "12h": 43200, "1d": 86400, "3d": 259200, "1w": 604800
+}
+HYPERLIQUID_PERIODS = {
+    "1m": 60, "3m": 180, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "2h": 7200,
+    "4h": 14400, "8h": 28800, "12h": 43200, "1d": 86400, "3d": 259200, "1w": 604800
+}
+
+# 单次请求返回上限
+MAX_HTX = 2000
+MAX_BINANCE = 1000
+MAX_HYPERLIQUID = 5000
+
+# 限频: (每个窗口的权重上限, 窗口秒数)
+RATE_LIMITS = {
+    "HTX": (800, 1),
+    "BINANCE": (6000, 60),
+    "HYPERLIQUID": (1200, 60),
+}
+
+
+def _noise(*key):
+    """(key) -> [-1, 1) 的确定性噪声"""
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') / 2**63 - 1.0
+
+
+def make_bar(exchange, symbol, interval_sec, open_ts):
+    """按开盘时间 (秒) 确定性地生成一根K线，返回 (open, high, low, close, volume)"""
+    base = 10 ** (1 + int(abs(_noise(symbol)) * 4))
+    def price(t):
+        return base * math.exp(0.08 * math.sin(t / 86400.0) + 0.03 * math.sin(t / 7200.0)
+                               + 0.004 * _noise(exchange, symbol, t // 60))
+    open_ = price(open_ts)
+    close = price(open_ts + interval_sec)
+    wick = abs(_noise(symbol, interval_sec, open_ts)) * 0.003
+    high = max(open_, close) * (1 + wick)
+    low = min(open_, close) * (1 - wick)
+    volume = 1000 * (1.5 + _noise(exchange, symbol, interval_sec, open_ts))
+    return open_, high, low, close, volume
+
+
+def bar_range(interval_sec, limit, start_ts=None, end_ts=None, now=None):
+    """计算要返回的开盘时间列表 (秒)，最新一根是正在形成的K线"""
+    now = time.time() if now is None else now
+    last_open = int(now // interval_sec) * interval_sec
+    if end_ts is not None:
+        last_open = min(last_open, int(end_ts // interval_sec) * interval_sec)
+    if start_ts is not None:
+        first_open = int(math.ceil(start_ts / interval_sec)) * interval_sec
+        count = min(limit, max(0, (last_open - first_open) // interval_sec + 1))
+        return [first_open + i * interval_sec for i in range(count)]
+    count = max(0, limit)
+    return [last_open - (count - 1 - i) * interval_sec for i in range(count)]
+
+
+class RateLimiter:
+    """固定窗口的权重计数"""
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def consume(self, exchange, weight):
+        """返回 (是否放行, 当前窗口已用权重, 需要等待的秒数)"""
+        budget, window = self.limits[exchange]
+        now = time.time()
+        with self.lock:
+            start, used = self.windows.get(exchange, (now, 0))
+            if now - start >= window:
+                start, used = now, 0
+            if used + weight > budget:
+                self.windows[exchange] = (start, used)
+                return False, used, max(1, int(math.ceil(start + window - now)))
+            used += weight
+            self.windows[exchange] = (start, used)
+            return True, used, 0
+
+
+class FakeExchange:
+    def __init__(self, symbols=50, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limits=None, seed=0):
+        self.symbols = [f"SYM{i:03d}" for i in range(symbols)]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.limiter = RateLimiter(rate_limits or RATE_LIMITS)
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "throttled": 0, "injected_errors": 0}
+        self.stats_lock = threading.Lock()
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    # ---------------- HTX ----------------
+    def htx_kline(self, q):
+        symbol, period = q.get("symbol", "btcusdt"), q.get("period", "1min")
+        if period not in HTX_PERIODS:
+            return 200, {"status": "error", "err-msg": f"invalid period {period}"}
+        size = min(int(q.get("size", 150)), MAX_HTX)
+        interval = HTX_PERIODS[period]
+        data = []
+        for ts in reversed(bar_range(interval, size)):
+            o, h, l, c, v = make_bar("HTX", symbol, interval, ts)
+            data.append({"id": ts, "open": o, "high": h, "low": l, "close": c,
+                         "amount": v, "vol": v * c, "count": int(v) % 5000 + 1})
+        return 200, {"status": "ok", "ch": f"market.{symbol}.kline.{period}", "ts": int(time.time() * 1000), "data": data}
+
+    def htx_symbols(self, q):
+        data = [{"symbol": f"{s.lower()}usdt", "symbol-partition": "main", "state": "online",
+                 "api-trading": "enabled", "base-currency": s.lower(), "quote-currency": "usdt"}
+                for s in self.symbols]
+        return 200, {"status": "ok", "data": data}
+
+    def htx_trade(self, q):
+        symbol = q.get("symbol", "btcusdt")
+        ts = int(time.time() // 60) * 60
+        price = make_bar("HTX", symbol, 60, ts)[3]
+        return 200, {"status": "ok", "tick": {"data": [{"price": price, "ts": int(time.time() * 1000)}]}}
+
+    # ---------------- Binance ----------------
+    def binance_klines(self, q):
+        symbol, interval_name = q.get("symbol", "BTCUSDT"), q.get("interval", "1m")
+        if interval_name not in BINANCE_PERIODS:
+            return 400, {"code": -1120, "msg": "Invalid interval."}
+        interval = BINANCE_PERIODS[interval_name]
+        limit = min(int(q.get("limit", 500)), MAX_BINANCE)
+        start = int(q["startTime"]) / 1000 if "startTime" in q else None
+        end = int(q["endTime"]) / 1000 if "endTime" in q else None
+        rows = []
+        for ts in bar_range(interval, limit, start, end):
+            o, h, l, c, v = make_bar("BINANCE", symbol, interval, ts)
+            open_ms = ts * 1000
+            rows.append([open_ms, f"{o:.8f}", f"{h:.8f}", f"{l:.8f}", f"{c:.8f}", f"{v:.8f}",
+                         open_ms + interval * 1000 - 1, f"{v * c:.8f}", int(v) % 5000 + 1,
+                         f"{v / 2:.8f}", f"{v * c / 2:.8f}", "0"])
+        return 200, rows
+
+    def binance_exchange_info(self, q):
+        symbols = [{"symbol": f"{s}USDT", "status": "TRADING", "baseAsset": s, "quoteAsset": "USDT"}
+                   for s in self.symbols]
+        return 200, {"timezone": "UTC", "serverTime": int(time.time() * 1000), "symbols": symbols}
+
+    # ---------------- Hyperliquid ----------------
+    def hyperliquid_info(self, body):
+        kind = body.get("type")
+        if kind == "allMids":
+            ts = int(time.time() // 60) * 60
+            return 200, {s: f"{make_bar('HYPERLIQUID', s, 60, ts)[3]:.6f}" for s in self.symbols + ["BTC", "ETH"]}
+        if kind == "meta":
+            return 200, {"universe": [{"name": s, "szDecimals": 2} for s in self.symbols + ["BTC", "ETH"]]}
+        if kind != "candleSnapshot":
+            return 400, {"error": f"unsupported type {kind}"}
+
+        req = body.get("req", {})
+        coin, interval_name = req.get("coin", "BTC"), req.get("interval", "1m")
+        if interval_name not in HYPERLIQUID_PERIODS:
+            return 400, {"error": "invalid interval"}
+        interval = HYPERLIQUID_PERIODS[interval_name]
+        start = int(req.get("startTime", 0)) / 1000
+        end = int(req["endTime"]) / 1000 if req.get("endTime") else None
+        # 与真实接口一致：只提供最近 MAX_HYPERLIQUID 根
+        earliest = (int(time.time() // interval) - MAX_HYPERLIQUID + 1) * interval
+        candles = []
+        for ts in bar_range(interval, MAX_HYPERLIQUID, max(start, earliest), end):
+            o, h, l, c, v = make_bar("HYPERLIQUID", coin, interval, ts)
+            candles.append({"t": ts * 1000, "T": (ts + interval) * 1000 - 1, "s": coin, "i": interval_name,
+                            "o": f"{o:.6f}", "h": f"{h:.6f}", "l": f"{l:.6f}", "c": f"{c:.6f}",
+                            "v": f"{v:.4f}", "n": int(v) % 5000 + 1})
+        return 200, candles
+
+
+# 路由: (方法, 路径) -> (交易所, 权重, 处理函数名)
+ROUTES = {
+    ("GET", "/market/history/kline"): ("HTX", 1, "htx_kline"),
+    ("GET", "/v1/common/symbols"): ("HTX", 1, "htx_symbols"),
+    ("GET", "/market/trade"): ("HTX", 1, "htx_trade"),
+    ("GET", "/api/v3/klines"): ("BINANCE", 2, "binance_klines"),
+    ("GET", "/api/v3/exchangeInfo"): ("BINANCE", 20, "binance_exchange_info"),
+    ("POST", "/info"): ("HYPERLIQUID", 20, "hyperliquid_info"),
+}
+
+
+def make_handler(exchange):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # keep-alive 连接上头和包体分两次写，不关 Nagle 会被延迟 ACK 卡 40ms
+        disable_nagle_algorithm = True
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, str(v))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _dispatch(self, method):
+            parsed = urlparse(self.path)
+            route = ROUTES.get((method, parsed.path))
+            if route is None:
+                return self._send(404, {"error": "not found"})
+            name, weight, handler_name = route
+            exchange.count("requests")
+
+            # 延迟注入
+            delay = exchange.latency_ms + exchange.random.uniform(0, exchange.jitter_ms)
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+
+            allowed, used, retry_after = exchange.limiter.consume(name, weight)
+            headers = {"X-MBX-USED-WEIGHT-1M": used} if name == "BINANCE" else {"X-RateLimit-Used": used}
+            if not allowed:
+                exchange.count("throttled")
+                headers["Retry-After"] = retry_after
+                return self._send(429, {"code": -1003, "msg": "Too many requests"}, headers)
+            if exchange.error_rate and exchange.random.random() < exchange.error_rate:
+                exchange.count("injected_errors")
+                headers["Retry-After"] = 1
+                return self._send(429, {"code": -1003, "msg": "Injected rate limit"}, headers)
+
+            try:
+                if method == "POST":
+                    length = int(self.headers.get("Content-Length", 0))
+                    status, payload = getattr(exchange, handler_name)(json.loads(self.rfile.read(length) or b"{}"))
+                else:
+                    query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                    status, payload = getattr(exchange, handler_name)(query)
+            except (ValueError, KeyError) as e:
+                status, payload = 400, {"error": str(e)}
+            return self._send(status, payload, headers)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+    return Handler
+
+
+def start_in_thread(port=0, **kwargs):
+    """在后台线程启动假交易所，返回 (server, exchange, base_url)；port=0 自动分配端口"""
+    exchange = FakeExchange(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(exchange))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fake-exchange", daemon=True)
+    thread.start()
+    return server, exchange, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假交易所 (HTX / Binance / Hyperliquid)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--symbols", type=int, default=50, help="交易对列表中的币种数量")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个请求的固定延迟")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="额外的随机延迟上限")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 429 的概率")
+    args = parser.parse_args()
+
+    exchange = FakeExchange(symbols=args.symbols, latency_ms=args.latency_ms,
+                            jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(exchange))
+    base = f"http://{args.host}:{args.port}"
+    print(f"假交易所已启动: {base}")
+    for name in ("HTX", "BINANCE", "HYPERLIQUID"):
+        print(f"  export {name}_API_BASE={base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n统计: {exchange.stats}")
+
+
+if __name__ == "__main__":
+    main()
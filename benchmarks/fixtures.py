@@ -0,0 +1,115 @@
+"""
+基准测试用的K线数据：
+1. 合成数据：固定随机种子的几何随机游走，结果可复现
+2. 录制数据：benchmarks/fixtures/<name>.csv，可用 record_table() 从本地数据库导出
+"""
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 2024-01-01 00:00:00 UTC，合成数据的起始时间 (秒)
+BASE_TS = 1704067200
+
+
+def make_ohlcv(n, interval_sec=300, start_price=100.0, seed=0, start_ts=BASE_TS):
+    """生成 n 根K线，返回 dict: ts(秒) / open / high / low / close / volume (numpy 数组)"""
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.002, n))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = rng.lognormal(mean=8, sigma=1, size=n)
+    ts = start_ts + np.arange(n, dtype=np.int64) * interval_sec
+    return {'ts': ts, 'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}
+
+
+def binance_rows(bars, interval_sec):
+    """合成数据 -> Binance /api/v3/klines 返回格式 (数值为字符串)"""
+    rows = []
+    for i in range(len(bars['ts'])):
+        open_ms = int(bars['ts'][i]) * 1000
+        vol = bars['volume'][i]
+        quote = vol * bars['close'][i]
+        rows.append([
+            open_ms, f"{bars['open'][i]:.8f}", f"{bars['high'][i]:.8f}", f"{bars['low'][i]:.8f}",
+            f"{bars['close'][i]:.8f}", f"{vol:.8f}", open_ms + interval_sec * 1000 - 1,
+            f"{quote:.8f}", int(vol) % 5000 + 1, f"{vol / 2:.8f}", f"{quote / 2:.8f}", "0"
+        ])
+    return rows
+
+
+def htx_payload(bars):
+    """合成数据 -> HTX /market/history/kline 返回格式 (新的在前)"""
+    data = []
+    for i in range(len(bars['ts']) - 1, -1, -1):
+        vol = float(bars['volume'][i])
+        data.append({
+            'id': int(bars['ts'][i]), 'open': float(bars['open'][i]), 'high': float(bars['high'][i]),
+            'low': float(bars['low'][i]), 'close': float(bars['close'][i]),
+            'amount': vol, 'vol': vol * float(bars['close'][i]), 'count': int(vol) % 5000 + 1
+        })
+    return {'status': 'ok', 'ch': 'market.bench.kline', 'data': data}
+
+
+def binance_frame(n, interval_sec=300, seed=0):
+    """与 dbbinance.db 中K线表结构一致的 DataFrame"""
+    bars = make_ohlcv(n, interval_sec, seed=seed)
+    df = pd.DataFrame(binance_rows(bars, interval_sec), columns=[
+        "open_time", "open", "high", "low", "close", "volume",
+        "close_time", "quote_asset_volume", "num_trades",
+        "taker_base_vol", "taker_quote_vol", "ignore"
+    ]).drop(columns=["ignore"])
+    for col in ["open", "high", "low", "close", "volume", "quote_asset_volume", "taker_base_vol", "taker_quote_vol"]:
+        df[col] = df[col].astype(float)
+    return df
+
+
+def chan_frame(n, interval_sec=3600, seed=0):
+    """与 MarketDataManager.load_data_for_analysis 返回结构一致的 DataFrame"""
+    bars = make_ohlcv(n, interval_sec, seed=seed)
+    df = pd.DataFrame({k: bars[k] for k in ['open', 'high', 'low', 'close', 'volume']})
+    df.insert(0, 'timestamp', pd.to_datetime(bars['ts'], unit='s'))
+    return df
+
+
+def load_recorded(name):
+    """读取录制的 fixture，不存在时返回 None"""
+    path = os.path.join(FIXTURE_DIR, f'{name}.csv')
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path)
+
+
+def record_table(db_path, table, name=None):
+    """把本地数据库里的一张K线表导出为 fixture"""
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql(f'SELECT * FROM "{table}"', conn)
+    conn.close()
+    path = os.path.join(FIXTURE_DIR, f'{name or table}.csv')
+    df.to_csv(path, index=False)
+    return path
+
+
+def build_binance_db(db_path, symbols, periods, n, lag=0):
+    """
+    建一个与 dbbinance.db 结构相同的数据库，每张表 n 根K线。
+    lag > 0 时每张表少最后 lag 根，用于测试增量更新。
+    """
+    from ConstDef import BINANCE_INTERVAL
+    from DatabaseUpdate import init_table
+
+    conn = sqlite3.connect(db_path)
+    for s_idx, symbol in enumerate(symbols):
+        for p_idx, period in enumerate(periods):
+            table = f"{symbol}_{period}"
+            init_table(conn, table)
+            df = binance_frame(n, BINANCE_INTERVAL[period], seed=s_idx * 100 + p_idx)
+            if lag:
+                df = df.iloc[:-lag]
+            df.to_sql(table, conn, if_exists="append", index=False)
+    conn.close()
@@ -1,6 +1,7 @@
-import requests
 import pandas as pd
 import pandas_ta as ta
+from ConstDef import api_url
+from ExchangeClient import g_client
 
 def fetch_binance_signals(symbol="ETHUSDT", interval="1h", limit=144, return_df=False):
     """
@@ -13,7 +14,7 @@ def fetch_binance_signals(symbol="ETHUSDT", interval="1h", limit=144, return_df=
     返回:
         DataFrame 或 信号列表
     """
-    url = "https://api.binance.com/api/v3/klines"
+    url = api_url("BINANCE", "/api/v3/klines")
     params = {
         "symbol": symbol.upper(),
         "interval": interval,
@@ -21,7 +22,7 @@ def fetch_binance_signals(symbol="ETHUSDT", interval="1h", limit=144, return_df=
     }
 
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = g_client.get(url, params=params, timeout=10)
         resp.raise_for_status()
         data = resp.json()
     except Exception as e:
@@ -22,7 +22,16 @@ from chantheoryScan import ChanLunStrategy
 import asyncio
 from datetime import datetime
 from RobotNotifier import send_message_async
+from Common import InitLogging
+from Metrics import g_metrics, stage
+from Profiler import CycleProfiler, profile_target
 import traceback
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 阶段耗时汇总的输出间隔 (秒)
+SUMMARY_PERIOD = 300
 
 async def main():
     scanner = ChanLunStrategy()
@@ -32,7 +41,11 @@ async def main():
     main_lv = ['30m', '1h', '4h', '1d']
     sub_lv = ['5m', '15m', '30m', '4h']
 
-    print("启动缠论全买卖点扫描系统 (1/2/3 类买卖点)...")
+    logger.info("启动缠论全买卖点扫描系统 (1/2/3 类买卖点)...")
+    # 设置了 METRICS_PORT 时提供 Prometheus /metrics
+    g_metrics.start_http_server()
+    # kill -USR1 <pid> 或写 profiles/chantheorymain.ctl 开启剖析
+    profiler = CycleProfiler("chantheorymain").install()
     
     # for coin in coins:
     #     try:
@@ -59,29 +72,32 @@ async def main():
             
             #每一次检查时清空消息
             msgstr = ""
-            for coin in coins:
-                try:
-                    # 扫描前4个级别组合
-                    for i in range(len(main_lv)): 
-                        msgstr += scanner.detect_signals(coin, main_lv[i], sub_lv[i])
-                        await asyncio.sleep(0.5) 
-                        
-                except Exception as e:
-                    print(f"处理 {coin} 时出错: {e}")
-                    print(traceback.format_exc())  
+            with profiler.cycle():
+                for coin in coins:
+                    try:
+                        # 扫描前4个级别组合
+                        for i in range(len(main_lv)): 
+                            with profile_target(coin, main_lv[i]):
+                                msgstr += scanner.detect_signals(coin, main_lv[i], sub_lv[i])
+                            
+                    except Exception as e:
+                        logger.error("处理 %s 时出错: %s\n%s", coin, e, traceback.format_exc())
 
 
             if msgstr != "":
-                await send_message_async(msgstr)
+                with stage("notify", exchange="HYPERLIQUID"):
+                    await send_message_async(msgstr)
                 # print(msgstr)
 
             # 更新上一次执行记录            
             last_5m = minute
-            print("最后的5分钟",last_5m)
+            logger.debug("最后的5分钟 %s", last_5m)
+            g_metrics.maybe_log_summary(SUMMARY_PERIOD)
                     
 
         # 每秒检查一次，保证不会漏
         await asyncio.sleep(1)             
 
 if __name__ == "__main__":
+    InitLogging()
     asyncio.run(main())
\ No newline at end of file
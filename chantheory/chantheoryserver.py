@@ -2,18 +2,29 @@ import sys
 import os
 import pandas as pd
 import numpy as np
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template
 from flask_cors import CORS
 import time
+import argparse
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # --- [路径修正] 确保能引用到 core 目录 ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
 core_dir = os.path.join(current_dir, 'core') 
 if core_dir not in sys.path:
     sys.path.append(core_dir)
+# 上级目录 (Metrics 等公共模块)
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
 from chantheoryScan import ChanLunStrategy
 from hyperliquidDataMgr import MarketDataManager
+from backtestCache import BacktestResultCache
+from backtestWorker import BacktestJobManager
+from Metrics import g_metrics
+from backtestPayload import (SUPPORTED_FORMATS, build_json_payload,
+                             build_columnar_payload, build_msgpack_payload)
 
 app = Flask(__name__)
 CORS(app)
@@ -21,23 +32,61 @@ CORS(app)
 # 初始化
 db_path = 'hyperliquid_data.db'
 mgr = MarketDataManager(db_path=db_path)
-strategy = ChanLunStrategy(mgr)
+
+# 回测结果缓存 (同一 symbol/级别/数量 且没有新K线时直接复用)
+result_cache = BacktestResultCache(max_entries=64)
+# 同一 (symbol, 级别) 两次网络刷新之间的最小间隔 (秒)
+DATA_REFRESH_SECONDS = 30
+_last_refresh = {}
+
+# 回测结果中保留的列
+PLOT_COLUMNS = ['timestamp', 'open', 'close', 'low', 'high', 'volume', 'ma60', 'diff', 'dea', 'macd', 'rsi']
+
+# 回测线程池 / 后台预计算参数
+BACKTEST_WORKERS = int(os.environ.get('BACKTEST_WORKERS', 4))
+PRECOMPUTE_INTERVAL = int(os.environ.get('PRECOMPUTE_INTERVAL', 60))
+PRECOMPUTE_TOP_N = int(os.environ.get('PRECOMPUTE_TOP_N', 10))
+# 同步模式下请求线程最多等待的秒数，超时则返回 job_id 让前端轮询
+REQUEST_WAIT_SECONDS = 120
 
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/run_backtest')
-def run_backtest_endpoint():
-    symbol = request.args.get('symbol', 'BTC')
-    main_lvl = request.args.get('main_lvl', '1h')
-    sub_lvl = request.args.get('sub_lvl', '15m')
-    limit = int(request.args.get('limit', 1000))
 
+class BacktestError(Exception):
+    """回测无法完成 (数据不足等)，携带返回给前端的 HTTP 状态码"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def refresh_data(symbol, lvl):
+    """
+    同一 (symbol, 级别) 在 DATA_REFRESH_SECONDS 内只向交易所拉取一次，
+    重复打开页面时不再每次都走网络。
+    """
+    key = (symbol, lvl)
+    now = time.time()
+    if now - _last_refresh.get(key, 0) < DATA_REFRESH_SECONDS:
+        return
+    try:
+        mgr.update_data(symbol, lvl)
+        _last_refresh[key] = now
+    except Exception as e:
+        print(f"⚠️ 数据更新失败 (可能是网络问题)，尝试使用本地旧数据: {e}")
+
+
+def run_backtest(symbol, main_lvl, sub_lvl, limit):
+    """
+    加载数据、计算指标并逐根K线回测
+    返回 {'frame': 画图用的 DataFrame, 'buys': [...], 'sells': [...]}
+    """
+    # 每个任务独立的策略实例，线程池里并发回测时互不干扰
+    strategy = ChanLunStrategy(mgr)
 
-    print(f"🚀 接到回测请求: {symbol} {main_lvl}/{sub_lvl} (Limit: {limit})")
-    
     # 1. 准备数据
     if hasattr(strategy, 'get_time_ratio'):
         ratio = strategy.get_time_ratio(main_lvl, sub_lvl)
@@ -46,35 +95,23 @@ def run_backtest_endpoint():
 
     main_limit = limit
     sub_limit = int(limit * ratio) + 500
-    
-    # 确保数据最新 (实盘时开启，纯本地回测如果网络慢可注释掉)
-    try:
-        mgr.update_data(symbol, main_lvl)
-        mgr.update_data(symbol, sub_lvl)
-    except Exception as e:
-        print(f"⚠️ 数据更新失败 (可能是网络问题)，尝试使用本地旧数据: {e}")
-    
+
     # 加载数据
     df_main_full = mgr.load_data_for_analysis(symbol, main_lvl, limit=main_limit)
     df_sub_full = mgr.load_data_for_analysis(symbol, sub_lvl, limit=sub_limit)
     
     if df_main_full is None or df_sub_full is None:
-        return jsonify({"status": "error", "message": "数据不足，请检查数据库或网络"}), 404
+        raise BacktestError("数据不足，请检查数据库或网络", 404)
 
     # 2. 【核心】计算指标
     # 必须先计算，否则 df_plot 里没有 rsi/macd 列
     df_main_full = strategy.calculate_indicators(df_main_full)
     df_sub_full = strategy.calculate_indicators(df_sub_full)
 
-# 🚨【新增修复】再次检查指标计算后的结果
+    # 🚨【新增修复】再次检查指标计算后的结果
     # 如果数据少于 100 根，calculate_indicators 会返回 None，这里必须拦截
     if df_main_full is None or df_sub_full is None:
-        return jsonify({
-            "status": "error", 
-            "message": f"K线数量不足(少于100根)，无法计算指标。当前级别: {main_lvl}/{sub_lvl}"
-        }), 400    
-    
-    df_plot = df_main_full # 用于最后画图
+        raise BacktestError(f"K线数量不足(少于100根)，无法计算指标。当前级别: {main_lvl}/{sub_lvl}", 400)
 
     # 3. 开始回测循环
     buy_signals = []
@@ -88,28 +125,20 @@ def run_backtest_endpoint():
     if hasattr(strategy, 'reset_state'):
         strategy.reset_state()
 
-
-    # print("看一下df_main_full")
-    # print(df_main_full)
-
     # 模拟逐根K线扫描
     for i in range(start_idx, len(df_main_full)):
         curr_main_df = df_main_full.iloc[:i+1] 
         current_time = curr_main_df.iloc[-1]['timestamp']
 
-        # print("current_time",current_time)
-
-
-        
         # 对齐次级别时间
         curr_sub_df = df_sub_full[df_sub_full['timestamp'] <= current_time]
         
         # 调用策略
-        # print("传入",curr_main_df,curr_sub_df)
         signal = strategy.analyzeEMA_snapshot(symbol, main_lvl, curr_main_df, curr_sub_df)
         
         if signal:
             sig_data = {
+                'ts': current_time,
                 'time': current_time.strftime('%Y-%m-%d %H:%M'),
                 'price': signal['price'],
                 'type': signal['type'],  # 例如 "1B", "3B"
@@ -123,44 +152,202 @@ def run_backtest_endpoint():
 
     print(f"✅ 回测完成，耗时: {time.time()-t0:.2f}s | 信号数: {len(buy_signals)+len(sell_signals)}")
 
-    # 4. 组装前端数据
-    dates = df_main_full['timestamp'].dt.strftime('%Y-%m-%d %H:%M').tolist()
-    # ECharts K线数据顺序: [Open, Close, Low, High]
-    ohlc = df_main_full[['open', 'close', 'low', 'high']].values.tolist()
-    volumes = df_main_full['volume'].tolist()
-    
-    # 提取 MA60
-    ma60 = df_plot['ma60'].fillna(0).tolist() if 'ma60' in df_plot else []
-
-    # 提取 MACD 数据
-    macd_data = {
-        'diff': df_plot['diff'].fillna(0).tolist(),
-        'dea': df_plot['dea'].fillna(0).tolist(),
-        'bar': df_plot['macd'].fillna(0).tolist()
+    # 只保留前端需要的列，缓存占用更小
+    cols = [c for c in PLOT_COLUMNS if c in df_main_full.columns]
+    frame = df_main_full[cols].reset_index(drop=True)
+    return {"frame": frame, "buys": buy_signals, "sells": sell_signals}
+
+
+def get_backtest_result(symbol, main_lvl, sub_lvl, limit):
+    """带 LRU 缓存的回测：最后一根已收盘K线和正在形成的K线都不变时直接复用上次结果"""
+    refresh_data(symbol, main_lvl)
+    refresh_data(symbol, sub_lvl)
+
+    # 库里只有已收盘的K线，正在形成的那根在内存里，价格变了也要重算
+    key = result_cache.make_key(symbol, main_lvl, sub_lvl, limit,
+                                mgr.get_max_timestamp(symbol, main_lvl),
+                                mgr.get_max_timestamp(symbol, sub_lvl),
+                                mgr.get_live_bar(symbol, main_lvl),
+                                mgr.get_live_bar(symbol, sub_lvl))
+    result = result_cache.get(key)
+    if result is not None:
+        print(f"⚡ 命中回测缓存: {symbol} {main_lvl}/{sub_lvl} (Limit: {limit})")
+        return result
+
+    result = run_backtest(symbol, main_lvl, sub_lvl, limit)
+    result_cache.put(key, result)
+    return result
+
+
+jobs = BacktestJobManager(get_backtest_result, max_workers=BACKTEST_WORKERS)
+
+
+def ensure_background():
+    """第一次收到请求时再启动预计算线程 (避免 debug 重载进程重复启动)"""
+    if PRECOMPUTE_INTERVAL > 0:
+        jobs.start_precompute(interval=PRECOMPUTE_INTERVAL, top_n=PRECOMPUTE_TOP_N)
+
+
+def parse_since(value):
+    """since 支持毫秒/秒时间戳或 '%Y-%m-%d %H:%M' 格式的时间字符串"""
+    if value is None or value == '':
+        return None
+    if value.lstrip('-').isdigit():
+        ts = int(value)
+        # 小于 1e11 视为秒级时间戳
+        return pd.to_datetime(ts * 1000 if abs(ts) < 10**11 else ts, unit='ms')
+    return pd.Timestamp(value)
+
+
+def slice_result(result, since=None, offset=0):
+    """
+    按 since/offset 截取回测结果，前端只拉取最新的K线
+      since : 只返回时间戳严格大于 since 的K线和信号
+      offset: 在 since 过滤后的基础上跳过前 offset 根；负数表示只取最后 |offset| 根
+    返回 (frame, buys, sells, start)，start 为 frame 第一行在完整结果中的下标
+    """
+    frame = result['frame']
+    start = 0
+    if since is not None:
+        start = int(frame['timestamp'].searchsorted(since, side='right'))
+    if offset > 0:
+        start = min(start + offset, len(frame))
+    elif offset < 0:
+        start = max(start, len(frame) + offset)
+
+    frame = frame.iloc[start:]
+    if start == 0:
+        return frame, result['buys'], result['sells'], start
+
+    first_ts = frame['timestamp'].iloc[0] if len(frame) else None
+    def keep(sig):
+        return first_ts is not None and sig['ts'] >= first_ts
+    buys = [s for s in result['buys'] if keep(s)]
+    sells = [s for s in result['sells'] if keep(s)]
+    return frame, buys, sells, start
+
+
+def parse_response_args(args):
+    """解析输出相关参数，返回 (fmt, since, offset) 或 (None, 错误信息)"""
+    # 返回格式: json (默认) / columnar (列式 JSON + float32) / msgpack (二进制)
+    fmt = args.get('format', 'json')
+    if fmt not in SUPPORTED_FORMATS:
+        return None, f"不支持的格式: {fmt}"
+    try:
+        since = parse_since(args.get('since'))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        return None, "since/offset 参数格式错误"
+    return (fmt, since, offset), None
+
+
+def make_result_response(result, fmt, since, offset):
+    frame, buys, sells, start = slice_result(result, since, offset)
+    full = result['frame']
+    meta = {
+        "total": len(full),
+        "offset": start,
+        "last_ts": int(full['timestamp'].iloc[-1].value // 10**6) if len(full) else None
     }
-    
-    # 提取 RSI 数据
-    rsi_data = df_plot['rsi'].fillna(50).tolist()
-
-    # 组装买卖点数组
-    # 格式: [Time, Price, Type, Desc]
-    buys_fmt = [[s['time'], s['price'], s['type'], s['desc']] for s in buy_signals]
-    sells_fmt = [[s['time'], s['price'], s['type'], s['desc']] for s in sell_signals]
-
-    return jsonify({
-        "status": "success",
-        "data": {
-            "dates": dates,
-            "ohlc": ohlc,
-            "volume": volumes,
-            "ma60": ma60,
-            "macd": macd_data,
-            "rsi": rsi_data,
-            "buys": buys_fmt,
-            "sells": sells_fmt
-        }
-    })
+
+    if fmt == 'msgpack':
+        try:
+            body = build_msgpack_payload(frame, buys, sells, meta)
+        except RuntimeError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        return Response(body, mimetype='application/x-msgpack')
+
+    if fmt == 'columnar':
+        data = build_columnar_payload(frame, buys, sells)
+    else:
+        data = build_json_payload(frame, buys, sells)
+
+    return jsonify({"status": "success", **meta, "data": data})
+
+
+def make_future_response(job_id, future, response_args):
+    """已完成的任务返回结果，失败返回错误信息"""
+    try:
+        result = future.result(timeout=0)
+    except BacktestError as e:
+        return jsonify({"status": "error", "job_id": job_id, "message": e.message}), e.status
+    except Exception as e:
+        return jsonify({"status": "error", "job_id": job_id, "message": f"回测失败: {e}"}), 500
+    return make_result_response(result, *response_args)
+
+
+@app.route('/run_backtest')
+def run_backtest_endpoint():
+    ensure_background()
+    symbol = request.args.get('symbol', 'BTC')
+    main_lvl = request.args.get('main_lvl', '1h')
+    sub_lvl = request.args.get('sub_lvl', '15m')
+    limit = int(request.args.get('limit', 1000))
+    # mode=async 立即返回 job_id，之后通过 /job/<job_id> 获取结果
+    mode = request.args.get('mode', 'sync')
+
+    response_args, err = parse_response_args(request.args)
+    if err:
+        return jsonify({"status": "error", "message": err}), 400
+
+    print(f"🚀 接到回测请求: {symbol} {main_lvl}/{sub_lvl} (Limit: {limit})")
+
+    job_id, future = jobs.submit(symbol, main_lvl, sub_lvl, limit)
+    if mode != 'async':
+        try:
+            future.result(timeout=REQUEST_WAIT_SECONDS)
+        except FutureTimeoutError:
+            pass
+        except Exception:
+            # 错误信息由 make_future_response 统一返回
+            pass
+
+    if not future.done():
+        return jsonify({"status": "pending", "job_id": job_id}), 202
+    return make_future_response(job_id, future, response_args)
+
+
+@app.route('/job/<job_id>')
+def job_endpoint(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "任务不存在或已过期"}), 404
+
+    response_args, err = parse_response_args(request.args)
+    if err:
+        return jsonify({"status": "error", "message": err}), 400
+
+    if not job['future'].done():
+        return jsonify({"status": "pending", "job_id": job_id}), 202
+    return make_future_response(job_id, job['future'], response_args)
+
+
+@app.route('/cache_stats')
+def cache_stats_endpoint():
+    return jsonify(result_cache.stats())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """各阶段耗时 (Prometheus 文本格式)"""
+    return Response(g_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 
 if __name__ == '__main__':
-    print("🚀 缠论回测服务端 (Backtest Service) 启动在 5000 端口...")
-    app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prod', action='store_true', help='生产模式: 多线程 WSGI，无 debug 重载')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"🚀 缠论回测服务端 (Backtest Service) 启动在 {args.port} 端口...")
+    if not args.prod:
+        app.run(debug=True, port=args.port, host='0.0.0.0')
+    else:
+        ensure_background()
+        try:
+            from waitress import serve
+            serve(app, host='0.0.0.0', port=args.port, threads=args.threads)
+        except ImportError:
+            print("⚠️ 未安装 waitress，使用 Flask 多线程模式运行")
+            app.run(debug=False, threaded=True, port=args.port, host='0.0.0.0')
\ No newline at end of file
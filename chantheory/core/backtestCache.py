@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+
+class BacktestResultCache:
+    """
+    回测结果 LRU 缓存
+    key: (symbol, main_lvl, sub_lvl, limit, 主级别最后K线时间, 次级别最后K线时间, 主/次级别正在形成的K线)
+    新K线落库后最后时间戳变化、正在形成的K线 (只在内存里) 价格变化时，key 自然失效，旧结果随 LRU 淘汰。
+    同时按条目数和估算内存两种上限淘汰。
+    """
+
+    def __init__(self, max_entries=64, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(symbol, main_lvl, sub_lvl, limit, main_last_ts, sub_last_ts, main_live=None, sub_live=None):
+        """main_live / sub_live: 正在形成的K线 (timestamp, o, h, l, c, v)，没有时为 None"""
+        main_live = tuple(main_live[:5]) if main_live else None
+        sub_live = tuple(sub_live[:5]) if sub_live else None
+        return (symbol, main_lvl, sub_lvl, int(limit), main_last_ts, sub_last_ts, main_live, sub_live)
+
+    @staticmethod
+    def estimate_size(result):
+        """估算一个回测结果占用的内存 (主要是 DataFrame)"""
+        size = 0
+        frame = result.get('frame')
+        if frame is not None:
+            size += int(frame.memory_usage(index=True, deep=False).sum())
+        size += 200 * (len(result.get('buys', [])) + len(result.get('sells', [])))
+        return size
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        size = self.estimate_size(result)
+        with self._lock:
+            if key in self._data:
+                self._total_bytes -= self._sizes.pop(key)
+                del self._data[key]
+            self._data[key] = result
+            self._sizes[key] = size
+            self._total_bytes += size
+
+            # 先按条数，再按内存淘汰最久未使用的结果 (至少保留刚放入的这一条)
+            while len(self._data) > 1 and (len(self._data) > self.max_entries or self._total_bytes > self.max_bytes):
+                old_key, _ = self._data.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(old_key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
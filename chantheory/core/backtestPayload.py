@@ -0,0 +1,124 @@
+import base64
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# 列式格式中以 float32 传输的数值列 (前端名 -> DataFrame 列名)
+FLOAT_COLUMNS = [
+    ('open', 'open'),
+    ('close', 'close'),
+    ('low', 'low'),
+    ('high', 'high'),
+    ('volume', 'volume'),
+    ('ma60', 'ma60'),
+    ('diff', 'diff'),
+    ('dea', 'dea'),
+    ('macd', 'macd'),
+    ('rsi', 'rsi'),
+]
+
+# 与 JSON 格式保持一致的缺失值填充
+FILL_VALUES = {'rsi': 50.0}
+
+SUPPORTED_FORMATS = ('json', 'columnar', 'msgpack')
+
+
+def build_json_payload(frame, buy_signals, sell_signals):
+    """组装前端 (ECharts) 需要的数据"""
+    dates = frame['timestamp'].dt.strftime('%Y-%m-%d %H:%M').tolist()
+    # ECharts K线数据顺序: [Open, Close, Low, High]
+    ohlc = frame[['open', 'close', 'low', 'high']].values.tolist()
+    volumes = frame['volume'].tolist()
+
+    # 提取 MA60
+    ma60 = frame['ma60'].fillna(0).tolist() if 'ma60' in frame else []
+
+    # 提取 MACD 数据
+    macd_data = {
+        'diff': frame['diff'].fillna(0).tolist(),
+        'dea': frame['dea'].fillna(0).tolist(),
+        'bar': frame['macd'].fillna(0).tolist()
+    }
+
+    # 提取 RSI 数据
+    rsi_data = frame['rsi'].fillna(50).tolist()
+
+    # 组装买卖点数组
+    # 格式: [Time, Price, Type, Desc]
+    buys_fmt = [[s['time'], s['price'], s['type'], s['desc']] for s in buy_signals]
+    sells_fmt = [[s['time'], s['price'], s['type'], s['desc']] for s in sell_signals]
+
+    return {
+        "dates": dates,
+        "ohlc": ohlc,
+        "volume": volumes,
+        "ma60": ma60,
+        "macd": macd_data,
+        "rsi": rsi_data,
+        "buys": buys_fmt,
+        "sells": sells_fmt
+    }
+
+
+def epoch_ms(frame):
+    """timestamp 列 -> int64 毫秒时间戳 (不做逐行 strftime)"""
+    return frame['timestamp'].values.astype('datetime64[ms]').astype(np.int64)
+
+
+def float32_columns(frame):
+    """数值列 -> float32 连续数组，缺失列为空数组"""
+    cols = {}
+    for name, col in FLOAT_COLUMNS:
+        if col in frame:
+            values = frame[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            values = np.nan_to_num(values, nan=FILL_VALUES.get(name, 0.0))
+            cols[name] = np.ascontiguousarray(values, dtype='<f4')
+        else:
+            cols[name] = np.empty(0, dtype='<f4')
+    return cols
+
+
+def signals_columnar(signals):
+    # 格式: [毫秒时间戳, Price, Type, Desc]
+    return [[int(s['ts'].value // 10**6), float(s['price']), s['type'], s['desc']] for s in signals]
+
+
+def build_columnar_payload(frame, buy_signals, sell_signals):
+    """
+    列式 JSON：时间为毫秒整数数组，数值列为 base64 编码的小端 float32 数组。
+    前端用 new Float32Array(bytes.buffer) 直接还原，省掉逐个浮点数的文本格式化。
+    注意 float32 只有约 7 位有效数字，仅用于画图展示。
+    """
+    cols = float32_columns(frame)
+    return {
+        "format": "columnar",
+        "dtype": "float32",
+        "length": len(frame),
+        "ts": epoch_ms(frame).tolist(),
+        "columns": {name: base64.b64encode(arr.tobytes()).decode('ascii') for name, arr in cols.items()},
+        "buys": signals_columnar(buy_signals),
+        "sells": signals_columnar(sell_signals)
+    }
+
+
+def build_msgpack_payload(frame, buy_signals, sell_signals, meta=None):
+    """MessagePack 二进制：ts 为小端 int64 原始字节，数值列为小端 float32 原始字节"""
+    if msgpack is None:
+        raise RuntimeError("未安装 msgpack，无法使用 format=msgpack")
+    body = {
+        "status": "success",
+        "format": "msgpack",
+        "dtype": "float32",
+        "length": len(frame),
+        "ts": np.ascontiguousarray(epoch_ms(frame), dtype='<i8').tobytes(),
+        "columns": {name: arr.tobytes() for name, arr in float32_columns(frame).items()},
+        "buys": signals_columnar(buy_signals),
+        "sells": signals_columnar(sell_signals)
+    }
+    if meta:
+        body.update(meta)
+    return msgpack.packb(body, use_bin_type=True)
@@ -0,0 +1,101 @@
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BacktestJobManager:
+    """
+    回测任务池
+    1. 回测在线程池里执行，请求线程不再被慢速的 Hyperliquid 拉取阻塞
+    2. 相同 key 的并发请求合并为同一个 Future，只计算一次
+    3. 每个任务分配 job_id，前端可以异步轮询结果
+    4. 后台线程定期为热门 (symbol, 级别) 预计算，新K线一到就刷新缓存
+    """
+
+    def __init__(self, compute_fn, max_workers=4, max_jobs=1000, job_ttl=600):
+        # compute_fn(symbol, main_lvl, sub_lvl, limit) -> 回测结果
+        self.compute_fn = compute_fn
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backtest')
+        self.max_jobs = max_jobs
+        self.job_ttl = job_ttl
+
+        self._lock = threading.Lock()
+        self._inflight = {}         # key -> Future
+        self._jobs = OrderedDict()  # job_id -> {'key', 'future', 'created'}
+        self.popularity = Counter() # key -> 请求次数
+
+        self._precompute_thread = None
+        self._stop = threading.Event()
+
+    def submit(self, symbol, main_lvl, sub_lvl, limit):
+        """提交回测，返回 (job_id, future)；相同 key 正在计算时直接复用"""
+        key = (symbol, main_lvl, sub_lvl, int(limit))
+        with self._lock:
+            self.popularity[key] += 1
+            future = self._inflight.get(key)
+            if future is None:
+                future = self.executor.submit(self.compute_fn, *key)
+                self._inflight[key] = future
+                future.add_done_callback(lambda f, k=key: self._finish(k, f))
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {'key': key, 'future': future, 'created': time.time()}
+            self._prune_jobs()
+        return job_id, future
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _prune_jobs(self):
+        # 调用方已持有锁
+        now = time.time()
+        while self._jobs:
+            job_id, job = next(iter(self._jobs.items()))
+            expired = job['future'].done() and now - job['created'] > self.job_ttl
+            if len(self._jobs) > self.max_jobs or expired:
+                self._jobs.popitem(last=False)
+            else:
+                break
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def popular_keys(self, top_n=10):
+        with self._lock:
+            return [key for key, _ in self.popularity.most_common(top_n)]
+
+    # ---------------------------------------------------------
+    # 后台预计算
+    # ---------------------------------------------------------
+    def start_precompute(self, interval=60, top_n=10):
+        """
+        每 interval 秒把最热门的 top_n 个回测重新提交一次。
+        compute_fn 内部按最后一根K线时间做缓存，没有新K线时提交几乎没有开销。
+        """
+        with self._lock:
+            if self._precompute_thread is not None:
+                return
+            self._precompute_thread = threading.Thread(
+                target=self._precompute_loop, args=(interval, top_n),
+                name='backtest-precompute', daemon=True)
+        self._precompute_thread.start()
+
+    def _precompute_loop(self, interval, top_n):
+        while not self._stop.wait(interval):
+            for key in self.popular_keys(top_n):
+                try:
+                    self.submit(*key)[1].result()
+                except Exception as e:
+                    print(f"⚠️ 预计算失败 {key}: {e}")
+                with self._lock:
+                    # 后台提交不计入热度
+                    self.popularity[key] -= 1
+
+    def shutdown(self):
+        self._stop.set()
+        self.executor.shutdown(wait=False)
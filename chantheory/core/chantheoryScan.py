@@ -3,6 +3,11 @@ import numpy as np
 from hyperliquidDataMgr import MarketDataManager
 import pickle
 import time
+import logging
+from Metrics import stage
+from RollingWindow import rolling_mean_std
+
+logger = logging.getLogger(__name__)
 
 class ChanLunStrategy:
     def __init__(self, data_manager=None):
@@ -150,7 +155,8 @@ class ChanLunStrategy:
         df = df.copy()
         
         # 均线
-        df['ma20'] = df['close'].rolling(window=20).mean() 
+        close = df['close'].to_numpy(dtype=float)
+        df['ma20'] = rolling_mean_std(close, 20)[0]
         df['ma60'] = df['close'].rolling(window=60).mean() 
         
         # MACD
@@ -168,7 +174,7 @@ class ChanLunStrategy:
         df['rsi'] = 100 - (100 / (1 + rs))
         
         # 布林带 & 成交量 (为量化特种兵服务)
-        std = df['close'].rolling(window=self.BOLL_WINDOW).std()
+        std = rolling_mean_std(close, self.BOLL_WINDOW)[1]
         df['upper'] = df['ma20'] + (std * self.BOLL_STD)
         df['lower'] = df['ma20'] - (std * self.BOLL_STD)
         df['vol_ma'] = df['volume'].rolling(window=20).mean()
@@ -401,20 +407,22 @@ class ChanLunStrategy:
         try:
             self.data_manager.update_data(symbol, main_lvl)
             df_main = self.data_manager.load_data_for_analysis(symbol, main_lvl, limit=1000)
-            df_main = self.calculate_indicators(df_main)
-            # signal = self.analyze_snapshot(symbol, main_lvl, df_main, None)
-            signal = self.analyzeEMA_snapshot(symbol, main_lvl, df_main,None)
+            with stage("indicator", exchange="HYPERLIQUID", interval=main_lvl):
+                df_main = self.calculate_indicators(df_main)
+            with stage("signal", exchange="HYPERLIQUID", interval=main_lvl):
+                # signal = self.analyze_snapshot(symbol, main_lvl, df_main, None)
+                signal = self.analyzeEMA_snapshot(symbol, main_lvl, df_main,None)
             
             if signal:
                 return self.print_signal(symbol, signal['desc'], main_lvl, sub_lvl, 
                                        signal['price'], signal['stop_loss'], is_buy=(signal['action']=='buy'))
         except Exception as e:
-            pass
+            logger.debug("%s %s 检测失败: %s", symbol, main_lvl, e)
         return ""
 
     def print_signal(self, symbol, type_name, main, sub, price, stop_loss, is_buy=True):
         emoji = "🚀" if is_buy else "🌊" 
         action = "做多" if is_buy else "做空"
         mess = f"{emoji} [均线乖离-{action}] {symbol} ({main}) | {type_name}\n   现价: {price} | 止损: {stop_loss:.4f}\n"
-        print(mess)
+        logger.info(mess)
         return mess
\ No newline at end of file
@@ -1,15 +1,61 @@
+import os
 import sqlite3
-import requests
 import time
+import threading
+import numpy as np
 import pandas as pd
 import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from Metrics import stage, g_metrics
+from ExchangeClient import g_client
+
+# Hyperliquid candleSnapshot 单次请求最多返回的K线数
+MAX_CANDLES_PER_REQUEST = 5000
+# 历史回补时并发请求的线程数
+BACKFILL_WORKERS = 4
+# 分析用K线的进程内缓存上限 (MB)，按占用内存淘汰最久未用的
+FRAME_CACHE_MB = float(os.environ.get("FRAME_CACHE_MB", "64"))
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class _FrameEntry:
+    """
+    一个 (symbol, interval) 已收盘K线的列数据
+    ts: 毫秒开盘时间 int64；values: [n, 5] float64；cap: 最多保留多少根；
+    complete: 库里没有比 ts[0] 更早的K线 (请求更多根时不用重读)
+    """
+    __slots__ = ("ts", "values", "cap", "complete", "nbytes")
+
+    def __init__(self, ts, values, cap, complete):
+        self.ts = ts
+        self.values = values
+        self.cap = cap
+        self.complete = complete
+        self.nbytes = ts.nbytes + values.nbytes
+
 
 class MarketDataManager:
-    def __init__(self, db_path='hyperliquid_data.db'):
+    def __init__(self, db_path='hyperliquid_data.db', api_base=None):
         self.db_path = db_path
         self.init_db()
         # Hyperliquid API Endpoint
-        self.base_url = "https://api.hyperliquid.xyz/info"
+        # 与 ConstDef 一致，可用环境变量 HYPERLIQUID_API_BASE 指向本地假交易所
+        api_base = api_base or os.environ.get("HYPERLIQUID_API_BASE") or "https://api.hyperliquid.xyz"
+        self.base_url = api_base.rstrip("/") + "/info"
+        # 正在形成的K线只放内存 {(symbol, interval): (timestamp, o, h, l, c, v)}，读取时合并，
+        # 库里只存已收盘的K线，每次轮询不再写库
+        self._live = {}
+        self._live_lock = threading.Lock()
+        # 已收盘K线的 LRU 缓存 {(symbol, interval): _FrameEntry}，新K线按时间增量追加
+        self._frames = OrderedDict()
+        self._frames_bytes = 0
+        self._frames_lock = threading.Lock()
+        # 每个 key 的失效代数，invalidate_frame 时加一；读库期间代数变了的结果不放回缓存
+        self._frames_gen = {}
+        self.frame_cache_max_bytes = int(FRAME_CACHE_MB * 1024 * 1024)
+        self.cache_stats = {'hits': 0, 'misses': 0, 'appended': 0, 'evictions': 0}
 
     def init_db(self):
         """初始化数据库表结构"""
@@ -28,6 +74,26 @@ class MarketDataManager:
                 PRIMARY KEY (symbol, interval, timestamp)
             )
         ''')
+        # 已确认覆盖(已从交易所拉取过)的已收盘K线区间 [start_ts, end_ts]，按开盘时间
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kline_coverage (
+                symbol TEXT,
+                interval TEXT,
+                start_ts INTEGER,
+                end_ts INTEGER,
+                PRIMARY KEY (symbol, interval, start_ts)
+            )
+        ''')
+        # 每个 (symbol, interval) 的元数据：交易所最早可用K线时间、最后一次刷新时间
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kline_meta (
+                symbol TEXT,
+                interval TEXT,
+                earliest_ts INTEGER,
+                last_refresh INTEGER,
+                PRIMARY KEY (symbol, interval)
+            )
+        ''')
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS strategy_states (
                 key TEXT PRIMARY KEY,
@@ -84,8 +150,12 @@ class MarketDataManager:
         elif unit == 'M': return value * 30 * 24 * 60 * 60 * 1000
         else: return 60 * 1000
 
-    def fetch_from_api(self, symbol, interval, start_time, end_time=None):
-        """从 Hyperliquid 获取K线数据"""
+    def fetch_from_api(self, symbol, interval, start_time, end_time=None, raise_errors=False):
+        """
+        从 Hyperliquid 获取K线数据
+        raise_errors=False 时出错返回空列表；为 True 时抛出异常，
+        用于回补时区分"交易所没有数据"和"请求失败"
+        """
         headers = {'Content-Type': 'application/json'}
         start_time = int(start_time)
         
@@ -103,10 +173,13 @@ class MarketDataManager:
 
         try:
             # 增加超时时间到 15s
-            response = requests.post(self.base_url, json=payload, headers=headers, timeout=15)
+            with stage("fetch", exchange="HYPERLIQUID", interval=interval):
+                response = g_client.post(self.base_url, json=payload, headers=headers, timeout=15)
             
             if response.status_code != 200:
                 # print(f"🚨 API请求失败: {symbol} {interval} | 状态: {response.status_code}")
+                if raise_errors:
+                    raise RuntimeError(f"API请求失败: {symbol} {interval} | 状态: {response.status_code}")
                 return []
             
             data = response.json()
@@ -123,6 +196,8 @@ class MarketDataManager:
             return formatted_data
         except Exception as e:
             # print(f"Request Failed: {e}")
+            if raise_errors:
+                raise
             return []
 
     def save_data(self, symbol, interval, data_list):
@@ -131,15 +206,40 @@ class MarketDataManager:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         try:
-            cursor.executemany(f'''
-                INSERT OR REPLACE INTO klines (symbol, interval, timestamp, open, high, low, close, volume)
-                VALUES ('{symbol}', '{interval}', ?, ?, ?, ?, ?, ?)
-            ''', data_list)
-            conn.commit()
+            with stage("db_write", exchange="HYPERLIQUID", interval=interval):
+                cursor.executemany(f'''
+                    INSERT OR REPLACE INTO klines (symbol, interval, timestamp, open, high, low, close, volume)
+                    VALUES ('{symbol}', '{interval}', ?, ?, ?, ?, ?, ?)
+                ''', data_list)
+                conn.commit()
         except Exception as e:
             print(f"DB Error: {e}")
         finally:
             conn.close()
+            # 提交之后再作废: 写入早于缓存末尾的K线 (回补、修正) 时整条缓存丢掉，更新的K线下次读取时增量追加；
+            # 写入期间正在读库的 cached_bars 结果也不会放回缓存
+            self.invalidate_frame(symbol, interval, min(k[0] for k in data_list))
+
+    def get_last_bar(self, symbol, interval):
+        """库里最后一根K线 (timestamp, o, h, l, c, v)，没有时返回 None"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT timestamp, open, high, low, close, volume FROM klines '
+                       'WHERE symbol=? AND interval=? ORDER BY timestamp DESC LIMIT 1', (symbol, interval))
+        row = cursor.fetchone()
+        conn.close()
+        return tuple(row) if row else None
+
+    def get_live_bar(self, symbol, interval):
+        with self._live_lock:
+            return self._live.get((symbol, interval))
+
+    def set_live_bar(self, symbol, interval, bar):
+        with self._live_lock:
+            if bar is None:
+                self._live.pop((symbol, interval), None)
+            else:
+                self._live[(symbol, interval)] = bar
 
     def get_max_timestamp(self, symbol, interval):
         conn = sqlite3.connect(self.db_path)
@@ -150,89 +250,401 @@ class MarketDataManager:
         return row[0] if row and row[0] else None
 
     # =========================================================
-    # 🚀 V40.0 核心修复：实时刷新最后一根K线 (Live Candle Refresh)
+    # 📚 覆盖区间记录 & 分页回补
+    # =========================================================
+
+    def last_closed_open_ts(self, interval, now_ms=None):
+        """最后一根已收盘K线的开盘时间"""
+        interval_ms = self.get_interval_ms(interval)
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        return (now_ms // interval_ms) * interval_ms - interval_ms
+
+    @staticmethod
+    def merge_ranges(ranges, interval_ms):
+        """合并重叠或首尾相接 (相差一个周期) 的区间"""
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + interval_ms:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [(s, e) for s, e in merged]
+
+    def detect_runs(self, timestamps, interval_ms):
+        """按时间步长把已有K线切成连续区间，步长大于一个周期处即为缺口"""
+        runs = []
+        if not timestamps:
+            return runs
+        run_start = prev = timestamps[0]
+        for ts in timestamps[1:]:
+            if ts - prev > interval_ms:
+                runs.append((run_start, prev))
+                run_start = ts
+            prev = ts
+        runs.append((run_start, prev))
+        return runs
+
+    def get_covered_ranges(self, symbol, interval):
+        """
+        读取已覆盖区间。第一次使用时 (旧库没有覆盖记录) 根据已有K线的
+        时间步长推断连续区间写入覆盖表，内部缺口会被当作未覆盖
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT start_ts, end_ts FROM kline_coverage WHERE symbol=? AND interval=? ORDER BY start_ts',
+                       (symbol, interval))
+        ranges = cursor.fetchall()
+        if not ranges:
+            cursor.execute('SELECT timestamp FROM klines WHERE symbol=? AND interval=? ORDER BY timestamp',
+                           (symbol, interval))
+            timestamps = [row[0] for row in cursor.fetchall()]
+            last_closed = self.last_closed_open_ts(interval)
+            timestamps = [ts for ts in timestamps if ts <= last_closed]
+            ranges = self.detect_runs(timestamps, self.get_interval_ms(interval))
+            if ranges:
+                cursor.executemany('INSERT OR REPLACE INTO kline_coverage (symbol, interval, start_ts, end_ts) VALUES (?, ?, ?, ?)',
+                                   [(symbol, interval, s, e) for s, e in ranges])
+                conn.commit()
+        conn.close()
+        return [tuple(r) for r in ranges]
+
+    def mark_covered(self, symbol, interval, start_ts, end_ts):
+        """记录 [start_ts, end_ts] 已从交易所拉取过，并与已有区间合并"""
+        if end_ts < start_ts:
+            return
+        interval_ms = self.get_interval_ms(interval)
+        ranges = self.merge_ranges(self.get_covered_ranges(symbol, interval) + [(start_ts, end_ts)], interval_ms)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('DELETE FROM kline_coverage WHERE symbol=? AND interval=?', (symbol, interval))
+            cursor.executemany('INSERT INTO kline_coverage (symbol, interval, start_ts, end_ts) VALUES (?, ?, ?, ?)',
+                               [(symbol, interval, s, e) for s, e in ranges])
+            conn.commit()
+        except Exception as e:
+            print(f"DB Error: {e}")
+        finally:
+            conn.close()
+
+    def get_meta(self, symbol, interval):
+        """读取 (symbol, interval) 元数据，没有记录时返回 None"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT earliest_ts, last_refresh FROM kline_meta WHERE symbol=? AND interval=?',
+                       (symbol, interval))
+        row = cursor.fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return {'earliest_ts': row[0], 'last_refresh': row[1]}
+
+    def update_meta(self, symbol, interval, earliest_ts=None, last_refresh=None):
+        """
+        更新元数据。earliest_ts 是"在此之前交易所没有数据"的下界，只会往后推
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('INSERT OR IGNORE INTO kline_meta (symbol, interval) VALUES (?, ?)', (symbol, interval))
+            if earliest_ts is not None:
+                cursor.execute('''
+                    UPDATE kline_meta SET earliest_ts = MAX(COALESCE(earliest_ts, 0), ?)
+                    WHERE symbol=? AND interval=?
+                ''', (int(earliest_ts), symbol, interval))
+            if last_refresh is not None:
+                cursor.execute('UPDATE kline_meta SET last_refresh=? WHERE symbol=? AND interval=?',
+                               (int(last_refresh), symbol, interval))
+            conn.commit()
+        except Exception as e:
+            print(f"DB Error: {e}")
+        finally:
+            conn.close()
+
+    def history_exhausted(self, symbol, interval, oldest_ts):
+        """本地最早一根K线已经是交易所能提供的最早K线 (新上线币种历史不足 limit 根)"""
+        meta = self.get_meta(symbol, interval)
+        return bool(meta and meta['earliest_ts'] is not None and oldest_ts <= meta['earliest_ts'])
+
+    def plan_backfill(self, symbol, interval, start_ts, end_ts):
+        """
+        计算 [start_ts, end_ts] 中尚未覆盖的部分，并按单次请求上限切块
+        返回 [(chunk_start, chunk_end), ...]，按时间从新到旧排列
+        """
+        interval_ms = self.get_interval_ms(interval)
+        missing = []
+        cursor_ts = start_ts
+        for cov_start, cov_end in self.get_covered_ranges(symbol, interval):
+            if cov_end < cursor_ts:
+                continue
+            if cov_start > end_ts:
+                break
+            if cov_start > cursor_ts:
+                missing.append((cursor_ts, cov_start - interval_ms))
+            cursor_ts = max(cursor_ts, cov_end + interval_ms)
+        if cursor_ts <= end_ts:
+            missing.append((cursor_ts, end_ts))
+
+        # 从新往旧分页，与 hyperliquid_get.get_last_n_minutes_candles 一致
+        chunk_span = MAX_CANDLES_PER_REQUEST * interval_ms
+        chunks = []
+        for gap_start, gap_end in reversed(missing):
+            chunk_end = gap_end
+            while chunk_end >= gap_start:
+                chunk_start = max(gap_start, chunk_end - chunk_span + interval_ms)
+                chunks.append((chunk_start, chunk_end))
+                chunk_end = chunk_start - interval_ms
+        return chunks
+
+    def backfill(self, symbol, interval, bars):
+        """
+        确保最近 bars 根已收盘K线都已拉取过：只请求未覆盖的区间，多个分页并发拉取，
+        已覆盖的区间永远不会重复下载
+        """
+        interval_ms = self.get_interval_ms(interval)
+        end_ts = self.last_closed_open_ts(interval)
+        start_ts = end_ts - (bars - 1) * interval_ms
+
+        # 交易所最早可用时间之前的区间不用再请求
+        meta = self.get_meta(symbol, interval)
+        if meta and meta['earliest_ts'] is not None:
+            start_ts = max(start_ts, meta['earliest_ts'])
+
+        chunks = self.plan_backfill(symbol, interval, start_ts, end_ts)
+        if not chunks:
+            return 0
+
+        saved = 0
+        pages = {}  # {c_start: 该页的K线}，请求失败的页不记录
+        with ThreadPoolExecutor(max_workers=min(BACKFILL_WORKERS, len(chunks))) as pool:
+            futures = {
+                pool.submit(self.fetch_from_api, symbol, interval, c_start, c_end, True): (c_start, c_end)
+                for c_start, c_end in chunks
+            }
+            for future in as_completed(futures):
+                c_start, c_end = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    # 请求失败的分页不记入覆盖，下次再补
+                    print(f"⚠️ 回补失败 {symbol} {interval} [{c_start}, {c_end}]: {e}")
+                    continue
+                data = [k for k in data if c_start <= k[0] <= c_end]
+                self.save_data(symbol, interval, data)
+                self.mark_covered(symbol, interval, c_start, c_end)
+                saved += len(data)
+                pages[c_start] = data
+
+        earliest = self.infer_earliest(chunks, pages, start_ts, interval_ms)
+        if earliest is not None and self.nothing_before(symbol, interval, start_ts, interval_ms):
+            self.update_meta(symbol, interval, earliest_ts=earliest)
+        return saved
+
+    def nothing_before(self, symbol, interval, ts, interval_ms):
+        """
+        再往前请求一页确认 ts 之前交易所确实没有K线
+        (开头缺的几根也可能只是没有成交，earliest_ts 只会往后推，推错了就再也不会回补)
+        """
+        try:
+            older = self.fetch_from_api(symbol, interval, ts - MAX_CANDLES_PER_REQUEST * interval_ms,
+                                        ts - interval_ms, True)
+        except Exception:
+            return False
+        return not any(k[0] < ts for k in older)
+
+    @staticmethod
+    def infer_earliest(chunks, pages, start_ts, interval_ms):
+        """
+        根据回补结果推断交易所最早可用的K线时间 (候选值，由 nothing_before 确认)，推断不出时返回 None
+        只看请求范围最早的那一页 (c_start == start_ts)：中间某页开头缺K线可能只是那几分钟没有成交，
+        不能说明更早没有历史。最早的几页整页为空时，接着看更新的一页，直到遇到有数据的页；
+        途中有请求失败的页就不推断
+        """
+        earliest = None
+        expect = start_ts
+        for c_start, c_end in sorted(chunks):
+            # 只沿着从 start_ts 开始连续请求的页往后看
+            if c_start != expect:
+                return earliest
+            if c_start not in pages:
+                return None
+            expect = c_end + interval_ms
+            data = pages[c_start]
+            if data:
+                if data[0][0] > c_start:
+                    earliest = data[0][0]
+                return earliest
+            # 整页没有数据，交易所在这页之前都没有历史
+            earliest = c_end + interval_ms
+        return earliest
+
+    # =========================================================
+    # 🚀 实时刷新最后一根K线 (Live Candle Refresh)
     # =========================================================
-    def update_data(self, symbol, interval, force_backfill=False):
+    def update_data(self, symbol, interval, force_backfill=False, bars=None):
         """
-        更新数据逻辑升级：
-        1. 历史回溯：如果数据不足，抓取历史。
-        2. 实时刷新：总是从数据库中【最后一条记录的时间】开始抓取，
-           确保正在进行中的K线（未走完的）能实时更新其 Close/High/Low 价格。
+        更新数据逻辑：
+        1. 历史回溯：如果数据不足，按覆盖区间分页抓取缺失的历史 (最少 bars 根)。
+        2. 实时刷新：从库里最后一根K线开始抓取；已收盘的新K线写库，
+           正在形成的K线只更新内存 (_live)，load_data_for_analysis 读取时合并。
+           没有新收盘的K线时本次调用不写库。
         """
         max_ts = self.get_max_timestamp(symbol, interval)
-        current_ts = int(time.time() * 1000)
         
         TARGET_BAR_COUNT = 1500 
-        interval_ms = self.get_interval_ms(interval)
         
         is_initial_run = (max_ts is None)
         
-        # 1. 历史补齐 (保持不变)
+        # 1. 历史补齐：只拉取覆盖区间之外的部分 (回补只拉已收盘的K线)
         if is_initial_run or force_backfill:
             # print(f"✨ 触发历史补齐 {symbol} {interval}...")
-            start_time = current_ts - (TARGET_BAR_COUNT * interval_ms)
-            new_data = self.fetch_from_api(symbol, interval, start_time)
-            if new_data:
-                self.save_data(symbol, interval, new_data)
-            return # 补齐后直接结束，因为补齐的数据肯定包含了最新的
-
-        # 2. 增量更新 + 实时刷新 (核心修改)
-        # 重新获取最大时间戳
-        max_ts_after_backfill = self.get_max_timestamp(symbol, interval)
-        
-        if max_ts_after_backfill is not None:
-            # 🚨 关键修改点 🚨
-            # 旧逻辑: start_time = max_ts + 1 (导致跳过已存在的最后一根)
-            # 新逻辑: start_time = max_ts (重抓最后一根，覆盖更新它)
-            
-            start_time = max_ts_after_backfill
-            
-            # 移除所有时间间隔判断 (if current - max > interval)，
-            # 只要被调用，就无条件去确认一下最新K线的状态。
-            
-            new_data = self.fetch_from_api(symbol, interval, start_time)
-            
-            if new_data:
-                # save_data 使用的是 INSERT OR REPLACE
-                # 所以数据库中旧的、未走完的 max_ts 记录会被新的数据覆盖
-                self.save_data(symbol, interval, new_data)
-                # print(f"✅ 刷新成功: {symbol} {interval} (Covering {pd.to_datetime(start_time, unit='ms')})")
+            self.backfill(symbol, interval, max(TARGET_BAR_COUNT, bars or 0))
 
-    def load_data_for_analysis(self, symbol, interval, limit=1000):
-        """读取数据，并在数据不足时自动触发历史补齐"""
+        # 2. 增量更新 + 实时刷新
+        last_bar = self.get_last_bar(symbol, interval)
+        if last_bar is None:
+            return
+
+        # 重抓库里最后一根: 旧版本会把未走完的K线写进库，这里顺带修正
+        start_time = last_bar[0]
+        new_data = self.fetch_from_api(symbol, interval, start_time)
+        if not new_data:
+            return
+
+        last_closed = self.last_closed_open_ts(interval)
+        closed = [k for k in new_data if k[0] <= last_closed]
+        live = [k for k in new_data if k[0] > last_closed]
+        self.set_live_bar(symbol, interval, live[-1] if live else None)
+
+        # 与库里一致的K线不再写 (通常就是重抓的最后一根)
+        if closed and closed[0][0] == last_bar[0] and tuple(closed[0]) == last_bar:
+            closed = closed[1:]
+        if closed:
+            self.save_data(symbol, interval, closed)
+            self.update_meta(symbol, interval, last_refresh=int(time.time() * 1000))
+            # 已收盘的部分记入覆盖区间 (返回数据从 start_time 开始才算连续)
+            if new_data[0][0] <= start_time:
+                self.mark_covered(symbol, interval, start_time, closed[-1][0])
+            # print(f"✅ 刷新成功: {symbol} {interval} (Covering {pd.to_datetime(start_time, unit='ms')})")
+
+    # =========================================================
+    # 🗃️ 分析用K线缓存
+    # =========================================================
+    def read_bars(self, symbol, interval, limit=None, after=None):
+        """从库里读已收盘K线 (升序)：最近 limit 根，或 after 之后的全部"""
         conn = sqlite3.connect(self.db_path)
-        
-        query = f"""
-            SELECT * FROM (
-                SELECT timestamp, open, high, low, close, volume 
-                FROM klines 
-                WHERE symbol = '{symbol}' AND interval = '{interval}'
-                ORDER BY timestamp DESC
-                LIMIT {limit}
-            ) ORDER BY timestamp ASC
-        """
         try:
-            df = pd.read_sql_query(query, conn)
+            if after is not None:
+                rows = conn.execute('SELECT timestamp, open, high, low, close, volume FROM klines '
+                                    'WHERE symbol=? AND interval=? AND timestamp>? ORDER BY timestamp',
+                                    (symbol, interval, int(after))).fetchall()
+            else:
+                rows = conn.execute('SELECT timestamp, open, high, low, close, volume FROM klines '
+                                    'WHERE symbol=? AND interval=? ORDER BY timestamp DESC LIMIT ?',
+                                    (symbol, interval, int(limit))).fetchall()
+                rows.reverse()
+        finally:
             conn.close()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(BAR_COLUMNS)))
+        ts = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        values = np.array([r[1:] for r in rows], dtype=np.float64)
+        return ts, values
+
+    def cached_bars(self, symbol, interval, limit):
+        """最近 limit 根已收盘K线 (ts, values)；命中缓存时只查询缓存末尾之后的新K线"""
+        key = (symbol, interval)
+        with self._frames_lock:
+            entry = self._frames.get(key)
+            gen = self._frames_gen.get(key, 0)
+            miss = entry is None or (len(entry.ts) < limit and not entry.complete)
+            self.cache_stats['misses' if miss else 'hits'] += 1
+
+        if miss:
+            g_metrics.inc("frame_cache_miss", exchange="HYPERLIQUID", interval=interval)
+            cap = max(limit, entry.cap if entry else 0)
+            ts, values = self.read_bars(symbol, interval, limit=cap)
+            entry = _FrameEntry(ts, values, cap, len(ts) < cap)
+        else:
+            g_metrics.inc("frame_cache_hit", exchange="HYPERLIQUID", interval=interval)
+            new_ts, new_values = self.read_bars(symbol, interval, after=entry.ts[-1] if len(entry.ts) else -1)
+            cap = max(entry.cap, limit)
+            if len(new_ts):
+                with self._frames_lock:
+                    self.cache_stats['appended'] += len(new_ts)
+                ts = np.concatenate([entry.ts, new_ts])
+                values = np.concatenate([entry.values, new_values])
+                complete = entry.complete and len(ts) <= cap
+                entry = _FrameEntry(ts[-cap:], values[-cap:], cap, complete)
+            elif cap != entry.cap:
+                entry = _FrameEntry(entry.ts, entry.values, cap, entry.complete)
+
+        self._store_frame(key, entry, gen)
+        return entry.ts[-limit:], entry.values[-limit:]
+
+    def _store_frame(self, key, entry, gen):
+        """放回缓存；读库期间被 invalidate_frame 过 (代数不等于 gen) 时丢弃，结果可能已过期"""
+        with self._frames_lock:
+            if self._frames_gen.get(key, 0) != gen:
+                return
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self._frames_bytes -= old.nbytes
+            self._frames[key] = entry
+            self._frames_bytes += entry.nbytes
+            # 超出上限时淘汰最久未用的，至少保留刚放进去的这一条
+            while self._frames_bytes > self.frame_cache_max_bytes and len(self._frames) > 1:
+                _, evicted = self._frames.popitem(last=False)
+                self._frames_bytes -= evicted.nbytes
+                self.cache_stats['evictions'] += 1
+
+    def invalidate_frame(self, symbol, interval, from_ts=None):
+        """from_ts 不晚于缓存里最后一根K线时丢掉这条缓存 (不传则直接丢掉)"""
+        key = (symbol, interval)
+        with self._frames_lock:
+            # 正在读库的 cached_bars 可能读到了写入前的数据，不论是否丢掉缓存都让它的结果作废
+            self._frames_gen[key] = self._frames_gen.get(key, 0) + 1
+            entry = self._frames.get(key)
+            if entry is None:
+                return
+            if from_ts is None or not len(entry.ts) or from_ts <= entry.ts[-1]:
+                del self._frames[key]
+                self._frames_bytes -= entry.nbytes
+
+    def merge_live_bar(self, ts, values, symbol, interval, limit):
+        """把内存里正在形成的K线接到末尾 (同一时间的以内存为准)，保持最多 limit 根"""
+        live = self.get_live_bar(symbol, interval)
+        if live is None or (len(ts) and live[0] < ts[-1]):
+            return ts, values
+        if len(ts) and live[0] == ts[-1]:
+            ts, values = ts[:-1], values[:-1]
+        ts = np.append(ts, np.int64(live[0]))
+        values = np.vstack([values, np.asarray(live[1:], dtype=np.float64)])
+        return ts[-limit:], values[-limit:]
+
+    def load_data_for_analysis(self, symbol, interval, limit=1000):
+        """读取数据 (已收盘的走缓存，再合并正在形成的K线)，并在数据不足时自动触发历史补齐"""
+        try:
+            with stage("db_read", exchange="HYPERLIQUID", interval=interval):
+                ts, values = self.cached_bars(symbol, interval, limit)
             
-            # 检查数据量
-            if len(df) < limit and len(df) > 0 and limit > 100:
+            # 检查数据量：只分页补齐未覆盖的区间，已拉取过的区间不会重复请求
+            # 交易所本身历史不足 (新币) 时直接返回现有数据，不再反复回补
+            if len(ts) < limit and len(ts) > 0 and limit > 100 \
+                    and not self.history_exhausted(symbol, interval, int(ts[0])):
                 # print(f"⚠️ 数据量不足，触发补齐...")
-                self.update_data(symbol, interval, force_backfill=True)
+                self.backfill(symbol, interval, limit)
                 
-                # 重试一次
-                conn = sqlite3.connect(self.db_path)
-                df = pd.read_sql_query(query, conn)
-                conn.close()
+                # 重试一次 (回补写入的K线已让缓存作废)
+                ts, values = self.cached_bars(symbol, interval, limit)
                 
-                if len(df) < 100: return None
+                if len(ts) < 100: return None
             
-            if not df.empty:
-                df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-                cols = ['open', 'high', 'low', 'close', 'volume']
-                df[cols] = df[cols].apply(pd.to_numeric)
+            ts, values = self.merge_live_bar(ts, values, symbol, interval, limit)
+            if len(ts):
+                # 每次返回新的 DataFrame，调用方可以随意加列
+                df = pd.DataFrame(values, columns=BAR_COLUMNS)
+                df.insert(0, 'timestamp', ts.astype('datetime64[ms]').astype('datetime64[ns]'))
                 return df
             return None
         except Exception as e:
-            conn.close()
-            return None
\ No newline at end of file
+            return None
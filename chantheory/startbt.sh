@@ -12,6 +12,9 @@ APP_NAME="chantheoryserver"
 # 🚨 关键修改点1: 切换到单进程模式，消除 SQLite 写入死锁问题。
 WORKERS=1 
 
+# 单进程内使用多线程 (gthread)，回测在服务端线程池里执行，慢请求不再阻塞其他用户
+THREADS=8
+
 # 🚨 关键修改点2: 大幅增加超时时间，避免 worker 被 Gunicorn 杀死。
 TIMEOUT=300 
 # --- 配置区结束 ---
@@ -42,6 +45,7 @@ fi
 gunicorn \
   --chdir "$APP_DIR" \
   -w $WORKERS \
+  --threads $THREADS \
   -b 0.0.0.0:5000 \
   -D \
   --timeout $TIMEOUT \
@@ -53,7 +57,7 @@ gunicorn \
 sleep 1
 
 PID=$(cat "$LOG_DIR/$APP_NAME.pid")
-echo "✅ Gunicorn 服务已启动 (Timeout: ${TIMEOUT}s, Workers: ${WORKERS})。"
+echo "✅ Gunicorn 服务已启动 (Timeout: ${TIMEOUT}s, Workers: ${WORKERS}, Threads: ${THREADS})。"
 echo "进程 ID: $PID"
 
 deactivate
\ No newline at end of file
@@ -15,6 +15,10 @@ print("看一下core_dir",core_dir)
 # 将 core 目录加入到 Python 的搜索路径中
 if core_dir not in sys.path:
     sys.path.append(core_dir)
+# 仓库根目录 (Metrics 等公共模块)
+root_dir = os.path.dirname(os.path.dirname(current_dir))
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
 # ------------------
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -13,6 +13,10 @@ if not os.path.exists(core_dir):
     core_dir = os.path.join(current_dir, 'core')
 if core_dir not in sys.path:
     sys.path.append(core_dir)
+# 仓库根目录 (Metrics 等公共模块)
+root_dir = os.path.dirname(os.path.dirname(current_dir))
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
 
 try:
     from chantheoryScan import ChanLunStrategy
@@ -1,15 +1,19 @@
-import requests
 import pandas as pd
 import pandas_ta as ta
 
-import requests
 import pandas as pd
 import pandas_ta as ta
 
 
-import requests
 import pandas as pd
 import pandas_ta as ta
+from ConstDef import api_url
+from ExchangeClient import g_client
+from Metrics import stage, g_metrics
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 
 def fetch_signals(symbol="ethusdt", period="30min", size=144, return_df=False):
@@ -17,14 +21,15 @@ def fetch_signals(symbol="ethusdt", period="30min", size=144, return_df=False):
     拉取 HTX K线数据并计算 MACD、RSI、KDJ、BOLL、TD Sequential 指标
     """
     # === 1. 获取 HTX K线数据 ===
-    url = "https://api.huobi.pro/market/history/kline"
+    url = api_url("HTX", "/market/history/kline")
     params = {
         "symbol": symbol,
         "period": period,
         "size": size
     }
-    resp = requests.get(url, params=params, timeout=10)
-    data = resp.json()
+    with stage("fetch", exchange="HTX", interval=period):
+        resp = g_client.get(url, params=params, timeout=10)
+        data = resp.json()
     
     if data.get("status") != "ok":
         raise ValueError(f"API返回错误: {data}")
@@ -34,9 +39,10 @@ def fetch_signals(symbol="ethusdt", period="30min", size=144, return_df=False):
     df["time"] = pd.to_datetime(df["id"], unit="s") + pd.Timedelta(hours=8)  # 转 UTC+8
     df = df.sort_values("time").reset_index(drop=True)
 
-    print(df)
+    logger.debug("%s %s\n%s", symbol, period, df)
 
     # === 3. 计算指标 ===
+    t_indicator = time.perf_counter()
     # MACD
     # print("df",df)
     macd = ta.macd(df["close"], fast=12, slow=26, signal=9)  
@@ -71,11 +77,13 @@ def fetch_signals(symbol="ethusdt", period="30min", size=144, return_df=False):
         else:
             td_count[i] = 0
     df["td_count"] = td_count
+    g_metrics.observe("indicator", time.perf_counter() - t_indicator, "HTX", period)
 
     if return_df:
         return df
 
     # === 4. 检查信号 ===
+    t_signal = time.perf_counter()
     signals_list = []
     BOLL_TREND_CONFIRM = 2  # 连续多少根K线才算趋势确认
 
@@ -133,10 +141,12 @@ def fetch_signals(symbol="ethusdt", period="30min", size=144, return_df=False):
                 "signals": signals
             })
 
+    g_metrics.observe("signal", time.perf_counter() - t_signal, "HTX", period)
+
     # === 5. 打印最新收盘数据 ===
     latest = df.iloc[-1]
-    print(f"\n最新数据: {latest['time']} 收盘价={latest['close']:.2f}, RSI={latest['rsi']:.2f}, "
-          f"KDJ_J={latest['kdj_j']:.2f}, TD_Count={latest['td_count']}")
+    logger.info("最新数据: %s 收盘价=%.2f, RSI=%.2f, KDJ_J=%.2f, TD_Count=%s",
+                latest['time'], latest['close'], latest['rsi'], latest['kdj_j'], latest['td_count'])
 
     return signals_list
 
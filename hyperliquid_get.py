@@ -1,6 +1,7 @@
-import requests
 import time
 import json
+from ConstDef import api_url
+from ExchangeClient import g_client
 
 def fetch_candles(coin: str, interval: str, limit: int, end_time_ms: int = None):
     """
@@ -26,7 +27,7 @@ def fetch_candles(coin: str, interval: str, limit: int, end_time_ms: int = None)
     span_ms = minute_map[interval] * limit * 60 * 1000
     start_time_ms = end_time_ms - span_ms
 
-    url = "https://api.hyperliquid.xyz/info"
+    url = api_url("HYPERLIQUID", "/info")
     headers = {
         "Content-Type": "application/json"
     }
@@ -40,7 +41,7 @@ def fetch_candles(coin: str, interval: str, limit: int, end_time_ms: int = None)
         }
     }
 
-    res = requests.post(url, headers=headers, json=payload)
+    res = g_client.post(url, headers=headers, json=payload)
     if res.status_code != 200:
         raise Exception(f"接口返回状态码 {res.status_code}, 内容: {res.text}")
 
@@ -69,7 +70,6 @@ def get_last_n_minutes_candles(coin: str, interval: str, n: int):
         # 更新 end_time 为最旧 candle 的时间戳 - 1 毫秒，防止重复
         oldest = candles[0]
         end_time = oldest["t"] - 1
-        time.sleep(0.2)  # 避免请求过快
         
     return all_candles[-n:]
 
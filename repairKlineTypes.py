@@ -0,0 +1,117 @@
+"""
+把K线表里以 TEXT 存放的数值列原地转成 REAL / INTEGER
+
+以前币安K线直接 to_sql 写入字符串，库里有两种坏表:
+  1. 表由 to_sql 建立，列声明为 TEXT、没有主键 —— 按 DatabaseUpdate.init_table 的结构重建，
+     数值 CAST 后拷回 (重复的时间戳只保留一条)
+  2. 表结构正确，但个别值仍是文本 —— 原地 UPDATE ... CAST
+
+用法:
+    python repairKlineTypes.py [BINANCE|HTX] [--dry-run]
+"""
+import sys
+import logging
+import sqlite3
+
+from ConstDef import g_ACD
+from Common import InitLogging
+from DatabaseUpdate import init_table
+from KlineParser import BINANCE_COLUMNS, BINANCE_INT_COLUMNS, HTX_COLUMNS, HTX_INT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+def numeric_columns():
+    if g_ACD.getExchange() == "HTX":
+        return HTX_COLUMNS, HTX_INT_COLUMNS
+    return BINANCE_COLUMNS, BINANCE_INT_COLUMNS
+
+
+def affinity(decl):
+    """SQLite 列声明类型 -> 亲和性"""
+    decl = (decl or "").upper()
+    if "INT" in decl:
+        return "INTEGER"
+    if any(k in decl for k in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if decl == "" or "BLOB" in decl:
+        return "BLOB"
+    if any(k in decl for k in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+
+def kline_tables(conn):
+    periods = g_ACD.getInterval()
+    names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    return [n for n in names if n.rpartition("_")[2] in periods and n.rpartition("_")[0]]
+
+
+def inspect_table(conn, table):
+    """返回 (需要重建, {列名: 文本值个数})"""
+    columns, _ = numeric_columns()
+    indexname = g_ACD.getIndexName()
+    info = {r[1]: (r[2], r[5]) for r in conn.execute(f'PRAGMA table_info("{table}")')}
+    present = [c for c in columns if c in info]
+
+    rebuild = info.get(indexname, (None, 0))[1] == 0  # 索引列不是主键
+    rebuild |= any(affinity(info[c][0]) in ("TEXT", "BLOB") for c in present)
+
+    sums = ", ".join(f"SUM(typeof(\"{c}\") = 'text')" for c in present)
+    counts = dict(zip(present, conn.execute(f'SELECT {sums} FROM "{table}"').fetchone()))
+    return rebuild, {c: int(n or 0) for c, n in counts.items() if n}
+
+
+def repair_table(conn, table, dry_run=False):
+    columns, int_columns = numeric_columns()
+    rebuild, text_counts = inspect_table(conn, table)
+    if not rebuild and not text_counts:
+        return False
+
+    logger.info("%s: %s，文本值 %s", table, "重建表结构" if rebuild else "原地转换", text_counts or "无")
+    if dry_run:
+        return True
+
+    def cast(c):
+        # 只转换文本值，空串转成 NULL；已经是数值的原样保留 (经过文本会丢精度)
+        target = "INTEGER" if c in int_columns else "REAL"
+        return f'CASE WHEN typeof("{c}") = \'text\' THEN CAST(NULLIF(TRIM("{c}"), \'\') AS {target}) ELSE "{c}" END'
+
+    if rebuild:
+        present = [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+        keep = [c for c in columns if c in present]
+        old = f"{table}__repair"
+        conn.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+        init_table(conn, table)
+        names = ", ".join(f'"{c}"' for c in keep)
+        # 同一时间戳有多条时保留最后写入的一条
+        conn.execute(f'INSERT OR REPLACE INTO "{table}" ({names}) '
+                     f'SELECT {", ".join(cast(c) for c in keep)} FROM "{old}" ORDER BY rowid')
+        conn.execute(f'DROP TABLE "{old}"')
+    else:
+        for c in text_counts:
+            conn.execute(f'UPDATE "{table}" SET "{c}" = {cast(c)} WHERE typeof("{c}") = \'text\'')
+    conn.commit()
+    return True
+
+
+def repair_all(conn, dry_run=False):
+    repaired = 0
+    for table in kline_tables(conn):
+        if repair_table(conn, table, dry_run):
+            repaired += 1
+    return repaired
+
+
+if __name__ == "__main__":
+    InitLogging()
+
+    strExchange = "BINANCE"
+    if len(sys.argv) > 1 and sys.argv[1] == "HTX":
+        strExchange = "HTX"
+    g_ACD.setExchange(strExchange)
+
+    conn = sqlite3.connect(g_ACD.getDB())
+    n = repair_all(conn, dry_run="--dry-run" in sys.argv)
+    logger.info("共 %s 张表%s", n, "需要修复" if "--dry-run" in sys.argv else "已修复")
+    conn.close()
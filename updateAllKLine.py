@@ -1,43 +1,172 @@
-import sqlite3
-import requests
-import pandas as pd
-import time
+"""
+全量更新所有交易对的K线
+
+按流水线分段运行，段与段之间用有界队列连接 (队列满时上游阻塞)，网络、解析和写库并行:
+
+    交易对 -> plan_kline (只读连接查最后时间) -> 任务队列
+           -> FETCH_WORKERS 个线程 fetch_kline_task (请求 + 解析，限流由 ExchangeClient 负责) -> 结果队列
+           -> 调用线程单独写库，每 WRITE_BATCH 张表提交一次
+           -> on_symbol(symbol) 可选回调，一个交易对的所有周期写完后调用 (在写库线程里，可以直接用 conn)
+
+内存只与队列长度有关，和交易对数量无关。
+"""
 import sys
+import queue
+import sqlite3
+import logging
+import threading
+import contextvars
 
 from ConstDef import g_ACD
-from DatabaseUpdate import update_all_kline
-
-
-def update_all_symbols_kline(conn):
-    conn.row_factory = sqlite3.Row
-    cursorSymbols = conn.cursor()
-
-
-    onlineNum = 0
-    if g_ACD.getExchange == "HTX":
-        cursorSymbols.execute(f"SELECT symbol,state FROM {g_ACD.getTableSymbols()}")
-
-        
-        for row in iter(cursorSymbols.fetchone, None):                      
-            state = row["state"] 
-            print(symbol,state)
-            if state == "online":
-                symbol = row["symbol"]
-                onlineNum += 1
-                update_all_kline(symbol,conn)
-                time.sleep(1) 
-    else:
-        cursorSymbols.execute(f"SELECT symbol FROM {g_ACD.getTableSymbols()}")
-        symbols = [row[0] for row in cursorSymbols.fetchall()]         
-        for symbol in symbols:                           
-            print(f"{symbol}写表")
-            update_all_kline(symbol,conn)
-            onlineNum += 1
-            time.sleep(1)   
-                   
-        
-
-    print("有效交易对：",onlineNum)
+from DatabaseUpdate import init_table, plan_kline, fetch_kline_task, write_kline, update_all_kline
+from SymbolRegistry import refresh_symbols, active_symbols
+
+logger = logging.getLogger(__name__)
+
+# 并发拉取的线程数
+FETCH_WORKERS = 4
+# 待拉取任务 / 待写入结果队列的长度
+TASK_QUEUE = 32
+RESULT_QUEUE = 64
+# 写库线程每写多少张表提交一次
+WRITE_BATCH = 50
+
+_DONE = object()
+
+
+def database_path(conn):
+    """连接对应的数据库文件；内存库返回空字符串"""
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row else ""
+
+
+def iter_tasks(db_path, symbols):
+    """按交易对逐个生成各周期的拉取任务，用单独的连接读库，不占用写库连接"""
+    conn = sqlite3.connect(db_path)
+    try:
+        for symbol in symbols:
+            for period in g_ACD.getInterval():
+                yield plan_kline(conn, symbol, period)
+    finally:
+        conn.close()
+
+
+def _put(q, item, stop):
+    """队列满时阻塞，写库线程出错 (stop) 时放弃"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def update_symbols_pipeline(conn, symbols, workers=FETCH_WORKERS, on_symbol=None):
+    """
+    流水线更新一组交易对的所有周期，返回 (完成的交易对数, 写入的K线根数)
+    conn 只在调用线程里使用；内存库没法给其它线程开连接，退回逐个更新
+    """
+    db_path = database_path(conn)
+    if not db_path:
+        for symbol in symbols:
+            update_all_kline(symbol, conn)
+            if on_symbol:
+                on_symbol(symbol)
+        return len(symbols), None
+
+    periods = len(g_ACD.getInterval())
+    tasks = queue.Queue(maxsize=TASK_QUEUE)
+    results = queue.Queue(maxsize=RESULT_QUEUE)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for task in iter_tasks(db_path, symbols):
+                if not _put(tasks, task, stop):
+                    break
+        except Exception:
+            logger.exception("生成拉取任务失败")
+        finally:
+            for _ in range(workers):
+                tasks.put(_DONE)
+
+    def fetch():
+        while True:
+            task = tasks.get()
+            if task is _DONE:
+                results.put(_DONE)
+                return
+            if stop.is_set():
+                continue
+            try:
+                df = fetch_kline_task(task)
+            except Exception as e:
+                logger.warning("%s 拉取失败: %s", task.table, e)
+                df = None
+            results.put((task, df))
+
+    # 线程默认不继承 contextvars，复制当前上下文，g_ACD 的交易所跟调用方一致
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(produce,), name="kline-plan", daemon=True)]
+    threads += [threading.Thread(target=contextvars.copy_context().run, args=(fetch,), name=f"kline-fetch-{i}", daemon=True)
+                for i in range(workers)]
+    for t in threads:
+        t.start()
+
+    done_workers = 0
+    pending = 0
+    remaining = {}
+    finished = 0
+    written = 0
+    try:
+        while done_workers < workers:
+            item = results.get()
+            if item is _DONE:
+                done_workers += 1
+                continue
+            task, df = item
+            init_table(conn, task.table, commit=False)
+            written += write_kline(conn, task, df, commit=False)
+            pending += 1
+            if pending >= WRITE_BATCH or results.empty():
+                conn.commit()
+                pending = 0
+
+            left = remaining.get(task.symbol, periods) - 1
+            if left > 0:
+                remaining[task.symbol] = left
+                continue
+            remaining.pop(task.symbol, None)
+            finished += 1
+            if on_symbol:
+                conn.commit()
+                pending = 0
+                on_symbol(task.symbol)
+    except BaseException:
+        # 写库出错: 先通知上游停止、把队列排空让线程退出，再尽量提交已写入的部分
+        stop.set()
+        while done_workers < workers:
+            if results.get() is _DONE:
+                done_workers += 1
+        try:
+            conn.commit()
+        except sqlite3.Error:
+            logger.exception("写库出错后提交已写入的K线失败")
+        raise
+    finally:
+        for t in threads:
+            t.join()
+    conn.commit()
+    return finished, written
+
+
+def update_all_symbols_kline(conn, on_symbol=None):
+    # 注册表里 HTX 和币安的交易对都有，只取可交易的
+    symbols = [symbol for _, symbol in active_symbols(conn)]
+    finished, written = update_symbols_pipeline(conn, symbols, on_symbol=on_symbol)
+    print("有效交易对：", finished, "新增K线：", written)
+    return finished
+
 
 if __name__ == "__main__":
 
@@ -48,10 +177,13 @@ if __name__ == "__main__":
 
     g_ACD.setExchange(strExchange)
 
-    conn = sqlite3.connect(g_ACD.getDB())     
+    conn = sqlite3.connect(g_ACD.getDB())
+
+    # 交易对一小时内刷新过就不再请求，下架的交易对在这里清理
+    refresh_symbols(conn, min_interval=3600)
 
     print("遍历所有symbols....")
     symbols = update_all_symbols_kline(conn)
 
     conn.close()
-    # update_all_symbol()    
+    # update_all_symbol()
@@ -1,52 +1,14 @@
 import sqlite3
-import requests
-import pandas as pd
 import sys
 
 from ConstDef import g_ACD
-
-def ProcessData_ByHTX(data):
-    if data["status"] == "ok":
-        # symbols = [item["symbol"] for item in data["data"]]
-        symbolsdata = data["data"]
-        # print("拉取结果",symbolsdata)
-
-        df = pd.DataFrame(symbolsdata) 
-        df = df[["symbol", "symbol-partition", "state", "api-trading"]]
-        print("所有数据",df)        
-        return df        
-    else:
-        raise Exception(f"API error: {data}")
-    
-def ProcessData_ByBinance(data):
-    symbols = data.get("symbols", [])
-    df = pd.DataFrame(symbols)
-
-    # 只保留需要的字段
-    wanted = ["symbol", "status", "baseAsset", "quoteAsset"]
-    df = df[[c for c in wanted if c in df.columns]]
-
-    # 筛选：状态为 TRADING 且 quoteAsset = USDT
-    df = df[(df["status"] == "TRADING") & (df["quoteAsset"] == "USDT")]
-
-    return df.reset_index(drop=True)    
-
-
+from SymbolRegistry import refresh_symbols
 
 def get_all_symbols_from_net(conn):
-    url = g_ACD.getApiSymbols()
-    resp = requests.get(url)
-    data = resp.json()
-
-    if g_ACD.getExchange == "HTX":
-        df = ProcessData_ByHTX(data)
-    else:
-        # 除了HTX就是币安
-        df = ProcessData_ByBinance(data)
-
-    if not df.empty:                        
-        df.to_sql(g_ACD.getTableSymbols(), conn, if_exists="replace", index=True)    
-        print(f"已向数据库写入{len(df)}条数据")        
+    """刷新交易对注册表: 只写入新增、状态变化和下架，已有交易对的 "index" 保持不变"""
+    result = refresh_symbols(conn)
+    print(f"{g_ACD.getExchange()} 交易对: {result}")
+    return result
 
     
 if __name__ == "__main__":